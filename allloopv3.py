@@ -1,22 +1,39 @@
 import os
 import re
+import json
+import importlib.util
 import time
 import base64
+import difflib
+import hashlib
+import math
 import mimetypes
 import pathlib
+import posixpath
 import shutil
+from collections import OrderedDict
 from io import BytesIO
-from typing import List, Dict, Any, Tuple, Optional
+from typing import Callable, List, Dict, Any, Tuple, Optional
 
 from PIL import Image, UnidentifiedImageError
-from google import genai
+
+import change_regions
+from genai_backend import ClientPool, make_client, resolve_api_keys, resolve_backend
+from languages import check_prompts, fill_language_fields, language_profile, localize_prompt
+import output_index
+import page_sources
+import page_tiles
+import page_triage
+import page_watch
+import run_budget
+from run_metrics import RunMetrics
 
 # =========================================
 # Configuration
 # =========================================
 BASE_DIR = pathlib.Path(__file__).resolve().parent
 
-INPUT_DIR = str(BASE_DIR / "manga")        # Original manga images folder
+INPUT_DIR = str(BASE_DIR / "manga")        # Original manga images folder (or a .cbz/.zip/.tar archive, read in place)
 INIT_OUTPUT_DIR = str(BASE_DIR / "out1")   # Initial translation output folder
 SCRIPTS_DIR = str(BASE_DIR / "scripts")    # Folder for per-page, per-iteration translation scripts
 OUTPUT_BASE_NAME = "out"                   # "out", "out2", ...
@@ -26,8 +43,132 @@ POLL_INTERVAL_SEC = 30                     # Poll interval for batch jobs (sec)
 MAX_STAGE_RETRIES = 10                     # Max retries per stage (Stage 1 or each iteration)
 MAX_EVAL_RETRIES = 5                       # Max retries for evaluation batches
 
+SCRIPT_MODEL = "models/gemini-3-pro-preview"
+IMAGE_MODEL = "models/gemini-3-pro-image-preview"
+EVAL_MODEL = "models/gemini-3-pro-preview"
+
+# Output resolution (image_config.image_size)
+IMAGE_RESOLUTION = "1K"                    # choose from "1K", "2K", "4K"
+PROGRESSIVE_RESOLUTION = False             # True = refine at DRAFT_IMAGE_RESOLUTION, then re-render passing pages once at IMAGE_RESOLUTION
+DRAFT_IMAGE_RESOLUTION = "1K"              # Resolution of out1..outN while PROGRESSIVE_RESOLUTION is on
+FINAL_OUTPUT_DIR_NAME = "out_final"        # Final high-resolution renders (next to out1.. in each language tree)
+
+# Target languages: several entries = one run, one output tree per language (BASE_DIR/<code>/out1.., /scripts)
+TARGET_LANGS = ["Korean"]                  # e.g. ["Korean", "English", "Chinese"]
+
+# Library mode (optional): many series/volumes in one run, one global page queue
+LIBRARY_DIR = ""                           # Root holding one folder or archive of pages per volume, any depth (e.g. "Series A/Vol 03.cbz"); "" = just INPUT_DIR
+LIBRARY_OUTPUT_DIR = str(BASE_DIR / "library_out")  # Per-volume output trees: <LIBRARY_OUTPUT_DIR>/<volume>/out1.., scripts, out_final
+LIBRARY_PRIORITY = "reading"               # "reading" = volume by volume in order; "latest" = newest volume of every series first; "interleave" = opening pages of every volume first
+LIBRARY_QUEUE_NAME = "library_queue.sqlite"  # Queue in LIBRARY_OUTPUT_DIR when WORK_QUEUE is not set
+
+# How originals are sent to the model
+SOURCE_UPLOAD_MODE = "inline"              # "inline" = base64 in every request; "files" = upload once via the Files API and reuse
+SOURCE_CACHE_PAGES = 32                    # Encoded originals kept in memory (shared by every language/stage of a page)
+SOURCE_UPLOAD_TTL_SEC = 46 * 3600          # Reuse Files API uploads for this long (the API keeps files for 48h)
+
+# Source analysis: extract panels / bubbles / source text once per page and reuse it in every script prompt
+SOURCE_ANALYSIS = False                    # True = run the analysis stage before Stage 1
+SOURCE_ANALYSIS_DIR = str(BASE_DIR / "source_analysis")  # Cached {base}.json files (language-neutral)
+ANALYSIS_MODEL = "models/gemini-3-pro-preview"
+MAX_ANALYSIS_RETRIES = 3                   # Max retries for analysis batches
+SCRIPT_IMAGE_WITH_ANALYSIS = False         # Also attach the page image to script requests that have an analysis
+
+# Page triage before Stage 1: blank / text-free pages are copied through, duplicate scans reuse their twin's result
+PAGE_TRIAGE = True                         # False = every page goes through the loop
+TRIAGE_BLANK_STDDEV = 4.0                  # Grayscale std-dev below this = blank page
+TRIAGE_DUPLICATE_DISTANCE = 0              # Max dHash Hamming distance (of 64 bits) for a duplicate candidate; >0 also tries rescans
+                                           # (every candidate must still match pixel for pixel, see page_triage.pixels_match)
+TRIAGE_CLASSIFY = False                    # True = also ask TRIAGE_MODEL whether each remaining page has text (one small batch)
+TRIAGE_MODEL = "models/gemini-2.5-flash"
+TRIAGE_THUMB_PX = 768                      # Long side of the thumbnails sent for classification
+
+# Tiling: double-page spreads and very large scans go through the loop as overlapping tiles
+TILING = False                             # True = split spreads / large pages into tiles with their own script, image and eval
+TILE_MAX_PX = 3072                         # Pages (or spread halves) with a longer side than this are split further
+TILE_SPREAD_ASPECT = 1.2                   # Width/height at or above this = double-page spread, cut at the gutter (0 = never)
+TILE_OVERLAP = 0.04                        # Overlap of neighbouring tiles, as a share of the page's short side (blended when stitching)
+TILES_DIR = str(BASE_DIR / "_tiles")       # Cut tiles of the originals (language-neutral, reused while the source is unchanged)
+
+# Context caching: register the large static prompt prefixes (guides/specs) once per run and reference them
+PROMPT_CACHE = True                        # False = always send the full prompt text inline
+PROMPT_CACHE_MIN_TOKENS = {                # Explicit-cache minimum per model (name prefix); shorter prefixes are sent inline
+    "gemini-3-pro": 4096,                  # (the API rejects caches.create below it)
+    "gemini-2.5-pro": 4096,
+    "gemini-2.5-flash": 1024,
+}
+PROMPT_CACHE_DEFAULT_MIN_TOKENS = 4096     # Models missing from the table
+PROMPT_CACHE_TTL_SEC = 48 * 3600           # Lifetime of a cached prefix (must outlast queued batch jobs)
+PROMPT_CACHE_MIN_REMAINING_SEC = 25 * 3600 # Re-register a prefix when less than this is left before it expires
+
+# Feedback history: evaluator reasons carried into later script/image prompts (compacted per page)
+FEEDBACK_TOKEN_BUDGET = 400                # Approx. tokens of feedback per prompt; oldest reasons are dropped/summarised first
+FEEDBACK_RECENT_ROUNDS = 2                 # Newest distinct reasons always kept verbatim
+FEEDBACK_SUMMARY = False                   # True = consolidate older rounds into one instruction block with the model
+FEEDBACK_SUMMARY_MODEL = "models/gemini-3-pro-preview"
+
+# Speculative fan-out: several image variants per failing page in one batch, all evaluated together
+CANDIDATES_PER_FAILING_PAGE = 1            # >1: refinement rounds render N variants (different seeds) per failing page
+CANDIDATES_DIR_NAME = "_candidates"        # Extra variants live in outN/_candidates/{base}__v{n}.jpg
+
+# Per-page convergence: stop regenerating pages that keep failing the same way
+STALL_ROUNDS = 3                           # X this many evaluations in a row with near-identical reasons -> "stalled" (0 = off)
+STALL_SIMILARITY = 0.8                     # Reason similarity (0..1) counted as "the same failure"
+MAX_PAGE_ROUNDS = 0                        # Per-page cap on regeneration rounds (0 = only MAX_ITERATIONS)
+REINVEST_STALLED_CAPACITY = True           # Give the renders freed by stalled pages to other failing pages as extra variants
+MAX_CANDIDATES_PER_PAGE = 4                # Upper bound on variants per page per round (with reinvested capacity)
+PAGE_REPORT_NAME = "page_report.tsv"       # Per-page cost vs. outcome report in BASE_DIR ("" = off)
+
+# Region compositing: keep the original artwork outside text regions (needs NumPy)
+REGION_COMPOSITE = False                   # True = paste only the changes inside bubbles/text boxes onto the original before evaluation
+COMPOSITE_DIFF_THRESHOLD = 32              # Gray-level difference (0-255) that counts as a changed pixel
+COMPOSITE_MIN_OVERLAP = 0.5                # A changed blob is kept when at least this share of it lies in a text region
+
+# Multi-page script requests: consecutive pages share one request (and see each other for names and tone)
+SCRIPT_PAGES_PER_REQUEST = 1               # >1: pages without feedback are scripted K at a time; a failed split falls back to single pages
+
+# Script revision in refinement rounds
+SCRIPT_REVISION_MODE = "patch"             # "patch" = previous script + reasons -> JSON edits for the affected bubbles; "full" = rewrite
+
+# Focused re-evaluation: in refinement rounds, evaluate only what changed since the last verdict
+FOCUSED_EVAL = False                       # True = send crops of the changed regions (original + new) with the previous verdict instead of both full pages
+FOCUSED_EVAL_MAX_AREA = 0.4                # More of the page changed than this share -> full evaluation
+FOCUSED_EVAL_MAX_REGIONS = 4               # More separate changed regions than this -> full evaluation
+FOCUSED_EVAL_CROP_PX = 1024                # Long side cap of each crop
+
+# Budget (prices per model and expected output per stage live in run_budget.py)
+BUDGET_USD = 0.0                           # Hard cap on the spend recorded for this run folder (0 = none); stops cleanly before a batch would cross it
+BUDGET_SOFT_USD = 0.0                      # Past this, refinement rounds only regenerate the pages with the best expected gain (0 = off)
+BUDGET_SOFT_PAGE_FRACTION = 0.5            # Share of failing pages regenerated per round past the soft cap
+DRY_RUN = False                            # True = print the estimated cost of this run and exit without submitting or writing anything
+DRY_RUN_PASS_RATE = 0.5                    # Per-round pass rate assumed when no earlier eval logs exist
+
+# Shared work queue (optional): several workers / machines on one library
+WORK_QUEUE = ""                            # Path of a SQLite queue on a filesystem every worker mounts ("" = this process owns every page)
+WORK_QUEUE_CLAIM = 50                      # Pages leased per shard (one shard runs the full loop, then the worker claims the next)
+WORK_QUEUE_LEASE_SEC = 1800                # A dead worker's pages are handed out again after this long without a heartbeat
+WORK_QUEUE_HEARTBEAT_SEC = 60              # Lease renewal interval (well below WORK_QUEUE_LEASE_SEC)
+WORK_QUEUE_MAX_ATTEMPTS = 3                # Claims per page before it is marked failed
+WORKER_ID = ""                             # "" = hostname:pid
+
+# Watch mode (optional): keep running and translate pages as they are dropped into INPUT_DIR
+WATCH_INPUT = False                        # True = after the first pass, wait for new/changed pages instead of exiting (Ctrl+C stops)
+WATCH_DEBOUNCE_SEC = 30                    # A drop is picked up once the folder has been quiet this long
+WATCH_POLL_SEC = 10                        # Rescan interval when inotify is unavailable
+WATCH_STATE_NAME = "watch_state.tsv"       # Inputs already processed (BASE_DIR); pages changed since then are redone
+SUPERSEDED_DIR_NAME = "_superseded"        # Old outputs of changed pages are moved to BASE_DIR/_superseded/<time>/
+
+# Monitoring (optional): Prometheus-style metrics for long runs
+METRICS_PORT = 0                           # >0: serve http://<host>:PORT/metrics from this process (0 = off)
+METRICS_TEXTFILE = ""                      # Path for node_exporter textfile collector output ("" = off)
+
 # API Key configuration: set API_KEY here or via environment variable
 API_KEY = ""  # (Leave blank to use GEMINI_API_KEY or GOOGLE_API_KEY environment var)
+API_KEYS: List[str] = []  # Several keys (one per project) spread batches over their quotas; or GEMINI_API_KEYS="key1,key2"
+POOL_BATCH_CREATES_PER_MIN = 0             # Per-key limit on batch creations (0 = only back off after a 429)
+POOL_ONLINE_CALLS_PER_MIN = 0              # Per-key limit on uploads, cache creations and online calls (0 = only back off after a 429)
+POOL_COOLDOWN_SEC = 60                     # First cool-down of a throttled key (doubles while it keeps answering 429)
+GENAI_BACKEND = ""  # "" = MANGA_GENAI_BACKEND env or "genai"; "fake" = offline deterministic backend (no key needed)
 
 # =========================================
 # Shared Base Spec (Image behavior + general rules)
@@ -124,7 +265,7 @@ TRANSLATION_GUIDE = r"""
 Translation guideline scope:
 
 The guidelines should cover, whenever applicable:
-1) Which Japanese or English expressions should be translated into which style of Korean (for example: honorific level, casual tone, emotional nuance).
+1) Which {source_langs} expressions should be translated into which style of Korean (for example: honorific level, casual tone, emotional nuance).
 2) How to adjust speech bubbles or text boxes (for example: extend a bubble horizontally so that horizontal Korean fits cleanly).
 3) How to maintain the correct reading order between bubbles and panels.
 4) How to improve character voice, politeness level, or consistency across the page.
@@ -151,25 +292,25 @@ Sound effects and onomatopoeia:
  - "どぶーん" when the mood or a character sinks can become "털썩" or "쿵".
  - "うふーん" in a flirty or sensual context can become "흐응~", "후우응~" or "우후훗".
 
-When you propose a specific Korean translation, always write the Korean phrase in Hangul (Korean script), not in English and not in romanization.
+When you propose a specific Korean translation, always write the Korean phrase {script_rule}.
 
 Example:
 - Write: Translate "なんか妖精って俗っぽいね" into the Korean phrase "요정이 좀 속물 같네".
 - Do NOT write: Translate "なんか妖精って俗っぽいね" into "It sounds vulgar for a fairy" or "yojeong-i jom sokmul gatne".
-Use Hangul exactly as the Korean phrase should appear in the final comic.
+Write it exactly as the Korean phrase should appear in the final comic.
 
 Write the guidelines as if you are directly instructing the image translation system.
 - Use imperative sentences such as "Translate ...", "Place ...", "Do not leave ...".
 - Do NOT mention tokens, prompts, models, or system internals.
-- You may quote source text snippets (Japanese/English) if needed for clarity.
+- You may quote source text snippets ({source_langs}) if needed for clarity.
 
 Additional rules for your output (script):
 - For every bubble, caption, or sound effect, explicitly include a font and layout hint line that contains:
   - Approximate font size in pixels (for example, "about 8–10 px").
-  - a description like “about 5–6 Hangul characters in a row roughly match this bubble’s horizontal Width.
+  - a description like “about {chars_per_width} in a row roughly match this bubble’s horizontal Width.
   - An explicit line-by-line split of the Korean text, matching that character count.
   Example:
-    Font/Layout Hint: about 8–10 px. Use a size where about 5–6 Hangul characters in a row match the bubble's horizontal width.
+    Font/Layout Hint: about 8–10 px. Use a size where about {chars_per_width} in a row match the bubble's horizontal width.
 Write three short horizontal lines stacked from top to bottom:
       Line 1: "안 돼!!!"
       Line 2: "지지"
@@ -187,11 +328,11 @@ You are a manga translation guideline writer.
 
 Your job:
 - Look at the original comic page.
-- Identify every panel and every speech bubble, narration box, caption, or sound effect that contains Japanese or English.
+- Identify every panel and every speech bubble, narration box, caption, or sound effect that contains {{source_langs}}.
 - For each one, in correct manga reading order, describe:
   - where it is (panel number and a short natural-language location description),
   - what the source text is (copy or paraphrase if OCR is imperfect),
-  - what the final Korean text should be (in Hangul),
+  - what the final Korean text should be (in {{script}}),
   - and detailed layout and font hints for the image editing step.
 
 Strong layout rules (must follow when you write hints):
@@ -206,7 +347,7 @@ Strong layout rules (must follow when you write hints):
   - Assume the font can be shrunk down to about 8–10 px if necessary to keep all lines horizontal.
 - For every element, include a dedicated "Font/Layout Hint" line that contains:
     - approximate font size in pixels (for example, "about 8–10 px"),
-    - a description like “about 5–6 Hangul characters in a row roughly match this bubble’s horizontal width,
+    - a description like “about {{chars_per_width}} in a row roughly match this bubble’s horizontal width,
     - and an explicit line-by-line split of the Korean text.
 
 Example of a good guideline block for one bubble:
@@ -219,7 +360,7 @@ Example of a good guideline block for one bubble:
       NEVER suggest vertical writing or vertical columns.
       If the bubble is tall and narrow, reduce font size aggressively (down to ~8–10 px).
       Describe the size using a consistent standard:
-        "Use a size where about 5–6 Hangul characters placed horizontally match the bubble’s horizontal width."
+        "Use a size where about {{chars_per_width}} placed horizontally match the bubble’s horizontal width."
 
       Break the Korean into multiple horizontal lines.
       Always specify the exact lines:
@@ -232,7 +373,7 @@ When you write layout hints:
   - Always treat Korean as horizontal left-to-right text.
   - Specify how many lines and exactly which words go on each line.
   - Describe font size in this consistent way:
-        "A size where approximately N Hangul characters placed horizontally match the bubble’s horizontal width."
+        "A size where approximately N {{char_unit}} placed horizontally match the bubble’s horizontal width."
   - NEVER allow any kind of vertical writing or stacked syllables.
 
 Special exception — margin footnote captions:
@@ -254,8 +395,100 @@ Translation style guidelines:
 - Choose polite or casual speech that matches the relationship between characters.
 - Maintain consistent translations for names and key terms throughout the page and series.
 
-Now, based on the single page image you receive, output only textual guidelines as described above.
-Do not try to edit the image yourself. Do not output any images, JSON, or markdown.
+Do not try to edit the image yourself.
+"""
+
+# Variant used when a cached source analysis is available (see SOURCE_ANALYSIS)
+SCRIPT_JOB_FROM_IMAGE = """Your job:
+- Look at the original comic page.
+- Identify every panel and every speech bubble, narration box, caption, or sound effect that contains {source_langs}.
+- For each one, in correct manga reading order, describe:"""
+
+SCRIPT_JOB_FROM_ANALYSIS = """Your job:
+- Read the SOURCE ANALYSIS at the end of this prompt. It already lists every panel and every speech bubble, narration box, caption, or sound effect that contains {source_langs}, in manga reading order, with its box ([ymin, xmin, ymax, xmax] on a 0-1000 scale of the page) and its source text.
+- Use that list as the authoritative set of elements and their order. Do not re-detect the text from scratch. If a page image is attached, use it only as a visual reference for bubble shapes.
+- For each element, in the given order, describe:"""
+
+
+def script_template_from_analysis(template: str) -> str:
+    return template.replace(SCRIPT_JOB_FROM_IMAGE, SCRIPT_JOB_FROM_ANALYSIS)
+
+
+# =========================================
+# Source analysis prompt (language-neutral, once per page)
+# =========================================
+SOURCE_ANALYSIS_PROMPT = r"""
+You are a manga page analyst. You do not translate anything.
+
+Look at the single comic page image and list every panel and every element that contains text:
+speech bubbles, thought bubbles, narration boxes, captions, margin footnotes (often starting with "※"), and sound effects.
+
+Return JSON only, with exactly this structure:
+{
+  "panels": [
+    {"panel": 1, "box": [ymin, xmin, ymax, xmax]}
+  ],
+  "elements": [
+    {
+      "id": "P1-B1",
+      "panel": 1,
+      "type": "speech | thought | narration | caption | footnote | sfx",
+      "box": [ymin, xmin, ymax, xmax],
+      "orientation": "vertical | horizontal",
+      "source_text": "exact original text (best-effort OCR)",
+      "speaker": "character name or short description, if identifiable, else empty",
+      "notes": "anything useful for translation or layout (tone, emphasis, bubble shape), else empty"
+    }
+  ]
+}
+
+Rules:
+- Coordinates are integers on a 0-1000 scale relative to the page height (y) and width (x).
+- Number panels in traditional manga order (right to left, top to bottom) and list elements in reading order.
+- Element ids are "P<panel>-B<n>" for bubbles/boxes and "P<panel>-S<n>" for sound effects.
+- Include Japanese and English text; skip text that is part of the artwork only if it is unreadable.
+- If the page has no text, return {"panels": [...], "elements": []}.
+- Do not output markdown, comments, or anything except the JSON object.
+"""
+
+# =========================================
+# Script output sections
+# =========================================
+# The script prompt above only holds format-neutral rules. Every script request ends with exactly
+# one of these sections, which alone says what to return: the plain-text script (first drafts),
+# a JSON patch (refinement rounds, SCRIPT_REVISION_MODE = "patch") or one JSON object for several
+# pages (SCRIPT_PAGES_PER_REQUEST).
+SCRIPT_TEXT_OUTPUT = r"""
+=== OUTPUT ===
+Now write the guidelines described above for the page you receive.
+Output only the textual guidelines as plain text. Do not output any images, JSON, or markdown.
+"""
+
+SCRIPT_PATCH_INSTRUCTIONS = r"""
+=== REVISION MODE ===
+Do not write the guidelines again. The previous translation script for this page is given below; it failed review for the reasons listed above.
+Return only a JSON object with the minimal edits that fix those reasons:
+{"edits": [{"find": "exact text copied from the previous script", "replace": "corrected text"}]}
+
+Rules:
+- "find" must be copied character-for-character from the previous script and must occur exactly once in it. Include enough of the entry (for example its location line) to make it unique.
+- Change only the bubbles, captions, or sound effects the reasons refer to. Every other line stays as it is.
+- To add a missing element, use the last line of the entry it follows as "find", and repeat that line at the start of "replace" followed by the new entry.
+- To remove an element, use an empty "replace".
+- The corrected text and layout hints must follow every rule given above.
+- If nothing needs to change, return {"edits": []}.
+- Output the JSON object only.
+"""
+
+SCRIPT_MULTI_PAGE_INSTRUCTIONS = r"""
+=== MULTI-PAGE MODE ===
+You receive {count} consecutive pages of the same chapter in reading order, each between <PAGE_n> and </PAGE_n>.
+Write one complete translation script per page, following every rule above for each page on its own.
+Use the neighbouring pages only as context: keep character names, terms and each character's voice consistent
+across them, and never move text from one page to another.
+Return only a JSON object with exactly one entry per page, in page order:
+{"pages": [{"page": 1, "script": "complete script of page 1"}, {"page": 2, "script": "complete script of page 2"}]}
+Output the JSON object only.
 """
 
 # =========================================
@@ -268,8 +501,8 @@ You will receive:
 1) The original comic page image.
 2) A textual translation script that describes, for each panel and bubble:
    - the location,
-   - the source text (Japanese/English),
-   - the exact Korean text that should appear (in Hangul),
+   - the source text ({{source_langs}}),
+   - the exact Korean text that should appear (in {{script}}),
    - and layout / font hints.
 
 Your task:
@@ -291,7 +524,7 @@ Execution rules:
 - If the script says to replace a Japanese phrase with a specific Korean phrase, insert that Korean phrase exactly as written.
 - If the script gives layout guidance (for example, "use small font with three short horizontal lines"), adjust bubbles and text boxes accordingly while keeping their general positions.
 - Do not invent new dialogue, do not remove required text, and do not add new artwork.
-- If there is any region with Japanese or English text that is not mentioned in the script, still translate it into natural Korean consistent with the style rules above.
+- If there is any region with {{source_langs}} text that is not mentioned in the script, still translate it into natural Korean consistent with the style rules above.
 
 Output rules:
 - Return only the final edited image.
@@ -320,14 +553,14 @@ Your task:
 
 You will receive two images with tags.
 
-The image between <ORIGINAL_IMAGE> and </ORIGINAL_IMAGE> is the original comic page containing Japanese or English text.
+The image between <ORIGINAL_IMAGE> and </ORIGINAL_IMAGE> is the original comic page containing {{source_langs}} text.
 The image between <TRANSLATED_IMAGE> and </TRANSLATED_IMAGE> is the translated page, which is supposed to contain only Korean text and be the edited result.
 
 Carefully read the text in the original image and in the translated image.
 Check whether the translated image fully complies with all applicable rules in the specification, including but not limited to:
 
-- All readable Japanese or English text is translated into Korean.
-- No untranslated Japanese or English remains, unless the specification explicitly allows it.
+- All readable {{source_langs}} text is translated into Korean.
+- No untranslated {{source_langs}} remains, unless the specification explicitly allows it.
 - Every line of Korean text is written horizontally from left to right, except for the narrow margin-footnote case described in the specification (long thin captions between panels), where horizontal Korean may be stacked from top to bottom or rotated as a block.
 - Each text stays in its original speech bubble or text area (position may stretch horizontally but not move to a different panel).
 - The overall panel layout is preserved.
@@ -338,7 +571,7 @@ Check whether the translated image fully complies with all applicable rules in t
 Decision rule:
 
 - Return "O" only if the translated image clearly follows all the rules and you see no serious or doubtful issue.
-- Return "X" if there is any violation, any missing translation, remaining Japanese or English text, wrong placement, or anything suspicious (including any sign of true vertical Korean).
+- Return "X" if there is any violation, any missing translation, remaining {{source_langs}} text, wrong placement, or anything suspicious (including any sign of true vertical Korean).
 - Do NOT mark as an error the rare margin footnote captions between panels that follow the exception rule (horizontal Korean stacked or rotated inside a tall rectangle without per-syllable vertical stacking).
 
 
@@ -361,6 +594,27 @@ Additional rules:
 - You MUST output at least 2 lines.
 """
 
+FOCUSED_EVAL_PROMPT = r"""
+Focused re-evaluation.
+
+This translated page was evaluated before and judged {previous_verdict} with this feedback:
+<PREVIOUS_FEEDBACK>
+{previous_reason}
+</PREVIOUS_FEEDBACK>
+
+The page has been regenerated since then. Only the regions below changed; everything outside them is
+identical to the version that received the feedback above. Instead of the two full pages, you receive
+for each changed region the crop of the original page (<ORIGINAL_CROP_n>) and the same crop of the
+new translated page (<TRANSLATED_CROP_n>), with its position on the page.
+
+Judge the whole page:
+- Apply the specification and the decision rule above to everything visible in the crops.
+- Outside the crops, rely on the previous feedback: a problem it names outside these regions still stands.
+- Return "O" only if every problem in the previous feedback is fixed and the crops show no new issue.
+
+Use the output format above and refer to problems by their position on the page.
+"""
+
 # =========================================
 # Utility Functions (file operations, parsing)
 # =========================================
@@ -372,7 +626,10 @@ def natural_key(s: str):
 
 
 def list_images(folder: str) -> List[str]:
+    """Page names in a folder, or member names when `folder` is a CBZ/ZIP/tar archive."""
     exts = {".png", ".jpg", ".jpeg", ".webp"}
+    if page_sources.is_archive(folder):
+        return sorted(page_sources.list_pages(folder), key=natural_key)
     try:
         files = [f for f in os.listdir(folder) if pathlib.Path(f).suffix.lower() in exts]
     except FileNotFoundError:
@@ -389,38 +646,229 @@ def normalized_base_from_filename(filename: str) -> str:
     return strip_trailing_paren_suffix(stem)
 
 
-def script_path_for(base: str, iteration_index: int) -> str:
+def script_path_for(base: str, iteration_index: int, scripts_dir: Optional[str] = None) -> str:
     """
     iteration_index:
       0  -> initial translation (out1)
       1+ -> refinement iterations (out2, out3, ...)
     """
-    return os.path.join(SCRIPTS_DIR, f"{base}_iter{iteration_index}.txt")
+    return os.path.join(scripts_dir or SCRIPTS_DIR, f"{base}_iter{iteration_index}.txt")
 
 
 def image_part_dict(path: str) -> Dict[str, Any]:
     mt = mimetypes.guess_type(path)[0] or "image/png"
-    with open(path, "rb") as f:
-        raw = f.read()
+    raw = page_sources.read_bytes(path)
     b64 = base64.b64encode(raw).decode("ascii")
     return {"inline_data": {"mime_type": mt, "data": b64}}
 
 
-def build_image_inline_request(image_path: str, prompt_text: str) -> Dict[str, Any]:
+# Originals are encoded (or uploaded) once and shared by every request that needs them.
+_SOURCE_PARTS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_SOURCE_UPLOADS: Dict[str, Dict[str, Any]] = {}
+_UPLOAD_CLIENT = None
+
+
+def source_uploads_log_path() -> str:
+    return os.path.join(BASE_DIR, "source_uploads.tsv")
+
+
+def set_upload_client(client):
+    """Register the client used for Files API uploads and load earlier uploads of this run folder."""
+    global _UPLOAD_CLIENT
+    _UPLOAD_CLIENT = client
+    if SOURCE_UPLOAD_MODE != "files" or isinstance(client, ClientPool):
+        return  # a pool cannot tell which project owns an earlier upload, so it uploads again
+    log_path = source_uploads_log_path()
+    if not os.path.isfile(log_path):
+        return
+    try:
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 4:
+                    continue
+                cache_key, uri, mime_type, uploaded_at = parts
+                _SOURCE_UPLOADS[cache_key] = {"uri": uri, "mime_type": mime_type, "uploaded_at": float(uploaded_at)}
+    except Exception as e:
+        print(f"[WARN] Failed to load source upload log {log_path}: {e}")
+
+
+def upload_source(path: str, cache_key: str) -> Dict[str, Any]:
+    rec = _SOURCE_UPLOADS.get(cache_key)
+    if rec and time.time() - rec["uploaded_at"] < SOURCE_UPLOAD_TTL_SEC:
+        return {"file_data": {"file_uri": rec["uri"], "mime_type": rec["mime_type"]}}
+    mt = mimetypes.guess_type(path)[0] or "image/png"
+    try:
+        uploaded = _UPLOAD_CLIENT.files.upload(file=page_sources.open_page(path), config={"mime_type": mt})
+    except Exception as e:
+        print(f"[WARN] Upload failed for {path}, sending it inline instead: {e}")
+        return image_part_dict(path)
+    rec = {"uri": uploaded.uri, "mime_type": uploaded.mime_type or mt, "uploaded_at": time.time()}
+    _SOURCE_UPLOADS[cache_key] = rec
+    size = page_sources.source_stat(path)[0]
+    METRICS.inc("upload_bytes_total", size, "Request payload bytes submitted", stage="files", kind="image")
+    try:
+        with open(source_uploads_log_path(), "a", encoding="utf-8") as f:
+            f.write(f"{cache_key}\t{rec['uri']}\t{rec['mime_type']}\t{rec['uploaded_at']}\n")
+    except Exception as e:
+        print(f"[WARN] Failed to record upload of {path}: {e}")
+    return {"file_data": {"file_uri": rec["uri"], "mime_type": rec["mime_type"]}}
+
+
+def source_part(path: str) -> Dict[str, Any]:
+    """Image part for an original page, shared across languages and stages (see SOURCE_UPLOAD_MODE)."""
+    size, mtime_ns = page_sources.source_stat(path)
+    cache_key = f"{os.path.abspath(path)}|{size}|{mtime_ns}"
+    part = _SOURCE_PARTS.get(cache_key)
+    if part is not None:
+        _SOURCE_PARTS.move_to_end(cache_key)
+        METRICS.inc("source_cache_hits_total", 1, "Original page encodings reused from memory")
+        return part
+    if SOURCE_UPLOAD_MODE == "files" and _UPLOAD_CLIENT is not None:
+        part = upload_source(path, cache_key)
+    else:
+        part = image_part_dict(path)
+    _SOURCE_PARTS[cache_key] = part
+    while len(_SOURCE_PARTS) > max(1, SOURCE_CACHE_PAGES):
+        _SOURCE_PARTS.popitem(last=False)
+    return part
+
+
+def build_image_inline_request(
+    image_path: str,
+    prompt_text: str,
+    cached_content: Optional[str] = None,
+    image_size: Optional[str] = None,
+) -> Dict[str, Any]:
+    parts: List[Dict[str, Any]] = [{"text": prompt_text}] if prompt_text else []
+    parts.append(source_part(image_path))
+    config: Dict[str, Any] = {"response_modalities": ["IMAGE"]}
+    if image_size:
+        config["image_config"] = {"image_size": image_size}
+    if cached_content:
+        config["cached_content"] = cached_content
     return {
         "contents": [
             {
                 "role": "user",
-                "parts": [
-                    {"text": prompt_text},
-                    image_part_dict(image_path),
-                ],
+                "parts": parts,
             }
         ],
-        "config": {"response_modalities": ["IMAGE"]},
+        "config": config,
     }
 
 
+# =========================================
+# Context caching of static prompt prefixes
+# =========================================
+# The script/image/eval prompts start with several thousand tokens of fixed text
+# (BASE_SPEC, TRANSLATION_GUIDE). Each distinct prefix is registered once per model
+# as cached content; requests then reference it and send only their page-specific tail.
+_PROMPT_CACHES: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_PROMPT_CACHE_TOKENS: Dict[str, int] = {}  # cache name -> prefix token count
+
+
+def prefix_cacheable(model: str, prefix: str) -> bool:
+    """True if `prefix` reaches the model's explicit-cache minimum (PROMPT_CACHE_MIN_TOKENS)."""
+    if not PROMPT_CACHE:
+        return False
+    name = model.split("/")[-1]
+    minimum = PROMPT_CACHE_DEFAULT_MIN_TOKENS
+    for model_prefix in sorted(PROMPT_CACHE_MIN_TOKENS, key=len, reverse=True):
+        if name.startswith(model_prefix):
+            minimum = PROMPT_CACHE_MIN_TOKENS[model_prefix]
+            break
+    return estimate_tokens(prefix) >= minimum
+
+
+def cache_static_prefix(client, model: str, prefix: str, prompt_text: str) -> Tuple[str, Optional[str]]:
+    """
+    Split `prompt_text` (which starts with `prefix`) into (text to send, cached content name).
+    Falls back to (prompt_text, None) when caching is disabled, the prefix is below the model's
+    cache minimum, or caching is unavailable.
+    """
+    if not prompt_text.startswith(prefix) or not prefix_cacheable(model, prefix):
+        return prompt_text, None
+    key = (model, hashlib.sha1(prefix.encode("utf-8")).hexdigest())
+    rec = _PROMPT_CACHES.get(key)
+    now = time.time()
+    if rec is None or (rec["name"] and rec["expires_at"] - now < PROMPT_CACHE_MIN_REMAINING_SEC):
+        if rec is not None:
+            # Queued batches may still reference the old cache, so it is left to expire
+            charge_cache_storage(rec, rec["expires_at"] - rec["created_at"])
+        try:
+            cache = client.caches.create(
+                model=model,
+                config={
+                    "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+                    "ttl": f"{int(PROMPT_CACHE_TTL_SEC)}s",
+                    "display_name": f"manga-prefix-{key[1][:12]}",
+                },
+            )
+            usage = getattr(cache, "usage_metadata", None)
+            tokens = int(getattr(usage, "total_token_count", 0) or 0) or len(prefix) // 4
+            rec = {
+                "name": cache.name,
+                "client": client,
+                "model": model,
+                "tokens": tokens,
+                "created_at": now,
+                "expires_at": now + PROMPT_CACHE_TTL_SEC,
+            }
+            _PROMPT_CACHE_TOKENS[cache.name] = tokens
+            METRICS.inc("prompt_caches_created_total", 1, "Static prompt prefixes registered as cached content")
+            print(f"[INFO] Cached static prompt prefix for {model}: {cache.name} (~{tokens} tokens)")
+        except Exception as e:
+            print(f"[WARN] Context caching unavailable for {model}, sending prompt prefixes inline: {e}")
+            rec = {"name": None, "client": client, "expires_at": 0.0}
+        _PROMPT_CACHES[key] = rec
+    if not rec["name"]:
+        return prompt_text, None
+    return prompt_text[len(prefix) :].lstrip("\n"), rec["name"]
+
+
+def charge_cache_storage(rec: Dict[str, Any], seconds: float):
+    """Record the storage of one cached prefix, kept for `seconds`, in the cost ledger."""
+    usd = run_budget.cache_storage_cost(rec["model"], rec["tokens"], seconds / 3600)
+    METRICS.inc("cost_usd_total", usd, "Model spend recorded in the cost ledger (USD)", stage="cache")
+    if BUDGET is not None:
+        BUDGET.charge("cache", rec["model"], 0, usd, usd, "storage")
+
+
+def release_prompt_caches():
+    """
+    Delete this run's cached prefixes (they would otherwise be billed until their TTL) and charge their
+    storage, once per copy: a ClientPool replicates a cache into every key's project that uses it.
+    """
+    for rec in _PROMPT_CACHES.values():
+        if not rec["name"]:
+            continue
+        ttl = rec["expires_at"] - rec["created_at"]
+        created = [rec["created_at"]]
+        if isinstance(rec["client"], ClientPool):
+            created += rec["client"].caches.replica_times(rec["name"])
+        stored_until = time.time()
+        try:
+            rec["client"].caches.delete(name=rec["name"])
+        except Exception as e:
+            print(f"[WARN] Failed to delete cached content {rec['name']}: {e}")
+            stored_until = float("inf")  # billed until each copy expires
+        for start in created:
+            charge_cache_storage(rec, min(stored_until, start + ttl) - start)
+    _PROMPT_CACHES.clear()
+
+
+def report_prompt_cache_savings():
+    requests = sum(METRICS.get("prompt_cache_requests_total", stage=s) for s in ("script", "image", "eval"))
+    if not requests:
+        return
+    saved = sum(METRICS.get("prompt_cache_tokens_saved_total", stage=s) for s in ("script", "image", "eval"))
+    print(
+        f"[INFO] Context cache: {int(requests)} request(s) referenced cached prompt prefixes, "
+        f"~{int(saved)} input token(s) not resent."
+    )
+
+
 def extract_first_image_bytes(resp_obj) -> Optional[bytes]:
     candidates = getattr(resp_obj, "candidates", None) or []
     for cand in candidates:
@@ -462,7 +910,13 @@ def parse_ox(text: str) -> str:
     return "X"
 
 
-def split_ox_and_reason_nonempty(text: str) -> Tuple[str, str]:
+DEFAULT_EVAL_REASON = (
+    "Review the entire page from the beginning, translate all {source_langs} text into natural Korean again, "
+    "and check for any remaining {source_langs} text, bubble placement issues, or tone inconsistencies."
+)
+
+
+def split_ox_and_reason_nonempty(text: str, lang: str = "Korean") -> Tuple[str, str]:
     if not text or not text.strip():
         raise ValueError("Empty evaluation text")
     lines = [line.strip() for line in text.splitlines() if line.strip()]
@@ -471,10 +925,7 @@ def split_ox_and_reason_nonempty(text: str) -> Tuple[str, str]:
     ox = parse_ox(lines[0])
     reason = "\n".join(lines[1:]).strip()
     if not reason:
-        reason = (
-            "Review the entire page from the beginning, translate all Japanese and English text into natural Korean again, "
-            "and check for any remaining Japanese/English text, bubble placement issues, or tone inconsistencies."
-        )
+        reason = fill_language_fields(DEFAULT_EVAL_REASON, lang)
     return ox, reason
 
 
@@ -504,10 +955,193 @@ def load_eval_log(log_path: str) -> Dict[str, Tuple[str, str]]:
     return results
 
 
+# =========================================
+# Run metrics + batch job runner
+# =========================================
+METRICS = RunMetrics(prefix="manga_")
+BUDGET: Optional[run_budget.RunBudget] = None  # set by main() (ledger lives in BASE_DIR)
+
+TERMINAL_JOB_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
+
+
+def publish_metrics():
+    METRICS.set("last_update_timestamp_seconds", time.time(), "Unix time of the last metrics update")
+    if METRICS_TEXTFILE:
+        try:
+            METRICS.write_textfile(METRICS_TEXTFILE)
+        except Exception as e:
+            print(f"[WARN] Failed to write metrics textfile {METRICS_TEXTFILE}: {e}")
+
+
+def start_metrics():
+    if METRICS_PORT:
+        try:
+            METRICS.serve(METRICS_PORT)
+            print(f"[INFO] Serving metrics on port {METRICS_PORT} (/metrics).")
+        except OSError as e:
+            print(f"[WARN] Could not start metrics server on port {METRICS_PORT}: {e}")
+    publish_metrics()
+
+
+def mark_progress():
+    METRICS.set(
+        "last_progress_timestamp_seconds",
+        time.time(),
+        "Unix time a page last produced a script, image or verdict",
+    )
+
+
+def record_page_states(
+    last_results: Dict[str, str],
+    pending_count: Optional[int] = None,
+    stalled_count: Optional[int] = None,
+):
+    passed = sum(1 for r in last_results.values() if r == "O")
+    METRICS.set("pages", passed, "Pages per state", state="passed")
+    METRICS.set("pages", len(last_results) - passed - (stalled_count or 0), "Pages per state", state="failed")
+    if stalled_count is not None:
+        METRICS.set("pages", stalled_count, "Pages per state", state="stalled")
+    if pending_count is not None:
+        METRICS.set("pages", pending_count, "Pages per state", state="pending_generation")
+    publish_metrics()
+
+
+def stalled_count(page_stats: Dict[str, Dict[str, Any]], last_results: Dict[str, str]) -> int:
+    """Stalled, still failing pages among every page this worker tracked (the "pages" gauge spans all shards)."""
+    return sum(1 for k, st in page_stats.items() if st["stalled_at"] is not None and last_results.get(k) != "O")
+
+
+def request_payload_bytes(src: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """Return (inline image bytes, prompt text bytes) of a list of inline requests."""
+    image_bytes = 0
+    text_bytes = 0
+    for req in src:
+        for content in req.get("contents", []):
+            for part in content.get("parts", []):
+                if "inline_data" in part:
+                    image_bytes += len(part["inline_data"].get("data", ""))
+                elif "text" in part:
+                    text_bytes += len(part["text"].encode("utf-8"))
+    return image_bytes, text_bytes
+
+
+def run_batch(client, model: str, src: List[Dict[str, Any]], display_name: str, stage: str, label: str):
+    """
+    Create one inline batch job and poll it until it reaches a terminal state.
+    Returns the finished job on success, or None (after logging) if creation failed
+    or the job did not succeed. Latency, in-flight jobs and payload size are recorded
+    in METRICS under `stage` ("script", "image", "eval").
+    Raises run_budget.BudgetExhausted instead of submitting a batch that would cross BUDGET_USD;
+    the estimate stays reserved in the ledger until the batch is charged or has failed.
+    """
+    estimates = [
+        run_budget.estimate_request_cost(
+            model, stage, req, _PROMPT_CACHE_TOKENS.get((req.get("config") or {}).get("cached_content") or "", 0)
+        )
+        for req in src
+    ]
+    reservation = BUDGET.reserve(stage, model, len(src), sum(estimates), label) if BUDGET is not None else ""
+    image_bytes, text_bytes = request_payload_bytes(src)
+    try:
+        job = client.batches.create(model=model, src=src, config={"display_name": display_name})
+    except Exception as e:
+        print(f"[ERROR] {label} creation failed: {e}")
+        release_reservation(reservation, model)
+        METRICS.inc("batch_jobs_total", 1, "Batch jobs by final state", stage=stage, state="CREATE_FAILED")
+        publish_metrics()
+        return None
+
+    METRICS.inc("requests_total", len(src), "Model requests submitted", stage=stage)
+    cached = [(r.get("config") or {}).get("cached_content") for r in src]
+    cached = [name for name in cached if name]
+    if cached:
+        METRICS.inc("prompt_cache_requests_total", len(cached), "Requests referencing a cached prompt prefix", stage=stage)
+        METRICS.inc(
+            "prompt_cache_tokens_saved_total",
+            sum(_PROMPT_CACHE_TOKENS.get(name, 0) for name in cached),
+            "Prompt prefix tokens served from context cache instead of resent",
+            stage=stage,
+        )
+    METRICS.inc("upload_bytes_total", image_bytes, "Request payload bytes submitted", stage=stage, kind="image")
+    METRICS.inc("upload_bytes_total", text_bytes, "Request payload bytes submitted", stage=stage, kind="text")
+    METRICS.add("inflight_jobs", 1, "Batch jobs currently queued or running", stage=stage)
+    METRICS.add("inflight_requests", len(src), "Requests inside in-flight batch jobs", stage=stage)
+    publish_metrics()
+
+    started = time.monotonic()
+    job_done = None
+    try:
+        while True:
+            job_status = client.batches.get(name=job.name)
+            state = job_status.state.name
+            if state in TERMINAL_JOB_STATES:
+                job_done = job_status
+                break
+            print(f"  - {label} status: {state} (polling...)")
+            publish_metrics()
+            time.sleep(POLL_INTERVAL_SEC)
+    except BaseException:
+        release_reservation(reservation, model)
+        raise
+    finally:
+        METRICS.add("inflight_jobs", -1, stage=stage)
+        METRICS.add("inflight_requests", -len(src), stage=stage)
+
+    METRICS.observe(
+        "stage_latency_seconds",
+        time.monotonic() - started,
+        "Batch job latency from creation to terminal state",
+        stage=stage,
+    )
+    METRICS.inc("batch_jobs_total", 1, "Batch jobs by final state", stage=stage, state=job_done.state.name)
+    publish_metrics()
+
+    if job_done.state.name != "JOB_STATE_SUCCEEDED":
+        print(f"[ERROR] {label} ended with state: {job_done.state.name}")
+        release_reservation(reservation, model)
+        return None
+    charge_batch(model, stage, job_done, estimates, reservation)
+    return job_done
+
+
+def release_reservation(reservation: str, model: str):
+    if BUDGET is not None:
+        BUDGET.release(reservation, model)
+
+
+def charge_batch(model: str, stage: str, job_done, estimates: List[float], reservation: str = ""):
+    """
+    Record a finished batch in the cost ledger: reported token usage where present, else the
+    estimate. The charge replaces the batch's reservation.
+    """
+    inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
+    image_output = stage in ("image", "final")
+    usd = 0.0
+    measured = 0
+    for i, estimate in enumerate(estimates):
+        resp = inline_responses[i].response if i < len(inline_responses) else None
+        cost = run_budget.usage_cost(model, getattr(resp, "usage_metadata", None), image_output) if resp else None
+        if cost is None:
+            cost = estimate
+        else:
+            measured += 1
+        usd += cost
+    basis = "usage" if measured == len(estimates) else "estimate" if not measured else "mixed"
+    METRICS.inc("cost_usd_total", usd, "Model spend recorded in the cost ledger (USD)", stage=stage)
+    if BUDGET is not None:
+        BUDGET.charge(stage, model, len(estimates), usd, sum(estimates), basis, reservation)
+        METRICS.set("budget_spent_usd", BUDGET.spent, "Spend recorded for this run folder (USD)")
+
+
 # =========================================
 # Prompt builders
 # =========================================
-def build_script_prompt(additional_instructions: Optional[str] = None) -> str:
+def build_script_prompt(additional_instructions: Optional[str] = None, template: str = SCRIPT_PROMPT_TEMPLATE) -> str:
     if additional_instructions:
         extra = "\n\nAdditional page-specific instructions from previous evaluations:\n"
         for line in additional_instructions.split("\n"):
@@ -515,13 +1149,17 @@ def build_script_prompt(additional_instructions: Optional[str] = None) -> str:
             if not line:
                 continue
             extra += f"- {line}\n"
-        return SCRIPT_PROMPT_TEMPLATE + extra
+        return template + extra
     else:
-        return SCRIPT_PROMPT_TEMPLATE
+        return template
 
 
-def build_image_edit_prompt(script_text: str, additional_instructions: Optional[str] = None) -> str:
-    prompt = IMAGE_EDIT_PROMPT_BASE
+def build_image_edit_prompt(
+    script_text: str,
+    additional_instructions: Optional[str] = None,
+    base_prompt: str = IMAGE_EDIT_PROMPT_BASE,
+) -> str:
+    prompt = base_prompt
     if additional_instructions:
         prompt += "\n\nAdditional page-specific instructions from previous evaluations:\n"
         for line in additional_instructions.split("\n"):
@@ -534,134 +1172,673 @@ def build_image_edit_prompt(script_text: str, additional_instructions: Optional[
     return prompt
 
 
+# =========================================
+# Feedback compaction (bounded per-page history of evaluator reasons)
+# =========================================
+FEEDBACK_SUMMARY_PROMPT = r"""
+You consolidate reviewer notes for one translated comic page.
+The notes below come from earlier review rounds of the same page, oldest first. Some repeat or overlap.
+
+Merge them into at most 5 short imperative instructions for the next translation attempt:
+- One instruction per line, no numbering, no bullets, no headings.
+- Drop duplicates and anything a later note contradicts.
+- Keep concrete locations (panel, bubble position) and the requested wording when given.
+- Output only the instructions.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about 4 UTF-8 bytes per token; Hangul/Japanese count ~3 bytes per character)."""
+    return max(1, len(text.encode("utf-8")) // 4)
+
+
+def clip_to_tokens(text: str, tokens: int) -> str:
+    data = text.encode("utf-8")
+    if len(data) <= tokens * 4:
+        return text
+    return data[: max(0, tokens * 4 - 3)].decode("utf-8", errors="ignore").rstrip() + "..."
+
+
+def distinct_reasons(suggestions: List[str]) -> List[str]:
+    """Evaluator reasons as single lines, duplicates removed, newest first."""
+    seen = set()
+    lines: List[str] = []
+    for reason in reversed(suggestions):
+        line = re.sub(r"\s+", " ", reason or "").strip()
+        norm = line.casefold().rstrip(".")
+        if not line or norm in seen:
+            continue
+        seen.add(norm)
+        lines.append(line)
+    return lines
+
+
+def compact_feedback(suggestions: List[str], summary: Optional[str] = None) -> Optional[str]:
+    """
+    Bounded feedback for one page: the newest FEEDBACK_RECENT_ROUNDS distinct reasons verbatim,
+    then older ones (or `summary`, a consolidation of them) while FEEDBACK_TOKEN_BUDGET allows.
+    Returns newline-separated lines (newest first) or None if there is no feedback.
+    """
+    reasons = distinct_reasons(suggestions)
+    if not reasons:
+        return None
+    recent = reasons[: max(1, FEEDBACK_RECENT_ROUNDS)]
+    older = reasons[len(recent) :]
+    budget = FEEDBACK_TOKEN_BUDGET
+    lines: List[str] = []
+    share = max(1, FEEDBACK_TOKEN_BUDGET // len(recent))
+    allowance = 0
+    for line in recent:
+        allowance = min(budget, allowance + share)  # what a shorter newer line left unused carries forward
+        if allowance <= 0:
+            break
+        line = clip_to_tokens(line, allowance)
+        lines.append(line)
+        budget -= estimate_tokens(line)
+        allowance -= estimate_tokens(line)
+    if older and summary:
+        older = ["Earlier rounds (summary): " + re.sub(r"\s+", " ", summary).strip()]
+    kept = 0
+    for line in older:
+        if budget <= 0 or estimate_tokens(line) > budget:
+            break
+        lines.append(line)
+        budget -= estimate_tokens(line)
+        kept += 1
+    if kept < len(older):
+        METRICS.inc("feedback_reasons_dropped_total", len(older) - kept, "Older evaluator reasons left out of prompts")
+    return "\n".join(lines)
+
+
+def summarize_feedback(
+    keys: List[str],
+    suggestions_map: Dict[str, List[str]],
+    client_text,
+) -> Dict[str, str]:
+    """One batch that consolidates the older (non-verbatim) reasons of each given page."""
+    summaries: Dict[str, str] = {}
+    for batch_id, i in enumerate(range(0, len(keys), BATCH_SIZE)):
+        chunk = keys[i : i + BATCH_SIZE]
+        inline_requests = []
+        for key in chunk:
+            older = distinct_reasons(suggestions_map.get(key, []))[max(1, FEEDBACK_RECENT_ROUNDS) :]
+            notes = "\n".join(f"- {line}" for line in reversed(older))
+            inline_requests.append(
+                {
+                    "contents": [{"role": "user", "parts": [{"text": f"{FEEDBACK_SUMMARY_PROMPT}\nNotes:\n{notes}\n"}]}],
+                    "config": {"response_modalities": ["TEXT"]},
+                }
+            )
+        job_done = run_batch(
+            client_text,
+            FEEDBACK_SUMMARY_MODEL,
+            inline_requests,
+            f"manga-feedback-{batch_id:03d}",
+            stage="feedback",
+            label=f"Feedback summary batch {batch_id}",
+        )
+        if job_done is None:
+            continue
+        inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
+        for key, inline_resp in zip(chunk, inline_responses):
+            text = extract_first_text(inline_resp.response) if inline_resp.response else None
+            if text and text.strip():
+                summaries[key] = " ".join(line.strip(" -*\t") for line in text.splitlines() if line.strip())
+            else:
+                print(f"[WARN] No feedback summary for {key}, keeping the newest reasons only.")
+    return summaries
+
+
+def prepare_feedback(
+    iteration_index: int,
+    job_keys: List[str],
+    jobs: Dict[str, Dict[str, Any]],
+    client_text,
+    suggestions_map: Dict[str, List[str]],
+) -> Dict[str, Optional[str]]:
+    """
+    Compacted feedback per job for one regeneration round, stored as
+    scripts/{base}_feedback_iter{k}.txt so a resumed run sends the same instructions.
+    """
+    feedback: Dict[str, Optional[str]] = {}
+    if iteration_index == 0:
+        return feedback
+    to_build: List[str] = []
+    for key in job_keys:
+        job = jobs[key]
+        fpath = feedback_path_for(job["base"], iteration_index, job["track"]["scripts_dir"])
+        stored = read_cached_script(fpath, key)
+        if stored.strip():
+            feedback[key] = stored.strip()
+        else:
+            to_build.append(key)
+
+    summaries: Dict[str, str] = {}
+    if FEEDBACK_SUMMARY:
+        needs_summary = []
+        for key in to_build:
+            reasons = distinct_reasons(suggestions_map.get(key, []))
+            if sum(estimate_tokens(r) for r in reasons) > FEEDBACK_TOKEN_BUDGET and len(reasons) > FEEDBACK_RECENT_ROUNDS:
+                needs_summary.append(key)
+        if needs_summary:
+            print(f"[INFO] Consolidating older feedback for {len(needs_summary)} page(s).")
+            summaries = summarize_feedback(needs_summary, suggestions_map, client_text)
+
+    raw_tokens = compact_tokens = 0
+    for key in to_build:
+        text = compact_feedback(suggestions_map.get(key, []), summaries.get(key))
+        feedback[key] = text
+        if not text:
+            continue
+        raw_tokens += sum(estimate_tokens(r) for r in suggestions_map.get(key, []) if r.strip())
+        compact_tokens += sum(estimate_tokens(line) for line in text.splitlines())
+        job = jobs[key]
+        fpath = feedback_path_for(job["base"], iteration_index, job["track"]["scripts_dir"])
+        try:
+            output_index.write_text(fpath, text + "\n")
+        except Exception as write_e:
+            print(f"[WARN] Failed to save feedback for {key} to {fpath}: {write_e}")
+    if raw_tokens:
+        print(f"[INFO] Iteration {iteration_index} feedback: ~{raw_tokens} token(s) of reasons compacted to ~{compact_tokens}.")
+        METRICS.set("feedback_tokens", compact_tokens, "Approx. feedback tokens per round after compaction", iteration=iteration_index)
+    return feedback
+
+
+# =========================================
+# Target languages, tracks and page jobs
+# =========================================
+# A "track" is one output tree (one target language of one volume); a "job" is one page of one track.
+# With a single target language the track uses the classic layout (BASE_DIR/out1.., scripts/).
+# With several, each language gets BASE_DIR/<code>/out1.. and BASE_DIR/<code>/scripts.
+# In library mode the same layout is repeated per volume under LIBRARY_OUTPUT_DIR/<volume>.
+TRACK_PROMPTS = ("script_prompt", "script_prompt_analysis", "image_prompt", "eval_prompt")
+
+
+def build_tracks(
+    volume: str = "",
+    volume_index: int = 0,
+    volume_from_end: int = 0,
+    input_dir: str = "",
+) -> List[Dict[str, Any]]:
+    langs = [lang for lang in TARGET_LANGS if lang] or ["Korean"]
+    if volume:
+        volume_root = os.path.join(LIBRARY_OUTPUT_DIR, *volume.split("/"))
+        input_dir = input_dir or os.path.join(LIBRARY_DIR, *volume.split("/"))
+        analysis_dir = os.path.join(volume_root, "source_analysis")
+        tiles_dir = os.path.join(volume_root, "_tiles")
+    else:
+        volume_root, input_dir, analysis_dir, tiles_dir = str(BASE_DIR), INPUT_DIR, SOURCE_ANALYSIS_DIR, TILES_DIR
+    tracks: List[Dict[str, Any]] = []
+    for lang in langs:
+        if len(langs) == 1:
+            key = volume
+            root = volume_root
+            init_dir = os.path.join(root, f"{OUTPUT_BASE_NAME}1") if volume else INIT_OUTPUT_DIR
+            scripts_dir = os.path.join(root, "scripts") if volume else SCRIPTS_DIR
+        else:
+            code = language_profile(lang)["code"]
+            key = f"{volume}/{code}" if volume else code
+            root = os.path.join(volume_root, code)
+            init_dir = os.path.join(root, f"{OUTPUT_BASE_NAME}1")
+            scripts_dir = os.path.join(root, "scripts")
+        tracks.append(
+            {
+                "key": key,
+                "lang": lang,
+                "volume": volume,
+                "volume_index": volume_index,
+                "volume_from_end": volume_from_end,
+                "volume_root": volume_root,
+                "input_dir": input_dir,
+                "root": root,
+                "init_dir": init_dir,
+                "final_dir": os.path.join(root, FINAL_OUTPUT_DIR_NAME),
+                "scripts_dir": scripts_dir,
+                "analysis_dir": analysis_dir,
+                "tiles_dir": tiles_dir,
+                "script_prompt": localize_prompt(SCRIPT_PROMPT_TEMPLATE, lang),
+                "script_prompt_analysis": localize_prompt(script_template_from_analysis(SCRIPT_PROMPT_TEMPLATE), lang),
+                "image_prompt": localize_prompt(IMAGE_EDIT_PROMPT_BASE, lang),
+                "eval_prompt": localize_prompt(EVAL_PROMPT, lang),
+            }
+        )
+        check_prompts({name: tracks[-1][name] for name in TRACK_PROMPTS}, lang)
+    return tracks
+
+
+def library_volumes() -> Dict[str, str]:
+    """
+    Volumes under LIBRARY_DIR in natural order: POSIX path relative to it -> folder of pages,
+    or CBZ/ZIP/tar archive (named without its extension).
+    """
+    output_root = os.path.abspath(LIBRARY_OUTPUT_DIR)
+    volumes: Dict[str, str] = {}
+
+    def add(path: str):
+        rel = pathlib.PurePath(os.path.relpath(path, LIBRARY_DIR)).as_posix()
+        suffix = page_sources.archive_suffix(rel) if os.path.isfile(path) else ""
+        volume = rel[: len(rel) - len(suffix)]
+        if volume in volumes:
+            print(f"[WARN] {path} has the same volume name as {volumes[volume]}; skipping it.")
+            return
+        volumes[volume] = path
+
+    for dirpath, dirnames, filenames in os.walk(LIBRARY_DIR):
+        dirnames[:] = [
+            d for d in dirnames if not d.startswith(".") and os.path.abspath(os.path.join(dirpath, d)) != output_root
+        ]
+        if list_images(dirpath):
+            if os.path.relpath(dirpath, LIBRARY_DIR) == os.curdir:
+                print(f"[WARN] Pages directly in {LIBRARY_DIR} are ignored; put each volume in its own folder.")
+            else:
+                add(dirpath)
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if not name.startswith(".") and page_sources.is_archive(path) and list_images(path):
+                add(path)
+    return {volume: volumes[volume] for volume in sorted(volumes, key=natural_key)}
+
+
+def library_tracks() -> List[Dict[str, Any]]:
+    """Tracks of every volume in LIBRARY_DIR (volumes of one series share their parent folder)."""
+    volumes = library_volumes()
+    series: Dict[str, List[str]] = {}
+    for volume in volumes:
+        series.setdefault(posixpath.dirname(volume), []).append(volume)
+    tracks: List[Dict[str, Any]] = []
+    for index, (volume, input_dir) in enumerate(volumes.items()):
+        siblings = series[posixpath.dirname(volume)]
+        tracks.extend(build_tracks(volume, index, len(siblings) - 1 - siblings.index(volume), input_dir))
+    return tracks
+
+
+def page_order_key(track: Dict[str, Any], page_index: int, base: str) -> Tuple[Any, ...]:
+    """Processing order of a page under LIBRARY_PRIORITY (a single volume simply goes in page order)."""
+    if LIBRARY_PRIORITY == "latest":
+        return (track["volume_from_end"], track["volume_index"], natural_key(base))
+    if LIBRARY_PRIORITY == "interleave":
+        return (page_index, track["volume_index"], natural_key(base))
+    return (track["volume_index"], natural_key(base))
+
+
+def job_key_for(track: Dict[str, Any], base: str) -> str:
+    return f"{track['key']}/{base}" if track["key"] else base
+
+
+def tile_jobs(job: Dict[str, Any], plans: Dict[Tuple[str, str], Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    TILING: the tile jobs of a page job (just the job when the page is not tiled). Tile jobs keep
+    the page's base in "page" and its tile plan in "tile_plan"; their source is the cut tile.
+    Under DRY_RUN nothing is cut: the plan is page_tiles.estimate_tiles.
+    """
+    track = job["track"]
+    plan_key = (track["tiles_dir"], job["base"])
+    if plan_key not in plans and DRY_RUN:
+        try:
+            plans[plan_key] = page_tiles.estimate_tiles(
+                job["src"], track["tiles_dir"], job["base"], TILE_MAX_PX, TILE_SPREAD_ASPECT, TILE_OVERLAP
+            )
+        except Exception as e:
+            print(f"[WARN] Could not size {job['src']}, counting the page whole: {e}")
+            plans[plan_key] = {"files": []}
+    if plan_key not in plans:
+        try:
+            plans[plan_key] = page_tiles.prepare_tiles(
+                job["src"], track["tiles_dir"], job["base"], TILE_MAX_PX, TILE_SPREAD_ASPECT, TILE_OVERLAP
+            )
+        except Exception as e:
+            print(f"[WARN] Tiling failed for {job['src']}, processing the page whole: {e}")
+            plans[plan_key] = {"files": []}
+    plan = plans[plan_key]
+    if not plan["files"]:
+        return [job]
+    tiles = []
+    for index, name in enumerate(plan["files"], start=1):
+        base = page_tiles.tile_base(job["base"], index)
+        tiles.append(
+            {
+                "key": job_key_for(track, base),
+                "track": track,
+                "base": base,
+                "src": os.path.join(track["tiles_dir"], name),
+                "page": job["base"],
+                "tile_plan": plan,
+            }
+        )
+    return tiles
+
+
+def collect_jobs(tracks: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Build one job per (track, page), ordered page-major so every language of a page
+    lands in the same batch and shares one encoding/upload of the original; pages of
+    several volumes are ordered by LIBRARY_PRIORITY. With TILING, spreads and large
+    pages contribute one job per tile instead.
+    """
+    listings: Dict[str, List[str]] = {}
+    plans: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    entries: List[Tuple[Any, int, Dict[str, Any]]] = []
+    for t_idx, track in enumerate(tracks):
+        input_dir = track["input_dir"]
+        if input_dir not in listings:
+            listings[input_dir] = list_images(input_dir)
+        for page_index, img in enumerate(listings[input_dir]):
+            base = normalized_base_from_filename(img)
+            job = {
+                "key": job_key_for(track, base),
+                "track": track,
+                "base": base,
+                "src": page_sources.page_path(input_dir, img),
+            }
+            for part in tile_jobs(job, plans) if TILING else [job]:
+                entries.append((page_order_key(track, page_index, base), t_idx, part))
+    entries.sort(key=lambda e: (e[0], e[1]))
+    jobs: Dict[str, Dict[str, Any]] = {}
+    for _, _, job in entries:
+        jobs[job["key"]] = job
+    tiled = [plan for plan in plans.values() if plan["files"]]
+    if tiled:
+        print(f"[TILES] {len(tiled)} page(s) split into {sum(len(p['files']) for p in tiled)} tile(s).")
+    return jobs
+
+
+def candidate_path_for(job: Dict[str, Any], iteration_index: int, variant: int) -> str:
+    """Variant n (2..N) of a page in a fan-out round; variant 1 is the page's regular output file."""
+    folder = os.path.join(output_dir_for(job["track"], iteration_index), CANDIDATES_DIR_NAME)
+    return os.path.join(folder, f"{job['base']}__v{variant}.jpg")
+
+
+def output_dir_for(track: Dict[str, Any], iteration_index: int) -> str:
+    if iteration_index == 0:
+        return track["init_dir"]
+    return os.path.join(track["root"], f"{OUTPUT_BASE_NAME}{iteration_index + 1}")
+
+
+def folder_bases(folder: str, cache: Dict[str, set]) -> set:
+    """Bases with a complete image in `folder` (checked against the folder's integrity index)."""
+    if folder not in cache:
+        names = output_index.intact_names(folder, list_images(folder))
+        cache[folder] = {normalized_base_from_filename(f) for f in names}
+    return cache[folder]
+
+
+def jobs_without_output(job_keys: List[str], jobs: Dict[str, Dict[str, Any]], iteration_index: int) -> List[str]:
+    listing: Dict[str, set] = {}
+    pending = []
+    for key in job_keys:
+        job = jobs[key]
+        if job["base"] not in folder_bases(output_dir_for(job["track"], iteration_index), listing):
+            pending.append(key)
+    return pending
+
+
 # =========================================
 # Iteration detection (for resume)
 # =========================================
-def detect_last_complete_iteration(all_bases: List[str]) -> int:
-    bases_set = set(all_bases)
+def detect_last_complete_iteration(job_keys: List[str], jobs: Dict[str, Dict[str, Any]]) -> int:
     last_complete = 0
     for iteration in range(1, MAX_ITERATIONS + 1):
-        # iteration = 1 → out2, 2 → out3 ...
-        dir_name = f"{OUTPUT_BASE_NAME}{iteration + 1}"
-        path = os.path.join(BASE_DIR, dir_name)
-        if not os.path.isdir(path):
+        # iteration = 1 → out2, 2 → out3 ... (checked in every track)
+        folders = {output_dir_for(jobs[k]["track"], iteration) for k in job_keys}
+        if not all(os.path.isdir(f) for f in folders):
             break
-        files = list_images(path)
-        folder_bases = {normalized_base_from_filename(f) for f in files}
-        if bases_set.issubset(folder_bases):
-            last_complete = iteration
-        else:
+        if jobs_without_output(job_keys, jobs, iteration):
             break
+        last_complete = iteration
     return last_complete
 
 
 # =========================================
 # Evaluation helpers (batched)
 # =========================================
-def evaluate_folder(
-    folder_path: str,
+def plan_focused_eval(
+    iteration_index: int,
+    keys: List[str],
+    variant_paths: Dict[str, List[str]],
+    jobs: Dict[str, Dict[str, Any]],
+) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """
+    FOCUSED_EVAL: (job key, render path) -> {"regions", "verdict"} for renders that can be judged
+    from the regions changed since the version evaluated in the previous round ("regions" is
+    empty when nothing changed). Renders that need a full evaluation are left out.
+    """
+    logs: Dict[str, Dict[str, Tuple[str, str]]] = {}
+    plans: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    counts = {"focused": 0, "unchanged": 0, "full": 0}
+    for key in keys:
+        job = jobs[key]
+        prev_dir = output_dir_for(job["track"], iteration_index - 1)
+        if prev_dir not in logs:
+            logs[prev_dir] = load_eval_log(os.path.join(prev_dir, "eval_log.tsv"))
+        verdict = logs[prev_dir].get(job["base"])
+        prev_path = os.path.join(prev_dir, f"{job['base']}.jpg")
+        for path in variant_paths[key]:
+            regions = None
+            if verdict and os.path.isfile(prev_path):
+                try:
+                    with Image.open(prev_path) as before, Image.open(path) as after:
+                        regions = change_regions.changed_regions(before, after)
+                except Exception as e:
+                    print(f"[WARN] Could not compare {path} with its last evaluated version: {e}")
+            if regions is None or (
+                regions
+                and (
+                    verdict[0] != "X"
+                    or len(regions) > FOCUSED_EVAL_MAX_REGIONS
+                    or change_regions.region_area(regions) > FOCUSED_EVAL_MAX_AREA
+                )
+            ):
+                counts["full"] += 1
+                continue
+            plans[(key, path)] = {"regions": regions, "verdict": verdict}
+            counts["focused" if regions else "unchanged"] += 1
+    for mode, count in counts.items():
+        if count:
+            METRICS.inc("focused_eval_renders_total", count, "Renders by evaluation mode (FOCUSED_EVAL)", mode=mode)
+    print(
+        f"[EVAL] Focused: {counts['focused']} render(s) judged from changed regions, "
+        f"{counts['unchanged']} unchanged, {counts['full']} full."
+    )
+    return plans
+
+
+def focused_eval_parts(job: Dict[str, Any], path: str, plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Prompt parts of a focused evaluation: previous verdict, then original/translated crop pairs."""
+    ox, reason = plan["verdict"]
+    text = FOCUSED_EVAL_PROMPT.replace("{previous_verdict}", ox).replace("{previous_reason}", reason or "(no details)")
+    parts: List[Dict[str, Any]] = [{"text": text}]
+
+    def jpeg_part(img: Image.Image) -> Dict[str, Any]:
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=90)
+        return {"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(buf.getvalue()).decode("ascii")}}
+
+    with Image.open(page_sources.open_page(job["src"])) as original, Image.open(path) as translated:
+        for n, region in enumerate(plan["regions"], start=1):
+            left, top, right, bottom = region
+            parts += [
+                {"text": f"Region {n}: x {left:.0%}-{right:.0%}, y {top:.0%}-{bottom:.0%} of the page"},
+                {"text": f"<ORIGINAL_CROP_{n}>"},
+                jpeg_part(change_regions.crop(original, region, FOCUSED_EVAL_CROP_PX)),
+                {"text": f"</ORIGINAL_CROP_{n}>"},
+                {"text": f"<TRANSLATED_CROP_{n}>"},
+                jpeg_part(change_regions.crop(translated, region, FOCUSED_EVAL_CROP_PX)),
+                {"text": f"</TRANSLATED_CROP_{n}>"},
+            ]
+    return parts
+
+
+def evaluate_iteration(
     iteration_index: int,
-    images: List[str],
+    job_keys: List[str],
+    jobs: Dict[str, Dict[str, Any]],
     client_text,
     suggestions_map: Dict[str, List[str]],
     last_results: Dict[str, str],
-    log_path: str,
-):
-    print(f"\n--- Evaluating folder (iteration {iteration_index}): {folder_path} ---")
-    orig_map: Dict[str, str] = {
-        normalized_base_from_filename(f): os.path.join(INPUT_DIR, f) for f in images
-    }
-    trans_map: Dict[str, str] = {
-        normalized_base_from_filename(f): os.path.join(folder_path, f)
-        for f in list_images(folder_path)
-    }
-    common_bases = sorted(set(orig_map.keys()) & set(trans_map.keys()), key=natural_key)
-    if not common_bases:
-        raise RuntimeError(f"No common images found between input and {folder_path} for evaluation.")
-
-    existing_results = load_eval_log(log_path)
-    prev_result_map = {base: last_results.get(base, "X") for base in common_bases}
+    carried: Optional[Dict[str, Tuple[str, str]]] = None,
+) -> Dict[str, Tuple[str, str]]:
+    """
+    Evaluate one output round; updates last_results/suggestions_map and returns job_key -> (O/X, reason).
+    Pages in `carried` (copied forward unchanged) keep the given verdict without a request; it is
+    logged in this round's folder so a resume finds it.
+    """
+    carried = carried or {}
+    folders: List[str] = []
+    for key in job_keys:
+        folder = output_dir_for(jobs[key]["track"], iteration_index)
+        if folder not in folders:
+            folders.append(folder)
+    for folder in folders:
+        print(f"\n--- Evaluating folder (iteration {iteration_index}): {folder} ---")
+
+    listing: Dict[str, set] = {}
+    trans_map: Dict[str, str] = {}
+    for key in job_keys:
+        job = jobs[key]
+        folder = output_dir_for(job["track"], iteration_index)
+        if job["base"] in folder_bases(folder, listing):
+            trans_map[key] = os.path.join(folder, f"{job['base']}.jpg")
+    common_keys = [k for k in job_keys if k in trans_map]
+    if not common_keys:
+        raise RuntimeError(f"No common images found between input and {', '.join(folders)} for evaluation.")
+
+    log_paths: Dict[str, str] = {folder: os.path.join(folder, "eval_log.tsv") for folder in folders}
+    existing_results = {folder: load_eval_log(path) for folder, path in log_paths.items()}
+    prev_result_map = {key: last_results.get(key, "X") for key in common_keys}
     result_map: Dict[str, str] = {}
     reason_map: Dict[str, str] = {}
-    updated_map: Dict[str, bool] = {base: False for base in common_bases}
-    pending = set(common_bases)
+    updated_map: Dict[str, bool] = {key: False for key in common_keys}
+    pending = set(common_keys)
     new_evals: Dict[str, Tuple[str, str]] = {}
 
     # cached evals
-    for base in common_bases:
-        if base in existing_results:
-            ox_cached, reason_cached = existing_results[base]
-            result_map[base] = ox_cached
-            reason_map[base] = reason_cached
-            updated_map[base] = True
-            pending.discard(base)
+    for key in common_keys:
+        job = jobs[key]
+        cached = existing_results[output_dir_for(job["track"], iteration_index)]
+        if job["base"] in cached:
+            ox_cached, reason_cached = cached[job["base"]]
+            result_map[key] = ox_cached
+            reason_map[key] = reason_cached
+            updated_map[key] = True
+            pending.discard(key)
+    for key in pending & set(carried):
+        result_map[key], reason_map[key] = carried[key]
+        updated_map[key] = True
+        pending.discard(key)
+        new_evals[key] = carried[key]
+
+    # Fan-out rounds: extra variants of a page are evaluated in the same batches as the page itself
+    variant_paths: Dict[str, List[str]] = {}
+    for key in pending:
+        paths = [trans_map[key]]
+        for variant in range(2, max(CANDIDATES_PER_FAILING_PAGE, MAX_CANDIDATES_PER_PAGE) + 1):
+            path = candidate_path_for(jobs[key], iteration_index, variant)
+            if os.path.isfile(path):
+                paths.append(path)
+        variant_paths[key] = paths
+    variant_results: Dict[str, Dict[str, Tuple[str, str]]] = {key: {} for key in pending}
+
+    def resolve(key: str, final: bool = False) -> bool:
+        """Pick the first passing variant (in variant order) once the verdicts allow it."""
+        results = variant_results[key]
+        chosen = None
+        for path in variant_paths[key]:
+            if path not in results:
+                if final:
+                    continue
+                return False
+            if results[path][0] == "O":
+                chosen = path
+                break
+        if chosen is None:
+            evaluated = [p for p in variant_paths[key] if p in results]
+            if not evaluated:
+                return False
+            chosen = evaluated[0]
+        if chosen != trans_map[key]:
+            try:
+                output_index.copy_image(trans_map[key], candidate_path_for(jobs[key], iteration_index, 1))
+                output_index.copy_image(chosen, trans_map[key])
+                print(f"[CANDIDATE] {key}: kept variant {os.path.basename(chosen)}")
+                METRICS.inc("candidate_promotions_total", 1, "Pages whose output was replaced by a passing extra variant")
+            except Exception as e:
+                print(f"[WARN] Failed to promote variant {chosen} for {key}: {e}")
+                chosen = trans_map[key]
+                if chosen not in results:
+                    return False
+        ox, reason = results[chosen]
+        result_map[key] = ox
+        reason_map[key] = reason
+        updated_map[key] = True
+        pending.discard(key)
+        new_evals[key] = (ox, reason)
+        return True
+
+    # Focused mode: renders identical to their last evaluated version keep that verdict without a request
+    focus: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    if FOCUSED_EVAL and iteration_index > 0 and pending:
+        focus = plan_focused_eval(iteration_index, [k for k in common_keys if k in pending], variant_paths, jobs)
+        for (key, path), plan in focus.items():
+            if not plan["regions"] and key in pending:
+                variant_results[key][path] = plan["verdict"]
+                resolve(key)
 
     for attempt in range(1, MAX_EVAL_RETRIES + 1):
         if not pending:
             break
         print(f"[EVAL] Attempt {attempt} for {len(pending)} page(s).")
-
-        pending_list = sorted(pending, key=natural_key)
+        if attempt > 1:
+            METRICS.inc("retries_total", 1, "Stage retry attempts", stage="eval")
+
+        units = [
+            (key, path)
+            for key in common_keys
+            if key in pending
+            for path in variant_paths[key]
+            if path not in variant_results[key]
+        ]
         idx_start = 0
-        while idx_start < len(pending_list):
-            chunk_bases = pending_list[idx_start : idx_start + BATCH_SIZE]
+        while idx_start < len(units):
+            chunk_units = units[idx_start : idx_start + BATCH_SIZE]
             idx_start += BATCH_SIZE
 
             inline_requests = []
-            base_order: List[str] = []
-            for base in chunk_bases:
-                orig_path = orig_map[base]
-                trans_path = trans_map[base]
-                contents = [
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": EVAL_PROMPT},
-                            {"text": "<ORIGINAL_IMAGE>"},
-                            image_part_dict(orig_path),
-                            {"text": "</ORIGINAL_IMAGE>"},
-                            {"text": "<TRANSLATED_IMAGE>"},
-                            image_part_dict(trans_path),
-                            {"text": "</TRANSLATED_IMAGE>"},
-                        ],
-                    }
-                ]
+            for key, path in chunk_units:
+                job = jobs[key]
+                eval_prompt = job["track"]["eval_prompt"]
+                prompt_text, cached_content = cache_static_prefix(client_text, EVAL_MODEL, eval_prompt, eval_prompt)
+                parts: List[Dict[str, Any]] = [{"text": prompt_text}] if prompt_text else []
+                if (key, path) in focus:
+                    parts += focused_eval_parts(job, path, focus[(key, path)])
+                else:
+                    parts += [
+                        {"text": "<ORIGINAL_IMAGE>"},
+                        source_part(job["src"]),
+                        {"text": "</ORIGINAL_IMAGE>"},
+                        {"text": "<TRANSLATED_IMAGE>"},
+                        image_part_dict(path),
+                        {"text": "</TRANSLATED_IMAGE>"},
+                    ]
+                contents = [{"role": "user", "parts": parts}]
+                config: Dict[str, Any] = {"response_modalities": ["TEXT"]}
+                if cached_content:
+                    config["cached_content"] = cached_content
                 inline_requests.append(
                     {
                         "contents": contents,
-                        "config": {"response_modalities": ["TEXT"]},
+                        "config": config,
                     }
                 )
-                base_order.append(base)
-
-            try:
-                job = client_text.batches.create(
-                    model="models/gemini-3-pro-preview",
-                    src=inline_requests,
-                    config={"display_name": f"manga-eval-{iteration_index}-{attempt}"},
-                )
-            except Exception as e:
-                print(f"[ERROR] Eval batch creation failed on attempt {attempt}: {e}")
-                continue
 
-            job_done = None
-            while True:
-                job_status = client_text.batches.get(name=job.name)
-                state = job_status.state.name
-                if state in {
-                    "JOB_STATE_SUCCEEDED",
-                    "JOB_STATE_FAILED",
-                    "JOB_STATE_CANCELLED",
-                    "JOB_STATE_EXPIRED",
-                }:
-                    job_done = job_status
-                    break
-                print(f"  - Eval batch status: {state} (polling...)")
-                time.sleep(POLL_INTERVAL_SEC)
-
-            if not job_done or job_done.state.name != "JOB_STATE_SUCCEEDED":
-                err_state = job_done.state.name if job_done else "Unknown"
-                print(f"[ERROR] Eval batch ended with state: {err_state}")
+            job_done = run_batch(
+                client_text,
+                EVAL_MODEL,
+                inline_requests,
+                f"manga-eval-{iteration_index}-{attempt}",
+                stage="eval",
+                label=f"Eval batch (attempt {attempt})",
+            )
+            if job_done is None:
                 continue
 
             inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
@@ -669,633 +1846,1897 @@ def evaluate_folder(
                 print("[WARN] Eval batch returned no inline responses.")
                 continue
 
-            for base, inline_resp in zip(base_order, inline_responses):
-                if base not in pending:
+            for (key, path), inline_resp in zip(chunk_units, inline_responses):
+                if key not in pending:
                     continue
+                label = key if path == trans_map[key] else f"{key} ({os.path.basename(path)})"
+                if (key, path) in focus:
+                    label += f" [{len(focus[(key, path)]['regions'])} region(s)]"
                 if not inline_resp.response:
-                    print(f"[WARN] No eval response for {base}, error: {inline_resp.error}")
+                    print(f"[WARN] No eval response for {label}, error: {inline_resp.error}")
                     continue
                 raw_text = extract_first_text(inline_resp.response)
                 if not raw_text or not raw_text.strip():
-                    print(f"[WARN] Empty eval text for {base}")
+                    print(f"[WARN] Empty eval text for {label}")
                     continue
                 try:
-                    ox, reason = split_ox_and_reason_nonempty(raw_text)
+                    ox, reason = split_ox_and_reason_nonempty(raw_text, jobs[key]["track"]["lang"])
                 except Exception as e:
-                    print(f"[WARN] Failed to parse eval output for {base}: {e}")
+                    print(f"[WARN] Failed to parse eval output for {label}: {e}")
                     continue
-                print(f"  -> {base}: Result {ox}, Comment: {reason if reason else '(no details)'}")
-                result_map[base] = ox
-                reason_map[base] = reason
-                updated_map[base] = True
-                pending.discard(base)
-                new_evals[base] = (ox, reason)
-
-    for base in pending:
-        prev_res = prev_result_map[base]
+                print(f"  -> {label}: Result {ox}, Comment: {reason if reason else '(no details)'}")
+                mark_progress()
+                variant_results[key][path] = (ox, reason)
+                resolve(key)
+
+    for key in common_keys:
+        if key not in pending:
+            continue
+        if resolve(key, final=True):
+            continue
+        prev_res = prev_result_map[key]
         msg = f"평가가 {MAX_EVAL_RETRIES}회 모두 실패했습니다. 이전 판정({prev_res})을 유지합니다."
-        print(f"[WARN] {base}: {msg}")
-        result_map[base] = prev_res
-        reason_map[base] = msg
-        updated_map[base] = True
-
-    # ensure log header
-    log_exists = os.path.isfile(log_path)
-    if not log_exists:
+        print(f"[WARN] {key}: {msg}")
+        result_map[key] = prev_res
+        reason_map[key] = msg
+        updated_map[key] = True
+
+    for folder, log_path in log_paths.items():
+        # ensure log header
+        if not os.path.isfile(log_path):
+            try:
+                with open(log_path, "w", encoding="utf-8") as log_file:
+                    log_file.write("iteration\tbase_name\tresult\treason\n")
+            except Exception as e:
+                print(f"[WARN] Failed to initialize eval log at {log_path}: {e}")
+
         try:
-            with open(log_path, "w", encoding="utf-8") as log_file:
-                log_file.write("iteration\tbase_name\tresult\treason\n")
+            with open(log_path, "a", encoding="utf-8") as log_file:
+                for key in common_keys:
+                    job = jobs[key]
+                    if output_dir_for(job["track"], iteration_index) != folder:
+                        continue
+                    if not updated_map.get(key, False):
+                        continue
+                    ox = result_map.get(key, prev_result_map[key])
+                    reason = reason_map.get(key, "")
+                    last_results[key] = ox
+                    if ox == "X" and reason and key not in carried:
+                        suggestions_map[key].append(reason)
+                    if key in new_evals:
+                        clean_reason = (reason or "").replace("\n", " ").replace("\t", " ")
+                        log_file.write(f"{iteration_index}\t{job['base']}\t{ox}\t{clean_reason}\n")
         except Exception as e:
-            print(f"[WARN] Failed to initialize eval log at {log_path}: {e}")
-
-    try:
-        with open(log_path, "a", encoding="utf-8") as log_file:
-            for base in common_bases:
-                if not updated_map.get(base, False):
-                    continue
-                ox = result_map.get(base, prev_result_map[base])
-                reason = reason_map.get(base, "")
-                last_results[base] = ox
-                if ox == "X" and reason:
-                    suggestions_map[base].append(reason)
-                if base in new_evals:
-                    clean_reason = (reason or "").replace("\n", " ").replace("\t", " ")
-                    log_file.write(f"{iteration_index}\t{base}\t{ox}\t{clean_reason}\n")
-    except Exception as e:
-        print(f"[WARN] Failed to append to eval log at {log_path}: {e}")
+            print(f"[WARN] Failed to append to eval log at {log_path}: {e}")
+
+    passed = sum(1 for key in common_keys if result_map.get(key) == "O")
+    METRICS.set("iteration_pages", passed, "Evaluated pages per iteration and verdict", iteration=iteration_index, result="O")
+    METRICS.set(
+        "iteration_pages",
+        len(common_keys) - passed,
+        "Evaluated pages per iteration and verdict",
+        iteration=iteration_index,
+        result="X",
+    )
+    METRICS.set(
+        "iteration_pass_ratio",
+        passed / len(common_keys),
+        "Share of pages judged O in each iteration",
+        iteration=iteration_index,
+    )
+    record_page_states(last_results)
+    return {key: (result_map.get(key, prev_result_map[key]), reason_map.get(key, "")) for key in common_keys}
 
 
 # =========================================
-# Main Pipeline Execution
+# Source analysis stage (once per original page, shared by all languages/iterations)
 # =========================================
-def main():
-    api_key = API_KEY or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY") or ""
-    if not api_key:
-        raise RuntimeError("API key not found. Set API_KEY or GEMINI_API_KEY/GOOGLE_API_KEY.")
-
-    if not os.path.isdir(INPUT_DIR):
-        raise RuntimeError(f"Input directory not found: {INPUT_DIR}")
-    images = list_images(INPUT_DIR)
-    if not images:
-        raise RuntimeError(f"No images found in input directory: {INPUT_DIR}")
-    total_images = len(images)
-    print(f"Found {total_images} image(s) in {INPUT_DIR}.")
+_ANALYSIS_TEXT: Dict[str, str] = {}
 
-    os.makedirs(SCRIPTS_DIR, exist_ok=True)
-    os.makedirs(INIT_OUTPUT_DIR, exist_ok=True)
 
-    base_to_imgname: Dict[str, str] = {}
-    for img in images:
-        base = normalized_base_from_filename(img)
-        base_to_imgname[base] = img
-    all_bases = sorted(base_to_imgname.keys(), key=natural_key)
+def analysis_path_for(job: Dict[str, Any]) -> str:
+    return os.path.join(job["track"]["analysis_dir"], f"{job['base']}.json")
 
-    suggestions_map: Dict[str, List[str]] = {base: [] for base in all_bases}
-    last_results: Dict[str, str] = {base: "X" for base in all_bases}
-
-    client_image = genai.Client(api_key=api_key)
-    client_text = genai.Client(api_key=api_key, http_options={"api_version": "v1alpha"})
 
+def parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """JSON object from a model reply (tolerates a ```json fence); None if it does not parse."""
+    if not text:
+        return None
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = re.sub(r"^```[a-zA-Z]*\s*", "", cleaned)
+        cleaned = re.sub(r"\s*```$", "", cleaned)
     try:
-        # ==============================
-        # Stage 1: Initial Translation -> out1 (iteration_index = 0 for scripts)
-        # ==============================
-        stage_attempt = 0
-        while True:
-            existing_bases = {
-                normalized_base_from_filename(f) for f in list_images(INIT_OUTPUT_DIR)
-            }
-            pending_bases = [b for b in all_bases if b not in existing_bases]
-
-            if not pending_bases:
-                print(f"\n=== Stage 1: All images translated into {INIT_OUTPUT_DIR} ===")
-                break
-
-            stage_attempt += 1
-            if stage_attempt > MAX_STAGE_RETRIES:
-                raise RuntimeError(
-                    f"Stage 1: Could not generate output images for pages: {pending_bases} "
-                    f"after {MAX_STAGE_RETRIES} attempts."
-                )
-
-            print(
-                f"\n=== Stage 1 Attempt {stage_attempt}: Translating {len(pending_bases)} pending image(s) -> {INIT_OUTPUT_DIR} ==="
-            )
-            jobs_files = [base_to_imgname[b] for b in pending_bases]
-            jobs_paths = [os.path.join(INPUT_DIR, base_to_imgname[b]) for b in pending_bases]
-
-            batch_id = 0
-            for i in range(0, len(jobs_files), BATCH_SIZE):
-                batch_files = jobs_files[i : i + BATCH_SIZE]
-                batch_paths = jobs_paths[i : i + BATCH_SIZE]
-                print(f"Processing batch {batch_id} with {len(batch_files)} image(s): {batch_files}")
-
-                # 1) Script generation for this batch (iteration_index=0)
-                script_inline_requests = []
-                script_img_names: List[str] = []
-                scripts_for_batch: Dict[str, str] = {}
-
-                for img_name, img_path in zip(batch_files, batch_paths):
-                    base = normalized_base_from_filename(img_name)
-                    spath = script_path_for(base, 0)
-
-                    if os.path.isfile(spath):
-                        try:
-                            with open(spath, "r", encoding="utf-8") as f:
-                                cached_script = f.read()
-                        except Exception as e:
-                            print(f"[WARN] Failed to read script for {img_name} from {spath}: {e}")
-                            cached_script = ""
-                        if cached_script.strip():
-                            scripts_for_batch[img_name] = cached_script
-                            continue
-
-                    add_text = None  # 초기에는 별도 피드백 없음
-                    prompt_text = build_script_prompt(add_text)
-                    contents = [
+        data = json.loads(cleaned)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_source_analysis(text: str) -> Optional[Dict[str, Any]]:
+    data = parse_json_object(text)
+    if data is None or not isinstance(data.get("elements"), list):
+        return None
+    return data
+
+
+def load_source_analysis(job: Dict[str, Any]) -> Optional[str]:
+    """Compact JSON text of the cached analysis for a job's page, or None if missing/invalid."""
+    path = analysis_path_for(job)
+    if path in _ANALYSIS_TEXT:
+        return _ANALYSIS_TEXT[path]
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = parse_source_analysis(f.read())
+    except Exception as e:
+        print(f"[WARN] Failed to read source analysis {path}: {e}")
+        return None
+    if data is None:
+        print(f"[WARN] Ignoring invalid source analysis {path}")
+        return None
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    _ANALYSIS_TEXT[path] = text
+    return text
+
+
+def run_source_analysis(job_keys: List[str], jobs: Dict[str, Dict[str, Any]], client_text):
+    """Analyse every original page that has no cached analysis yet (one request per page, not per language)."""
+    page_jobs: Dict[str, Dict[str, Any]] = {}
+    for key in job_keys:
+        job = jobs[key]
+        page_jobs.setdefault(analysis_path_for(job), job)
+    for path in page_jobs:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    for attempt in range(1, MAX_ANALYSIS_RETRIES + 1):
+        pending = [path for path, job in page_jobs.items() if load_source_analysis(job) is None]
+        if not pending:
+            break
+        print(f"\n=== Source analysis attempt {attempt}: {len(pending)} page(s) ===")
+        if attempt > 1:
+            METRICS.inc("retries_total", 1, "Stage retry attempts", stage="analysis")
+
+        for batch_id, i in enumerate(range(0, len(pending), BATCH_SIZE)):
+            chunk = pending[i : i + BATCH_SIZE]
+            inline_requests = [
+                {
+                    "contents": [
                         {
                             "role": "user",
                             "parts": [
-                                {"text": prompt_text},
-                                image_part_dict(img_path),
+                                {"text": SOURCE_ANALYSIS_PROMPT},
+                                source_part(page_jobs[path]["src"]),
                             ],
                         }
-                    ]
-                    script_inline_requests.append(
-                        {
-                            "contents": contents,
-                            "config": {"response_modalities": ["TEXT"]},
-                        }
-                    )
-                    script_img_names.append(img_name)
-
-                if script_inline_requests:
-                    try:
-                        script_job = client_text.batches.create(
-                            model="models/gemini-3-pro-preview",
-                            src=script_inline_requests,
-                            config={"display_name": f"manga-script-init-{stage_attempt:02d}-{batch_id:03d}"},
-                        )
-                    except Exception as e:
-                        print(f"[ERROR] Script batch creation failed for batch {batch_id}: {e}")
-                        batch_id += 1
-                        continue
-
-                    script_job_done = None
-                    while True:
-                        script_status = client_text.batches.get(name=script_job.name)
-                        sstate = script_status.state.name
-                        if sstate in {
-                            "JOB_STATE_SUCCEEDED",
-                            "JOB_STATE_FAILED",
-                            "JOB_STATE_CANCELLED",
-                            "JOB_STATE_EXPIRED",
-                        }:
-                            script_job_done = script_status
-                            break
-                        print(f"  - Script batch {batch_id} status: {sstate} (polling...)")
-                        time.sleep(POLL_INTERVAL_SEC)
-
-                    if not script_job_done or script_job_done.state.name != "JOB_STATE_SUCCEEDED":
-                        serr = script_job_done.state.name if script_job_done else "Unknown"
-                        print(f"[ERROR] Script batch {batch_id} ended with state: {serr}")
-                        batch_id += 1
-                        continue
-
-                    s_inline_responses = (
-                        script_job_done.dest.inlined_responses or []
-                        if script_job_done.dest
-                        else []
-                    )
-                    if not s_inline_responses:
-                        print("[WARN] No inline responses for script batch.")
-                    for img_name, inline_resp in zip(script_img_names, s_inline_responses):
-                        if not inline_resp.response:
-                            print(f"[WARN] No script response for {img_name}, error: {inline_resp.error}")
-                            continue
-                        script_text = extract_first_text(inline_resp.response) or ""
-                        if not script_text.strip():
-                            print(f"[WARN] Empty script for {img_name}")
-                            continue
-                        scripts_for_batch[img_name] = script_text
-                        base = normalized_base_from_filename(img_name)
-                        spath = script_path_for(base, 0)
-                        try:
-                            with open(spath, "w", encoding="utf-8") as f:
-                                f.write(script_text)
-                        except Exception as write_e:
-                            print(f"[WARN] Failed to save script for {img_name} to {spath}: {write_e}")
-
-                if not scripts_for_batch:
-                    print(f"[WARN] No scripts available for batch {batch_id}, skipping image generation.")
-                    batch_id += 1
+                    ],
+                    "config": {"response_modalities": ["TEXT"], "response_mime_type": "application/json"},
+                }
+                for path in chunk
+            ]
+            job_done = run_batch(
+                client_text,
+                ANALYSIS_MODEL,
+                inline_requests,
+                f"manga-analysis-{attempt:02d}-{batch_id:03d}",
+                stage="analysis",
+                label=f"Analysis batch {batch_id}",
+            )
+            if job_done is None:
+                continue
+            inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
+            for path, inline_resp in zip(chunk, inline_responses):
+                base = page_jobs[path]["base"]
+                if not inline_resp.response:
+                    print(f"[WARN] No analysis response for {base}, error: {inline_resp.error}")
                     continue
-
-                # 2) Build image-edit requests
-                inline_requests = []
-                out_file_names: List[str] = []
-                for img_name, img_path in zip(batch_files, batch_paths):
-                    if img_name not in scripts_for_batch:
-                        continue
-                    base = normalized_base_from_filename(img_name)
-                    script_text = scripts_for_batch[img_name]
-                    prompt_text = build_image_edit_prompt(script_text, None)
-                    inline_requests.append(build_image_inline_request(img_path, prompt_text))
-                    out_file_names.append(f"{base}.jpg")
-
-                if not inline_requests:
-                    print(f"[WARN] No inline image requests for batch {batch_id}.")
-                    batch_id += 1
+                data = parse_source_analysis(extract_first_text(inline_resp.response) or "")
+                if data is None:
+                    print(f"[WARN] Unparseable source analysis for {base}")
                     continue
-
                 try:
-                    job = client_image.batches.create(
-                        model="models/gemini-3-pro-image-preview",
-                        src=inline_requests,
-                        config={"display_name": f"manga-init-{stage_attempt:02d}-{batch_id:03d}"},
-                    )
-                except Exception as e:
-                    print(f"[ERROR] Image batch creation failed for batch {batch_id}: {e}")
-                    batch_id += 1
+                    output_index.write_text(path, json.dumps(data, ensure_ascii=False, indent=1))
+                except Exception as write_e:
+                    print(f"[WARN] Failed to save source analysis for {base} to {path}: {write_e}")
                     continue
+                mark_progress()
+                print(f"[OK] Source analysis saved: {base} ({len(data['elements'])} element(s))")
+
+    missing = [path for path, job in page_jobs.items() if load_source_analysis(job) is None]
+    if missing:
+        print(f"[WARN] {len(missing)} page(s) have no source analysis; their scripts will analyse the image directly.")
+
+
+# =========================================
+# Page triage (blank / text-free / duplicate pages skip the loop)
+# =========================================
+TRIAGE_PROMPT = """
+Look at this comic page. Does it contain any text that a translator would need to handle:
+speech or thought bubbles, narration boxes, captions, sound effects, signs, or handwritten notes?
+Answer with exactly one word: TEXT or NO_TEXT.
+"""
+
+
+def thumbnail_part(path: str, max_px: int) -> Dict[str, Any]:
+    with Image.open(page_sources.open_page(path)) as img:
+        thumb = img.convert("RGB")
+        thumb.thumbnail((max_px, max_px))
+        buf = BytesIO()
+        thumb.save(buf, format="JPEG", quality=80)
+    return {"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(buf.getvalue()).decode("ascii")}}
+
 
-                job_done = None
-                while True:
-                    job_status = client_image.batches.get(name=job.name)
-                    state = job_status.state.name
-                    if state in {
-                        "JOB_STATE_SUCCEEDED",
-                        "JOB_STATE_FAILED",
-                        "JOB_STATE_CANCELLED",
-                        "JOB_STATE_EXPIRED",
-                    }:
-                        job_done = job_status
-                        break
-                    print(f"  - Image batch {batch_id} status: {state} (polling...)")
-                    time.sleep(POLL_INTERVAL_SEC)
-
-                if job_done and job_done.state.name == "JOB_STATE_SUCCEEDED":
-                    inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
-                    if not inline_responses:
-                        print("[WARN] No inline responses for image batch.")
-                    for out_name, inline_resp in zip(out_file_names, inline_responses):
-                        if not inline_resp.response:
-                            print(f"[WARN] No image response for {out_name}, error: {inline_resp.error}")
-                            continue
-                        # debug for safety block
-                        pf = getattr(inline_resp.response, "prompt_feedback", None)
-                        if pf and getattr(pf, "block_reason", None):
-                            print(f"=== DEBUG inline_resp.response for {out_name} ===")
-                            print(repr(inline_resp.response))
-                            print("=== END DEBUG ===")
-
-                        out_bytes = extract_first_image_bytes(inline_resp.response)
-                        if not out_bytes:
-                            print(f"[WARN] No image data in response for {out_name}")
-                            continue
-                        out_path = os.path.join(INIT_OUTPUT_DIR, out_name)
-                        ok = False
-                        try:
-                            img = Image.open(BytesIO(out_bytes)).convert("RGB")
-                            img.save(out_path, format="JPEG", quality=95)
-                            ok = True
-                        except UnidentifiedImageError:
-                            ok = False
-                        except Exception as save_e:
-                            print(f"[WARN] Exception saving image {out_name}: {save_e}")
-                            ok = False
-                        if ok:
-                            print(f"[OK] Saved translated image: {out_name}")
-                        else:
-                            print(f"[WARN] Failed to save image: {out_name}")
+def classify_text_presence(bases: List[str], sources: Dict[str, str], client_text) -> Dict[str, str]:
+    """One small batch per BATCH_SIZE pages (keys of `sources`); returns page -> TEXT / NO_TEXT for the pages that answered."""
+    verdicts: Dict[str, str] = {}
+    for batch_id, i in enumerate(range(0, len(bases), BATCH_SIZE)):
+        chunk = bases[i : i + BATCH_SIZE]
+        inline_requests = [
+            {
+                "contents": [
+                    {"role": "user", "parts": [{"text": TRIAGE_PROMPT}, thumbnail_part(sources[base], TRIAGE_THUMB_PX)]}
+                ],
+                "config": {"response_modalities": ["TEXT"]},
+            }
+            for base in chunk
+        ]
+        job_done = run_batch(
+            client_text,
+            TRIAGE_MODEL,
+            inline_requests,
+            f"manga-triage-{batch_id:03d}",
+            stage="triage",
+            label=f"Triage batch {batch_id}",
+        )
+        if job_done is None:
+            continue
+        inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
+        for base, inline_resp in zip(chunk, inline_responses):
+            answer = (extract_first_text(inline_resp.response) or "").strip().upper() if inline_resp.response else ""
+            if answer.startswith("NO_TEXT") or answer.startswith("NO TEXT"):
+                verdicts[base] = page_triage.NO_TEXT
+            elif answer.startswith("TEXT"):
+                verdicts[base] = page_triage.TEXT
+    return verdicts
+
+
+def triage_pages(jobs: Dict[str, Dict[str, Any]], client_text) -> Dict[str, Dict[str, Dict[str, str]]]:
+    """
+    Classify every original page once (language-neutral): blank, duplicate of an earlier
+    page of the same volume, text-free (TRIAGE_CLASSIFY) or text. Saved as page_triage.tsv in
+    each volume root (BASE_DIR outside library mode); returns volume root -> base -> record.
+    Tiles (TILING) are checked for blanks but never matched as duplicate scans.
+    """
+    volumes: Dict[str, Dict[str, str]] = {}
+    tiles = set()
+    for job in jobs.values():
+        volumes.setdefault(job["track"]["volume_root"], {}).setdefault(job["base"], job["src"])
+        if "page" in job:
+            tiles.add(job["src"])
+
+    all_records: Dict[str, Dict[str, Dict[str, str]]] = {}
+    to_classify: Dict[str, Tuple[str, str]] = {}  # source path -> (volume root, base)
+    for volume_root, sources in volumes.items():
+        previous = page_triage.load_triage(page_triage.triage_path(volume_root))
+        records: Dict[str, Dict[str, str]] = {}
+        hashes: List[Tuple[str, int]] = []
+        digests: Dict[str, str] = {}
+        for base, src in sources.items():
+            try:
+                h, stddev, digests[base] = page_triage.page_signature(page_sources.open_page(src))
+            except Exception as e:
+                print(f"[WARN] Triage failed for {src}, sending it through the loop: {e}")
+                records[base] = {"status": page_triage.TEXT, "twin": "", "dhash": "", "stddev": "", "classified": ""}
+                continue
+            status = page_triage.BLANK if stddev < TRIAGE_BLANK_STDDEV else page_triage.TEXT
+            records[base] = {"status": status, "twin": "", "dhash": f"{h:016x}", "stddev": f"{stddev:.2f}", "classified": ""}
+            if status == page_triage.TEXT and src not in tiles:
+                hashes.append((base, h))
+
+        def same_page(base: str, twin: str, sources=sources, digests=digests) -> bool:
+            if digests[base] == digests[twin]:
+                return True
+            try:
+                same = page_triage.pixels_match(page_sources.open_page(sources[twin]), page_sources.open_page(sources[base]))
+            except Exception as e:
+                print(f"[WARN] Could not compare {base} with {twin}, translating it separately: {e}")
+                return False
+            if not same:
+                print(f"[TRIAGE] {base} looks like {twin} but its pixels differ; translating it separately.")
+            return same
+
+        for base, twin in page_triage.find_duplicates(hashes, TRIAGE_DUPLICATE_DISTANCE, same_page).items():
+            records[base]["status"] = page_triage.DUPLICATE
+            records[base]["twin"] = twin
+
+        if TRIAGE_CLASSIFY:
+            for base, rec in records.items():
+                if rec["status"] != page_triage.TEXT or not rec["dhash"]:
+                    continue
+                prev = previous.get(base)
+                if prev and prev["dhash"] == rec["dhash"] and prev.get("classified") == "y":
+                    rec["status"] = prev["status"] if prev["status"] in (page_triage.TEXT, page_triage.NO_TEXT) else rec["status"]
+                    rec["classified"] = "y"
                 else:
-                    err_state = job_done.state.name if job_done else "Unknown"
-                    print(f"[ERROR] Image batch {batch_id} ended with state: {err_state}")
-                batch_id += 1
-
-        # =====================================
-        # Detect completed out iterations (resume)
-        # =====================================
-        completed_iter = detect_last_complete_iteration(all_bases)
-
-        if completed_iter == 0:
-            baseline_folder = INIT_OUTPUT_DIR
-            baseline_iter_index = 0
+                    to_classify[sources[base]] = (volume_root, base)
+        all_records[volume_root] = records
+
+    # One set of classification batches for every volume
+    if to_classify:
+        print(f"[TRIAGE] Checking {len(to_classify)} page(s) for text with {TRIAGE_MODEL}.")
+        try:
+            verdicts = classify_text_presence(list(to_classify), {src: src for src in to_classify}, client_text)
+        except run_budget.BudgetExhausted as e:
+            print(f"[BUDGET] Skipping text classification: {e}")
+            verdicts = {}
+        for src, verdict in verdicts.items():
+            volume_root, base = to_classify[src]
+            all_records[volume_root][base]["status"] = verdict
+            all_records[volume_root][base]["classified"] = "y"
+
+    counts: Dict[str, int] = {}
+    total = 0
+    for volume_root, records in all_records.items():
+        path = page_triage.triage_path(volume_root)
+        try:
+            page_triage.save_triage(path, records)
+        except Exception as e:
+            print(f"[WARN] Failed to save page triage {path}: {e}")
+        for rec in records.values():
+            counts[rec["status"]] = counts.get(rec["status"], 0) + 1
+        total += len(records)
+    for status in (page_triage.TEXT, page_triage.BLANK, page_triage.NO_TEXT, page_triage.DUPLICATE):
+        METRICS.set("triaged_pages", counts.get(status, 0), "Original pages per triage status", status=status)
+    skipped = total - counts.get(page_triage.TEXT, 0)
+    if skipped:
+        print(
+            f"[TRIAGE] {skipped} of {total} page(s) skip the loop: "
+            f"{counts.get(page_triage.BLANK, 0)} blank, {counts.get(page_triage.NO_TEXT, 0)} without text, "
+            f"{counts.get(page_triage.DUPLICATE, 0)} duplicate."
+        )
+    return all_records
+
+
+def stored_triage(jobs: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, str]]]:
+    """DRY_RUN: the page_triage.tsv records of earlier runs, without looking at any page (unknown pages count as text)."""
+    roots = {job["track"]["volume_root"] for job in jobs.values()}
+    return {root: page_triage.load_triage(page_triage.triage_path(root)) for root in roots}
+
+
+def derived_jobs(
+    jobs: Dict[str, Dict[str, Any]], records: Dict[str, Dict[str, Dict[str, str]]]
+) -> Dict[str, Optional[str]]:
+    """Job key -> twin job key (duplicates) or None (copied through unchanged) for pages that skip the loop."""
+    derived: Dict[str, Optional[str]] = {}
+    for key, job in jobs.items():
+        rec = records.get(job["track"]["volume_root"], {}).get(job["base"])
+        if not rec:
+            continue
+        if rec["status"] == page_triage.DUPLICATE:
+            twin_key = job_key_for(job["track"], rec["twin"])
+            if twin_key in jobs:
+                derived[key] = twin_key
+        elif rec["status"] in (page_triage.BLANK, page_triage.NO_TEXT):
+            derived[key] = None
+    return derived
+
+
+def copy_through_pages(jobs: Dict[str, Dict[str, Any]], derived: Dict[str, Optional[str]]):
+    """Text-free pages go to out1 unchanged (as JPEG, like every other output)."""
+    for key, twin_key in derived.items():
+        if twin_key is not None:
+            continue
+        job = jobs[key]
+        out_path = os.path.join(output_dir_for(job["track"], 0), f"{job['base']}.jpg")
+        if output_index.is_intact(out_path):
+            continue
+        try:
+            with Image.open(page_sources.open_page(job["src"])) as img:
+                output_index.save_image(img.convert("RGB"), out_path, format="JPEG", quality=95)
+            print(f"[TRIAGE] {key}: no text, copied through to {os.path.basename(os.path.dirname(out_path))}")
+        except Exception as e:
+            print(f"[WARN] Failed to copy through {key}: {e}")
+
+
+def mirror_duplicates(
+    iteration_index: int,
+    jobs: Dict[str, Dict[str, Any]],
+    derived: Dict[str, Optional[str]],
+    final: bool = False,
+):
+    """Give duplicate pages their twin's output for one round (or the final folder)."""
+    for key, twin_key in derived.items():
+        if twin_key is None:
+            continue
+        job, twin = jobs[key], jobs[twin_key]
+        if final:
+            src_dir, dst_dir = twin["track"]["final_dir"], job["track"]["final_dir"]
         else:
-            dir_name = f"{OUTPUT_BASE_NAME}{completed_iter + 1}"  # "out2", "out3", ...
-            baseline_folder = os.path.join(BASE_DIR, dir_name)
-            baseline_iter_index = completed_iter
-            print(
-                f"[INFO] Detected completed iteration {completed_iter}. "
-                f"Resuming from there using folder: {baseline_folder}"
-            )
+            src_dir, dst_dir = output_dir_for(twin["track"], iteration_index), output_dir_for(job["track"], iteration_index)
+        src = os.path.join(src_dir, f"{twin['base']}.jpg")
+        if not os.path.isfile(src) or not os.path.isdir(dst_dir):
+            continue
+        try:
+            output_index.copy_image(src, os.path.join(dst_dir, f"{job['base']}.jpg"))
+        except Exception as e:
+            print(f"[WARN] Failed to mirror {twin_key} onto duplicate {key}: {e}")
+
+
+# =========================================
+# Generation helpers (script + image, batched)
+# =========================================
+def feedback_path_for(base: str, iteration_index: int, scripts_dir: Optional[str] = None) -> str:
+    """Compacted evaluator feedback used by the scripts/images of iteration_index (1+)."""
+    return os.path.join(scripts_dir or SCRIPTS_DIR, f"{base}_feedback_iter{iteration_index}.txt")
+
+
+def latest_script_index(job: Dict[str, Any], iteration_index: int) -> Optional[int]:
+    """Newest iteration <= iteration_index with a saved script (carried-forward pages skip iterations)."""
+    for index in range(iteration_index, -1, -1):
+        if os.path.isfile(script_path_for(job["base"], index, job["track"]["scripts_dir"])):
+            return index
+    return None
+
+
+def read_cached_script(spath: str, label: str) -> str:
+    if not os.path.isfile(spath):
+        return ""
+    try:
+        with open(spath, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception as e:
+        print(f"[WARN] Failed to read script for {label} from {spath}: {e}")
+        return ""
+
+
+def save_script(job: Dict[str, Any], iteration_index: int, key: str, script_text: str):
+    spath = script_path_for(job["base"], iteration_index, job["track"]["scripts_dir"])
+    try:
+        output_index.write_text(spath, script_text)
+    except Exception as write_e:
+        print(f"[WARN] Failed to save script for {key} to {spath}: {write_e}")
+
+
+def build_script_request(
+    job: Dict[str, Any],
+    client_text,
+    add_text: Optional[str],
+    previous_script: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Full script request, or a revision (patch) request when previous_script is given."""
+    analysis = load_source_analysis(job) if SOURCE_ANALYSIS else None
+    template = job["track"]["script_prompt_analysis" if analysis else "script_prompt"]
+    prompt_text = build_script_prompt(add_text, template)
+    if analysis:
+        prompt_text += f"\n\n=== SOURCE ANALYSIS ===\n{analysis}\n=== END SOURCE ANALYSIS ===\n"
+    if previous_script is not None:
+        prompt_text += SCRIPT_PATCH_INSTRUCTIONS
+        prompt_text += f"\n=== PREVIOUS SCRIPT ===\n{previous_script.strip()}\n=== END PREVIOUS SCRIPT ===\n"
+    else:
+        prompt_text += SCRIPT_TEXT_OUTPUT
+    prompt_text, cached_content = cache_static_prefix(client_text, SCRIPT_MODEL, template, prompt_text)
+    parts: List[Dict[str, Any]] = [{"text": prompt_text}] if prompt_text else []
+    if not analysis or SCRIPT_IMAGE_WITH_ANALYSIS:
+        parts.append(source_part(job["src"]))
+    config: Dict[str, Any] = {"response_modalities": ["TEXT"]}
+    if previous_script is not None:
+        config["response_mime_type"] = "application/json"
+    if cached_content:
+        config["cached_content"] = cached_content
+    return {
+        "contents": [
+            {
+                "role": "user",
+                "parts": parts,
+            }
+        ],
+        "config": config,
+    }
+
+
+def build_multi_script_request(group: List[Dict[str, Any]], client_text) -> Dict[str, Any]:
+    """One script request for consecutive pages of a track (SCRIPT_PAGES_PER_REQUEST), tagged <PAGE_1>..<PAGE_n>."""
+    analyses = [load_source_analysis(job) if SOURCE_ANALYSIS else None for job in group]
+    with_analysis = all(analyses)
+    template = group[0]["track"]["script_prompt_analysis" if with_analysis else "script_prompt"]
+    prompt_text = build_script_prompt(None, template)
+    prompt_text += SCRIPT_MULTI_PAGE_INSTRUCTIONS.replace("{count}", str(len(group)))
+    prompt_text, cached_content = cache_static_prefix(client_text, SCRIPT_MODEL, template, prompt_text)
+    parts: List[Dict[str, Any]] = [{"text": prompt_text}] if prompt_text else []
+    for n, (job, analysis) in enumerate(zip(group, analyses), start=1):
+        parts.append({"text": f"<PAGE_{n}>"})
+        if analysis:
+            parts.append({"text": f"=== SOURCE ANALYSIS ===\n{analysis}\n=== END SOURCE ANALYSIS ==="})
+        if not with_analysis or SCRIPT_IMAGE_WITH_ANALYSIS:
+            parts.append(source_part(job["src"]))
+        parts.append({"text": f"</PAGE_{n}>"})
+    config: Dict[str, Any] = {"response_modalities": ["TEXT"], "response_mime_type": "application/json"}
+    if cached_content:
+        config["cached_content"] = cached_content
+    return {"contents": [{"role": "user", "parts": parts}], "config": config}
+
+
+def split_multi_page_scripts(text: str, count: int) -> Dict[int, str]:
+    """Page number (1..count) -> script from a multi-page answer; pages missing or empty are left out."""
+    data = parse_json_object(text)
+    pages = data.get("pages") if data else None
+    if not isinstance(pages, list):
+        return {}
+    scripts: Dict[int, str] = {}
+    for position, entry in enumerate(pages, start=1):
+        if not isinstance(entry, dict) or not isinstance(entry.get("script"), str) or not entry["script"].strip():
+            continue
+        try:
+            page = int(entry.get("page", position))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= page <= count and page not in scripts:
+            scripts[page] = entry["script"]
+    return scripts
+
+
+def generate_multi_page_scripts(
+    iteration_index: int,
+    keys: List[str],
+    jobs: Dict[str, Dict[str, Any]],
+    client_text,
+    display_name: str,
+    label: str,
+) -> Dict[str, str]:
+    """
+    Script `keys` SCRIPT_PAGES_PER_REQUEST consecutive pages (of one track) per request; returns
+    job_key -> script for the pages the answer covered. The caller scripts the rest one by one.
+    """
+    groups: List[List[str]] = []
+    open_groups: Dict[int, List[str]] = {}
+    for key in keys:
+        track_id = id(jobs[key]["track"])
+        group = open_groups.get(track_id)
+        if group is None or len(group) >= SCRIPT_PAGES_PER_REQUEST:
+            group = []
+            open_groups[track_id] = group
+            groups.append(group)
+        group.append(key)
+    groups = [group for group in groups if len(group) > 1]
+    scripts: Dict[str, str] = {}
+    if not groups:
+        return scripts
+
+    requests = [build_multi_script_request([jobs[key] for key in group], client_text) for group in groups]
+    job_done = run_batch(client_text, SCRIPT_MODEL, requests, display_name, stage="script", label=label)
+    if job_done is None:
+        return scripts
+    inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
+    for group, inline_resp in zip(groups, inline_responses):
+        if not inline_resp.response:
+            print(f"[WARN] No multi-page script response for {group[0]}..{group[-1]}, error: {inline_resp.error}")
+            continue
+        pages = split_multi_page_scripts(extract_first_text(inline_resp.response) or "", len(group))
+        missing = [key for n, key in enumerate(group, start=1) if n not in pages]
+        if missing:
+            print(f"[WARN] Multi-page script answer lacks {len(missing)} of {len(group)} page(s); scripting those one by one.")
+        for n, key in enumerate(group, start=1):
+            if n in pages:
+                scripts[key] = pages[n]
+                mark_progress()
+                save_script(jobs[key], iteration_index, key, pages[n])
+    METRICS.inc("multi_page_scripts_total", len(scripts), "Scripts written by multi-page requests")
+    return scripts
+
+
+def apply_script_patch(script_text: str, patch: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Apply {"edits": [{"find", "replace"}]} to a script; None if any edit does not match exactly once."""
+    if patch is None or not isinstance(patch.get("edits"), list):
+        return None
+    for edit in patch["edits"]:
+        if not isinstance(edit, dict):
+            return None
+        find, replace = edit.get("find"), edit.get("replace", "")
+        if not isinstance(find, str) or not find or not isinstance(replace, str):
+            return None
+        if script_text.count(find) != 1:
+            return None
+        script_text = script_text.replace(find, replace, 1)
+    return script_text
+
+
+def revise_scripts(
+    iteration_index: int,
+    keys: List[str],
+    jobs: Dict[str, Dict[str, Any]],
+    client_text,
+    feedback: Dict[str, Optional[str]],
+    previous: Dict[str, str],
+    display_name: str,
+    label: str,
+) -> Dict[str, str]:
+    """Patch the previous iteration's scripts; returns job_key -> revised script for the patches that applied."""
+    requests = [build_script_request(jobs[key], client_text, feedback.get(key), previous[key]) for key in keys]
+    revised: Dict[str, str] = {}
+    job_done = run_batch(client_text, SCRIPT_MODEL, requests, display_name, stage="script", label=label)
+    if job_done is None:
+        return revised
+    inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
+    for key, inline_resp in zip(keys, inline_responses):
+        if not inline_resp.response:
+            print(f"[WARN] No script patch for {key}, error: {inline_resp.error}")
+            continue
+        patched = apply_script_patch(previous[key], parse_json_object(extract_first_text(inline_resp.response) or ""))
+        if patched is None or not patched.strip():
+            print(f"[WARN] Script patch for {key} did not apply; rewriting the script instead.")
+            continue
+        revised[key] = patched
+    return revised
+
 
-        # =====================================
-        # Evaluate baseline folder (INIT or outK)
-        # =====================================
-        baseline_log_path = os.path.join(baseline_folder, "eval_log.tsv")
-        evaluate_folder(
-            baseline_folder,
-            baseline_iter_index,
-            images,
+def generate_scripts(
+    iteration_index: int,
+    chunk_keys: List[str],
+    jobs: Dict[str, Dict[str, Any]],
+    client_text,
+    feedback: Dict[str, Optional[str]],
+    display_name: str,
+    label: str,
+) -> Dict[str, str]:
+    """
+    Return job_key -> script for the chunk, loading saved scripts and generating the rest.
+    In refinement rounds (SCRIPT_REVISION_MODE = "patch") pages with a previous script and
+    feedback are revised with edits first; pages whose patch fails are rewritten in full.
+    """
+    scripts: Dict[str, str] = {}
+    full_keys: List[str] = []
+    patch_keys: List[str] = []
+    previous: Dict[str, str] = {}
+
+    for key in chunk_keys:
+        job = jobs[key]
+        spath = script_path_for(job["base"], iteration_index, job["track"]["scripts_dir"])
+        cached_script = read_cached_script(spath, key)
+        if cached_script.strip():
+            scripts[key] = cached_script
+            continue
+        if SCRIPT_REVISION_MODE == "patch" and iteration_index > 0 and feedback.get(key):
+            prev_index = latest_script_index(job, iteration_index - 1)
+            if prev_index is not None:
+                prev_path = script_path_for(job["base"], prev_index, job["track"]["scripts_dir"])
+                prev_script = read_cached_script(prev_path, key)
+                if prev_script.strip():
+                    previous[key] = prev_script
+                    patch_keys.append(key)
+                    continue
+        full_keys.append(key)
+
+    if patch_keys:
+        revised = revise_scripts(
+            iteration_index,
+            patch_keys,
+            jobs,
             client_text,
-            suggestions_map,
-            last_results,
-            baseline_log_path,
+            feedback,
+            previous,
+            f"{display_name}-patch",
+            f"{label} (patch)",
         )
+        for key in patch_keys:
+            if key not in revised:
+                METRICS.inc("script_revisions_total", 1, "Refinement scripts by revision method", method="full_fallback")
+                full_keys.append(key)
+                continue
+            METRICS.inc("script_revisions_total", 1, "Refinement scripts by revision method", method="patch")
+            scripts[key] = revised[key]
+            mark_progress()
+            save_script(jobs[key], iteration_index, key, revised[key])
+
+    multi_keys = [key for key in full_keys if not feedback.get(key)]
+    if SCRIPT_PAGES_PER_REQUEST > 1 and len(multi_keys) > 1:
+        grouped = generate_multi_page_scripts(
+            iteration_index, multi_keys, jobs, client_text, f"{display_name}-multi", f"{label} (multi-page)"
+        )
+        scripts.update(grouped)
+        full_keys = [key for key in full_keys if key not in grouped]
+
+    if not full_keys:
+        return scripts
+
+    script_inline_requests = [
+        build_script_request(jobs[key], client_text, feedback.get(key))
+        for key in full_keys
+    ]
+    script_job_done = run_batch(
+        client_text,
+        SCRIPT_MODEL,
+        script_inline_requests,
+        display_name,
+        stage="script",
+        label=label,
+    )
+    if script_job_done is None:
+        return scripts
+
+    s_inline_responses = (
+        script_job_done.dest.inlined_responses or []
+        if script_job_done.dest
+        else []
+    )
+    if not s_inline_responses:
+        print("[WARN] No inline responses for script batch.")
+    for key, inline_resp in zip(full_keys, s_inline_responses):
+        if not inline_resp.response:
+            print(f"[WARN] No script response for {key}, error: {inline_resp.error}")
+            continue
+        script_text = extract_first_text(inline_resp.response) or ""
+        if not script_text.strip():
+            print(f"[WARN] Empty script for {key}")
+            continue
+        scripts[key] = script_text
+        mark_progress()
+        save_script(jobs[key], iteration_index, key, script_text)
+    return scripts
 
-        # =====================================
-        # Iterative Refinement Rounds
-        # =====================================
-        start_iteration = baseline_iter_index + 1
 
-        for iteration in range(start_iteration, MAX_ITERATIONS + 1):
-            output_dir = os.path.join(BASE_DIR, f"out{iteration + 1}")
-            os.makedirs(output_dir, exist_ok=True)
-            print(f"\n=== Iteration {iteration}: Regeneration -> {output_dir} ===")
+def composite_text_regions(job: Dict[str, Any], img: Image.Image) -> Tuple[Image.Image, str]:
+    """
+    REGION_COMPOSITE: the generated page with everything outside text regions reverted to the
+    original artwork (text boxes from the source analysis, plus bubbles found in the original).
+    Returns (image, note for the log line).
+    """
+    boxes = []
+    analysis = load_source_analysis(job)
+    if analysis:
+        for element in json.loads(analysis).get("elements", []):
+            if isinstance(element, dict) and isinstance(element.get("box"), list) and len(element["box"]) == 4:
+                boxes.append(element["box"])
+    import region_compose  # NumPy is only loaded when REGION_COMPOSITE is on
 
-            if iteration == 1:
-                prev_output_dir = INIT_OUTPUT_DIR
-            else:
-                prev_output_dir = os.path.join(BASE_DIR, f"out{iteration}")
-            if not os.path.isdir(prev_output_dir):
-                raise RuntimeError(f"Expected previous output folder not found: {prev_output_dir}")
+    try:
+        with Image.open(page_sources.open_page(job["src"])) as original:
+            original.load()
+            result, stats = region_compose.composite(
+                original,
+                img,
+                boxes,
+                diff_threshold=COMPOSITE_DIFF_THRESHOLD,
+                min_overlap=COMPOSITE_MIN_OVERLAP,
+            )
+    except Exception as e:
+        print(f"[WARN] Region compositing failed for {job['base']}, keeping the generated page: {e}")
+        METRICS.inc("composite_pages_total", 1, "Generated pages by region compositing outcome", outcome="error")
+        return img, ""
+    if not stats["applied"]:
+        METRICS.inc("composite_pages_total", 1, "Generated pages by region compositing outcome", outcome="skipped")
+        return result, f" (not composited: {stats['reason']})"
+    METRICS.inc("composite_pages_total", 1, "Generated pages by region compositing outcome", outcome="composited")
+    METRICS.inc(
+        "composite_reverted_blobs_total",
+        stats.get("blobs_reverted", 0),
+        "Changed areas outside text regions reverted to the original artwork",
+    )
+    if stats["reverted"] <= 0:
+        return result, ""
+    return result, f" (composited, {stats['reverted']:.1%} of the page reverted)"
+
+
+def generate_images(
+    iteration_index: int,
+    chunk_keys: List[str],
+    scripts: Dict[str, str],
+    jobs: Dict[str, Dict[str, Any]],
+    client_image,
+    feedback: Dict[str, Optional[str]],
+    display_name: str,
+    label: str,
+    final: bool = False,
+    variant_counts: Optional[Dict[str, int]] = None,
+):
+    """
+    Render the chunk's scripts into output_dir_for(track, iteration_index), or into the
+    track's final folder at IMAGE_RESOLUTION when `final` (progressive mode).
+    variant_counts overrides CANDIDATES_PER_FAILING_PAGE per job in refinement rounds.
+    """
+    if final or not PROGRESSIVE_RESOLUTION:
+        image_size = IMAGE_RESOLUTION
+    else:
+        image_size = DRAFT_IMAGE_RESOLUTION
+    fan_out = iteration_index > 0 and not final
+    inline_requests = []
+    key_order: List[Tuple[str, int]] = []
+    for key in chunk_keys:
+        if key not in scripts:
+            continue
+        job = jobs[key]
+        base_prompt = job["track"]["image_prompt"]
+        prompt_text = build_image_edit_prompt(scripts[key], feedback.get(key), base_prompt)
+        prompt_text, cached_content = cache_static_prefix(client_image, IMAGE_MODEL, base_prompt, prompt_text)
+        variants = max(1, (variant_counts or {}).get(key, CANDIDATES_PER_FAILING_PAGE)) if fan_out else 1
+        for variant in range(1, variants + 1):
+            request = build_image_inline_request(job["src"], prompt_text, cached_content, image_size)
+            if variants > 1:
+                request["config"]["seed"] = iteration_index * 100 + variant
+            inline_requests.append(request)
+            key_order.append((key, variant))
+    for folder in dict.fromkeys(
+        os.path.dirname(candidate_path_for(jobs[k], iteration_index, 2)) for k, variant in key_order if variant > 1
+    ):
+        os.makedirs(folder, exist_ok=True)
+
+    if not inline_requests:
+        print(f"[WARN] No inline image requests for {label}.")
+        return
+
+    job_done = run_batch(
+        client_image,
+        IMAGE_MODEL,
+        inline_requests,
+        display_name,
+        stage="final" if final else "image",
+        label=label,
+    )
+    if job_done is None:
+        return
+
+    inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
+    if not inline_responses:
+        print("[WARN] No inline responses for image batch.")
+    for (key, variant), inline_resp in zip(key_order, inline_responses):
+        job = jobs[key]
+        out_name = f"{job['base']}.jpg"
+        if not inline_resp.response:
+            print(f"[WARN] No image response for {key}, error: {inline_resp.error}")
+            continue
+        # debug for safety block
+        pf = getattr(inline_resp.response, "prompt_feedback", None)
+        if pf and getattr(pf, "block_reason", None):
+            print(f"=== DEBUG inline_resp.response for {key} ===")
+            print(repr(inline_resp.response))
+            print("=== END DEBUG ===")
+
+        out_bytes = extract_first_image_bytes(inline_resp.response)
+        if not out_bytes:
+            print(f"[WARN] No image data in response for {key}")
+            continue
+        out_dir = job["track"]["final_dir"] if final else output_dir_for(job["track"], iteration_index)
+        out_path = os.path.join(out_dir, out_name)
+        if variant > 1 and os.path.isfile(out_path):
+            # Extra variants go next to the page; the first one that arrives is the page's output
+            out_path = candidate_path_for(job, iteration_index, variant)
+            out_name = f"{CANDIDATES_DIR_NAME}/{os.path.basename(out_path)}"
+        ok = False
+        note = ""
+        try:
+            img = Image.open(BytesIO(out_bytes)).convert("RGB")
+            if REGION_COMPOSITE:
+                img, note = composite_text_regions(job, img)
+            output_index.save_image(img, out_path, format="JPEG", quality=95)
+            ok = True
+        except UnidentifiedImageError:
+            ok = False
+        except Exception as save_e:
+            print(f"[WARN] Exception saving image {key}: {save_e}")
+            ok = False
+        if ok:
+            print(f"[OK] Saved translated image: {out_name}{note}")
+            mark_progress()
+        else:
+            print(f"[WARN] Failed to save image: {out_name}")
 
-            # 1) Copy already-passing images (O) forward
-            for base in all_bases:
-                if last_results.get(base, "X") != "O":
-                    continue
-                prev_image_path = os.path.join(prev_output_dir, f"{base}.jpg")
-                new_image_path = os.path.join(output_dir, f"{base}.jpg")
-                if not os.path.isfile(prev_image_path):
-                    print(f"[WARN] Passing image missing in {prev_output_dir}: {base}.jpg")
-                    continue
-                if os.path.isfile(new_image_path):
-                    continue
-                shutil.copy2(prev_image_path, new_image_path)
-                print(f"[COPY] {base}.jpg passed, carrying over to {os.path.basename(output_dir)}")
-
-            # 2) Regenerate failing images with new scripts for this iteration
-            regen_attempt = 0
-            while True:
-                existing_bases = {
-                    normalized_base_from_filename(f) for f in list_images(output_dir)
-                }
-                pending_bases = [
-                    b for b in all_bases
-                    if b not in existing_bases and last_results.get(b, "X") != "O"
-                ]
-                if not pending_bases:
-                    print(f"Iteration {iteration}: all pages have images in {output_dir}.")
-                    break
-
-                regen_attempt += 1
-                if regen_attempt > MAX_STAGE_RETRIES:
-                    raise RuntimeError(
-                        f"Iteration {iteration}: could not generate images for pages: {pending_bases} "
-                        f"after {MAX_STAGE_RETRIES} attempts."
-                    )
-
-                print(
-                    f"\nIteration {iteration} - Regeneration attempt {regen_attempt}: "
-                    f"{len(pending_bases)} pending page(s)."
-                )
 
-                jobs_files = [base_to_imgname[b] for b in pending_bases]
-                jobs_paths = [os.path.join(INPUT_DIR, base_to_imgname[b]) for b in pending_bases]
-
-                batch_id = 0
-                for i in range(0, len(jobs_files), BATCH_SIZE):
-                    batch_files = jobs_files[i : i + BATCH_SIZE]
-                    batch_paths = jobs_paths[i : i + BATCH_SIZE]
-                    print(f"Regenerating batch {batch_id} with {len(batch_files)} image(s): {batch_files}")
-
-                    # Script generation for this iteration (per-page, per-iteration script)
-                    script_inline_requests = []
-                    script_img_names: List[str] = []
-                    scripts_for_batch: Dict[str, str] = {}
-
-                    for img_name, img_path in zip(batch_files, batch_paths):
-                        base = normalized_base_from_filename(img_name)
-                        spath = script_path_for(base, iteration)
-
-                        if os.path.isfile(spath):
-                            try:
-                                with open(spath, "r", encoding="utf-8") as f:
-                                    cached_script = f.read()
-                            except Exception as e:
-                                print(f"[WARN] Failed to read script for regen image {img_name} from {spath}: {e}")
-                                cached_script = ""
-                            if cached_script.strip():
-                                scripts_for_batch[img_name] = cached_script
-                                continue
-
-                        suggestions = suggestions_map.get(base, [])
-                        if suggestions:
-                            add_text = " ".join(
-                                s.replace("\n", " ").strip() for s in suggestions if s.strip()
-                            )
-                        else:
-                            add_text = None
-                        prompt_text = build_script_prompt(add_text)
-                        contents = [
-                            {
-                                "role": "user",
-                                "parts": [
-                                    {"text": prompt_text},
-                                    image_part_dict(img_path),
-                                ],
-                            }
-                        ]
-                        script_inline_requests.append(
-                            {
-                                "contents": contents,
-                                "config": {"response_modalities": ["TEXT"]},
-                            }
-                        )
-                        script_img_names.append(img_name)
-
-                    if script_inline_requests:
-                        try:
-                            script_job = client_text.batches.create(
-                                model="models/gemini-3-pro-preview",
-                                src=script_inline_requests,
-                                config={
-                                    "display_name": f"manga-script-regen-{iteration}-{regen_attempt:02d}-{batch_id:03d}"
-                                },
-                            )
-                        except Exception as e:
-                            print(f"[ERROR] Script regen batch creation failed (batch {batch_id}): {e}")
-                            batch_id += 1
-                            continue
-
-                        script_job_done = None
-                        while True:
-                            script_status = client_text.batches.get(name=script_job.name)
-                            sstate = script_status.state.name
-                            if sstate in {
-                                "JOB_STATE_SUCCEEDED",
-                                "JOB_STATE_FAILED",
-                                "JOB_STATE_CANCELLED",
-                                "JOB_STATE_EXPIRED",
-                            }:
-                                script_job_done = script_status
-                                break
-                            print(f"  - Script regen batch {batch_id} status: {sstate} (polling...)")
-                            time.sleep(POLL_INTERVAL_SEC)
-
-                        if not script_job_done or script_job_done.state.name != "JOB_STATE_SUCCEEDED":
-                            serr = script_job_done.state.name if script_job_done else "Unknown"
-                            print(f"[ERROR] Script regen batch {batch_id} ended with state: {serr}")
-                            batch_id += 1
-                            continue
-
-                        s_inline_responses = (
-                            script_job_done.dest.inlined_responses or []
-                            if script_job_done.dest
-                            else []
-                        )
-                        if not s_inline_responses:
-                            print("[WARN] No responses in script regen batch.")
-                        for img_name, inline_resp in zip(script_img_names, s_inline_responses):
-                            if not inline_resp.response:
-                                print(
-                                    f"[WARN] No script response for regen image {img_name}, error: {inline_resp.error}"
-                                )
-                                continue
-                            script_text = extract_first_text(inline_resp.response) or ""
-                            if not script_text.strip():
-                                print(f"[WARN] Empty script for regen image {img_name}")
-                                continue
-                            scripts_for_batch[img_name] = script_text
-                            base = normalized_base_from_filename(img_name)
-                            spath = script_path_for(base, iteration)
-                            try:
-                                with open(spath, "w", encoding="utf-8") as f:
-                                    f.write(script_text)
-                            except Exception as write_e:
-                                print(f"[WARN] Failed to save script for regen image {img_name} to {spath}: {write_e}")
-
-                    if not scripts_for_batch:
-                        print(f"[WARN] No scripts generated for regen batch {batch_id}, skipping image generation.")
-                        batch_id += 1
-                        continue
+def generate_outputs(
+    iteration_index: int,
+    job_keys: List[str],
+    jobs: Dict[str, Dict[str, Any]],
+    client_text,
+    client_image,
+    suggestions_map: Dict[str, List[str]],
+    last_results: Dict[str, str],
+    variant_counts: Optional[Dict[str, int]] = None,
+):
+    """
+    Stage 1 (iteration_index = 0 -> out1) or one regeneration round (iteration_index >= 1).
+    Retries until every job in job_keys has an output image, or MAX_STAGE_RETRIES is hit.
+    """
+    stage_name = "Stage 1" if iteration_index == 0 else f"Iteration {iteration_index}"
+    folders = list(dict.fromkeys(output_dir_for(jobs[k]["track"], iteration_index) for k in job_keys))
+    feedback = prepare_feedback(iteration_index, job_keys, jobs, client_text, suggestions_map)
+    attempt = 0
+    while True:
+        pending_keys = jobs_without_output(job_keys, jobs, iteration_index)
+        record_page_states(last_results, pending_count=len(pending_keys))
+        if not pending_keys:
+            if iteration_index == 0:
+                print(f"\n=== Stage 1: All images translated into {', '.join(folders)} ===")
+            else:
+                print(f"Iteration {iteration_index}: all pages have images in {', '.join(folders)}.")
+            break
 
-                    inline_requests = []
-                    out_file_names: List[str] = []
-                    for img_name, img_path in zip(batch_files, batch_paths):
-                        if img_name not in scripts_for_batch:
-                            continue
-                        base = normalized_base_from_filename(img_name)
-                        script_text = scripts_for_batch[img_name]
-                        add_instructions = " ".join(
-                            s.replace("\n", " ").strip() for s in suggestions_map.get(base, []) if s.strip()
-                        )
-                        prompt_text = build_image_edit_prompt(
-                            script_text,
-                            add_instructions if add_instructions else None,
-                        )
-                        inline_requests.append(build_image_inline_request(img_path, prompt_text))
-                        out_file_names.append(f"{base}.jpg")
-
-                    if not inline_requests:
-                        print(f"[WARN] No inline image requests for regen batch {batch_id}.")
-                        batch_id += 1
-                        continue
+        attempt += 1
+        if attempt > 1:
+            METRICS.inc("retries_total", 1, "Stage retry attempts", stage="init" if iteration_index == 0 else "regen")
+        if attempt > MAX_STAGE_RETRIES:
+            raise RuntimeError(
+                f"{stage_name}: Could not generate output images for pages: {pending_keys} "
+                f"after {MAX_STAGE_RETRIES} attempts."
+            )
 
-                    try:
-                        job = client_image.batches.create(
-                            model="models/gemini-3-pro-image-preview",
-                            src=inline_requests,
-                            config={
-                                "display_name": f"manga-regenerate-{iteration}-{regen_attempt:02d}-{batch_id:03d}"
-                            },
-                        )
-                    except Exception as e:
-                        print(f"[ERROR] Image regen batch {batch_id} creation failed: {e}")
-                        batch_id += 1
-                        continue
+        print(f"\n=== {stage_name} Attempt {attempt}: Translating {len(pending_keys)} pending image(s) ===")
 
-                    job_done = None
-                    while True:
-                        job_status = client_image.batches.get(name=job.name)
-                        state = job_status.state.name
-                        if state in {
-                            "JOB_STATE_SUCCEEDED",
-                            "JOB_STATE_FAILED",
-                            "JOB_STATE_CANCELLED",
-                            "JOB_STATE_EXPIRED",
-                        }:
-                            job_done = job_status
-                            break
-                        print(f"  - Image regen batch {batch_id} status: {state} (polling...)")
-                        time.sleep(POLL_INTERVAL_SEC)
-
-                    if job_done and job_done.state.name == "JOB_STATE_SUCCEEDED":
-                        inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
-                        if not inline_responses:
-                            print("[WARN] No responses in image regen batch.")
-                        for out_name, inline_resp in zip(out_file_names, inline_responses):
-                            if not inline_resp.response:
-                                print(
-                                    f"[WARN] No image response for regen {out_name}, error: {inline_resp.error}"
-                                )
-                                continue
-                            pf = getattr(inline_resp.response, "prompt_feedback", None)
-                            if pf and getattr(pf, "block_reason", None):
-                                print(f"=== DEBUG inline_resp.response for regen {out_name} ===")
-                                print(repr(inline_resp.response))
-                                print("=== END DEBUG ===")
-                            out_bytes = extract_first_image_bytes(inline_resp.response)
-                            if not out_bytes:
-                                print(f"[WARN] No image data for regen {out_name}")
-                                continue
-                            out_path = os.path.join(output_dir, out_name)
-                            ok = False
-                            try:
-                                img = Image.open(BytesIO(out_bytes)).convert("RGB")
-                                img.save(out_path, format="JPEG", quality=95)
-                                ok = True
-                            except UnidentifiedImageError:
-                                ok = False
-                            except Exception as save_e:
-                                print(f"[WARN] Exception saving regen image {out_name}: {save_e}")
-                                ok = False
-                            if ok:
-                                print(f"[OK] Regenerated image saved: {out_name}")
-                            else:
-                                print(f"[WARN] Failed to save regenerated image: {out_name}")
-                    else:
-                        err_state = job_done.state.name if job_done else "Unknown"
-                        print(f"[ERROR] Image regen batch {batch_id} ended with state: {err_state}")
-                    batch_id += 1
-
-            # 3) Evaluate the new output folder
-            eval_log_path = os.path.join(output_dir, "eval_log.tsv")
-            evaluate_folder(
-                output_dir,
-                iteration,
-                images,
+        for batch_id, i in enumerate(range(0, len(pending_keys), BATCH_SIZE)):
+            chunk_keys = pending_keys[i : i + BATCH_SIZE]
+            print(f"Processing batch {batch_id} with {len(chunk_keys)} image(s): {chunk_keys}")
+            if iteration_index == 0:
+                script_name = f"manga-script-init-{attempt:02d}-{batch_id:03d}"
+                image_name = f"manga-init-{attempt:02d}-{batch_id:03d}"
+            else:
+                script_name = f"manga-script-regen-{iteration_index}-{attempt:02d}-{batch_id:03d}"
+                image_name = f"manga-regenerate-{iteration_index}-{attempt:02d}-{batch_id:03d}"
+
+            scripts = generate_scripts(
+                iteration_index,
+                chunk_keys,
+                jobs,
                 client_text,
-                suggestions_map=suggestions_map,
-                last_results=last_results,
-                log_path=eval_log_path,
+                feedback,
+                script_name,
+                label=f"Script batch {batch_id}",
+            )
+            if not scripts:
+                print(f"[WARN] No scripts available for batch {batch_id}, skipping image generation.")
+                continue
+            generate_images(
+                iteration_index,
+                chunk_keys,
+                scripts,
+                jobs,
+                client_image,
+                feedback,
+                image_name,
+                label=f"Image batch {batch_id}",
+                variant_counts=variant_counts,
+            )
+
+
+def render_final(
+    iteration_index: int,
+    job_keys: List[str],
+    jobs: Dict[str, Dict[str, Any]],
+    client_image,
+    last_results: Dict[str, str],
+):
+    """
+    Progressive mode: re-render every page judged O once at IMAGE_RESOLUTION, from the
+    script (and feedback) that produced its passing draft, into the track's final folder.
+    """
+    passing = [k for k in job_keys if last_results.get(k) == "O"]
+    for folder in dict.fromkeys(jobs[k]["track"]["final_dir"] for k in passing):
+        os.makedirs(folder, exist_ok=True)
+
+    scripts: Dict[str, str] = {}
+    feedback: Dict[str, Optional[str]] = {}
+    for key in passing:
+        job = jobs[key]
+        script_index = latest_script_index(job, iteration_index)
+        if script_index is None:
+            print(f"[WARN] No script found for passing page {key}; skipping its final render.")
+            continue
+        scripts_dir = job["track"]["scripts_dir"]
+        scripts[key] = read_cached_script(script_path_for(job["base"], script_index, scripts_dir), key)
+        if script_index > 0:
+            feedback[key] = read_cached_script(feedback_path_for(job["base"], script_index, scripts_dir), key).strip() or None
+
+    def final_path(key: str) -> str:
+        return os.path.join(jobs[key]["track"]["final_dir"], f"{jobs[key]['base']}.jpg")
+
+    for attempt in range(1, MAX_STAGE_RETRIES + 1):
+        pending = [k for k in passing if k in scripts and not output_index.is_intact(final_path(k))]
+        if not pending:
+            break
+        print(f"\n=== Final render attempt {attempt}: {len(pending)} passing page(s) at {IMAGE_RESOLUTION} ===")
+        if attempt > 1:
+            METRICS.inc("retries_total", 1, "Stage retry attempts", stage="final")
+        for batch_id, i in enumerate(range(0, len(pending), BATCH_SIZE)):
+            generate_images(
+                iteration_index,
+                pending[i : i + BATCH_SIZE],
+                scripts,
+                jobs,
+                client_image,
+                feedback,
+                f"manga-final-{attempt:02d}-{batch_id:03d}",
+                label=f"Final image batch {batch_id}",
+                final=True,
             )
 
-            if all(res == "O" for res in last_results.values()):
-                print(f"All images passed at iteration {iteration}. Stopping early.")
+    missing = [k for k in passing if not output_index.is_intact(final_path(k))]
+    if missing:
+        print(f"[WARN] {len(missing)} passing page(s) have no final render; their drafts remain in the outN folders.")
+
+
+def stitch_tiled_pages(jobs: Dict[str, Dict[str, Any]], job_keys: List[str], derived: Dict[str, Optional[str]]):
+    """
+    TILING: rebuild the pages whose tiles are among `job_keys` in every round folder where one
+    of their tiles was rendered (tiles not rendered there use their newest earlier output), and
+    in the final folder once every tile has a final render (copied-through tiles use their copy).
+    """
+    wanted = {(id(jobs[k]["track"]), jobs[k]["page"]) for k in job_keys if "page" in jobs[k]}
+    pages: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+    for job in jobs.values():
+        if "page" in job and (id(job["track"]), job["page"]) in wanted:
+            pages.setdefault((id(job["track"]), job["page"]), []).append(job)
+
+    stitched = 0
+    for tiles in pages.values():
+        track, page, plan = tiles[0]["track"], tiles[0]["page"], tiles[0]["tile_plan"]
+        targets: List[Tuple[str, List[Optional[str]]]] = []
+        latest: List[Optional[str]] = [None] * len(tiles)
+        for iteration_index in range(0, MAX_ITERATIONS + 1):
+            folder = output_dir_for(track, iteration_index)
+            if not os.path.isdir(folder):
                 break
+            rendered = False
+            for i, job in enumerate(tiles):
+                path = os.path.join(folder, f"{job['base']}.jpg")
+                if output_index.is_intact(path):
+                    latest[i] = path
+                    rendered = True
+            if rendered:
+                targets.append((folder, list(latest)))
+        finals: List[Optional[str]] = []
+        for i, job in enumerate(tiles):
+            path = os.path.join(track["final_dir"], f"{job['base']}.jpg")
+            copied = job["key"] in derived and derived[job["key"]] is None
+            finals.append(path if output_index.is_intact(path) else latest[i] if copied else None)
+        if any(path and os.path.dirname(path) == track["final_dir"] for path in finals):
+            targets.append((track["final_dir"], finals))
+
+        for folder, paths in targets:
+            if any(path is None for path in paths):
+                continue
+            out_path = os.path.join(folder, f"{page}.jpg")
+            if output_index.is_intact(out_path) and os.path.getmtime(out_path) >= max(os.path.getmtime(p) for p in paths):
+                continue
+            try:
+                images = [Image.open(path) for path in paths]
+                try:
+                    stitched_img = page_tiles.stitch(plan["size"], plan["boxes"], images, plan.get("keep", []), plan.get("columns", 0))
+                    output_index.save_image(stitched_img, out_path, format="JPEG", quality=95)
+                finally:
+                    for img in images:
+                        img.close()
+                stitched += 1
+            except Exception as e:
+                print(f"[WARN] Failed to stitch {page} in {folder}: {e}")
+    if stitched:
+        print(f"[TILES] Stitched {stitched} page image(s) from their tiles.")
+        METRICS.inc("stitched_pages_total", stitched, "Page images reassembled from rendered tiles")
 
-    finally:
+
+def carry_forward_passing(
+    iteration: int,
+    job_keys: List[str],
+    jobs: Dict[str, Dict[str, Any]],
+    last_results: Dict[str, str],
+    stalled: Optional[set] = None,
+):
+    """Copy already-passing (O), stalled and deferred images from the previous iteration's folder into this one."""
+    for key in job_keys:
+        if last_results.get(key, "X") != "O" and key not in (stalled or ()):
+            continue
+        job = jobs[key]
+        prev_output_dir = output_dir_for(job["track"], iteration - 1)
+        output_dir = output_dir_for(job["track"], iteration)
+        prev_image_path = os.path.join(prev_output_dir, f"{job['base']}.jpg")
+        new_image_path = os.path.join(output_dir, f"{job['base']}.jpg")
+        if not output_index.is_intact(prev_image_path):
+            print(f"[WARN] Passing image missing in {prev_output_dir}: {job['base']}.jpg")
+            continue
+        if output_index.is_intact(new_image_path):
+            continue
+        output_index.copy_image(prev_image_path, new_image_path)
+        state = "passed" if last_results.get(key, "X") == "O" else "not regenerated"
+        print(f"[COPY] {key}.jpg {state}, carrying over to {os.path.basename(output_dir)}")
+
+
+# =========================================
+# Per-page convergence tracking (stalled pages, cost vs. improvement)
+# =========================================
+def new_page_stats(job_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    return {
+        key: {"renders": 0, "rounds": 0, "fail_reasons": [], "passed_at": None, "stalled_at": None, "stall_reason": ""}
+        for key in job_keys
+    }
+
+
+def reason_similarity(a: str, b: str) -> float:
+    norm_a = re.sub(r"\s+", " ", a or "").strip().casefold()
+    norm_b = re.sub(r"\s+", " ", b or "").strip().casefold()
+    return difflib.SequenceMatcher(None, norm_a, norm_b).ratio()
+
+
+def update_convergence(
+    iteration_index: int,
+    results: Dict[str, Tuple[str, str]],
+    page_stats: Dict[str, Dict[str, Any]],
+) -> List[str]:
+    """Record one round of verdicts; returns the pages that became stalled in this round."""
+    newly_stalled: List[str] = []
+    for key, (ox, reason) in results.items():
+        stats = page_stats[key]
+        if ox == "O":
+            if stats["passed_at"] is None:
+                stats["passed_at"] = iteration_index
+            stats["fail_reasons"] = []
+            stats["stalled_at"] = None
+            continue
+        stats["fail_reasons"].append(reason)
+        if stats["stalled_at"] is not None:
+            continue
+        streak = stats["fail_reasons"][-STALL_ROUNDS:] if STALL_ROUNDS > 0 else []
+        if (
+            STALL_ROUNDS > 0
+            and len(streak) == STALL_ROUNDS
+            and all(reason_similarity(a, b) >= STALL_SIMILARITY for a, b in zip(streak, streak[1:]))
+        ):
+            stats["stall_reason"] = f"same failure {STALL_ROUNDS}x"
+        elif MAX_PAGE_ROUNDS > 0 and stats["rounds"] >= MAX_PAGE_ROUNDS:
+            stats["stall_reason"] = f"{MAX_PAGE_ROUNDS} round cap"
+        else:
+            continue
+        stats["stalled_at"] = iteration_index
+        newly_stalled.append(key)
+        METRICS.inc("stalled_pages_total", 1, "Pages that stopped regenerating because they stalled")
+    for key in newly_stalled:
+        print(f"[STALL] {key}: {page_stats[key]['stall_reason']}; no further regeneration.")
+    return newly_stalled
+
+
+def plan_variants(failing_keys: List[str], stalled_failing: int) -> Dict[str, int]:
+    """Variants per failing page; renders freed by stalled pages are spread over the others."""
+    base = max(1, CANDIDATES_PER_FAILING_PAGE)
+    counts = {key: base for key in failing_keys}
+    if not REINVEST_STALLED_CAPACITY or not failing_keys:
+        return counts
+    spare = stalled_failing * base
+    while spare > 0:
+        grew = False
+        for key in failing_keys:
+            if spare <= 0:
+                break
+            if counts[key] < max(base, MAX_CANDIDATES_PER_PAGE):
+                counts[key] += 1
+                spare -= 1
+                grew = True
+        if not grew:
+            break
+    return counts
+
+
+def write_page_report(
+    jobs: Dict[str, Dict[str, Any]],
+    page_stats: Dict[str, Dict[str, Any]],
+    last_results: Dict[str, str],
+    rounds: List[Dict[str, Any]],
+):
+    """Per-page TSV in BASE_DIR plus a per-round cost vs. improvement summary on stdout."""
+    if rounds:
+        print("\n=== Cost vs. improvement per round ===")
+        print("iteration\trenders\tnewly_passed\tpassed\tstalled\trenders_per_new_pass")
+        for r in rounds:
+            per_pass = f"{r['renders'] / r['newly_passed']:.1f}" if r["newly_passed"] else "-"
+            print(f"{r['iteration']}\t{r['renders']}\t{r['newly_passed']}\t{r['passed']}\t{r['stalled']}\t{per_pass}")
+    if not PAGE_REPORT_NAME:
+        return
+    name = PAGE_REPORT_NAME
+    if WORK_QUEUE:  # one report per worker
+        import work_queue
+
+        stem, ext = os.path.splitext(name)
+        name = f"{stem}.{re.sub(r'[^A-Za-z0-9_.-]+', '_', WORKER_ID or work_queue.default_worker_id())}{ext}"
+    path = os.path.join(BASE_DIR, name)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("job\tlang\tbase_name\tresult\tpassed_at\tstalled_at\tstall_reason\trounds\trenders\n")
+            for key, stats in page_stats.items():
+                job = jobs[key]
+                f.write(
+                    f"{key}\t{job['track']['lang']}\t{job['base']}\t{last_results.get(key, 'X')}\t"
+                    f"{'' if stats['passed_at'] is None else stats['passed_at']}\t"
+                    f"{'' if stats['stalled_at'] is None else stats['stalled_at']}\t"
+                    f"{stats['stall_reason']}\t{stats['rounds']}\t{stats['renders']}\n"
+                )
+        print(f"Per-page report written to: {path}")
+    except Exception as e:
+        print(f"[WARN] Failed to write page report {path}: {e}")
+
+
+# =========================================
+# Budget: cost estimates and refinement scheduling
+# =========================================
+def sample_request_cost(model: str, stage: str, prefix: str, text: str, images: int, config: Dict[str, Any]) -> float:
+    """Cost of a representative request, with the static prefix cached the way cache_static_prefix would."""
+    cached_tokens = 0
+    if text.startswith(prefix) and prefix_cacheable(model, prefix):
+        text = text[len(prefix) :]
+        cached_tokens = estimate_tokens(prefix)
+    parts: List[Dict[str, Any]] = [{"text": text}] + [{"inline_data": {}} for _ in range(images)]
+    return run_budget.estimate_request_cost(model, stage, {"contents": [{"parts": parts}], "config": config}, cached_tokens)
+
+
+def sample_costs(track: Dict[str, Any]) -> Dict[str, float]:
+    """Per-request cost of each stage for a typical page of `track` (nothing is sent)."""
+    script = "x" * (run_budget.TYPICAL_SCRIPT_TOKENS * 4)
+    feedback = "x" * (FEEDBACK_TOKEN_BUDGET * 4)
+    text_config = {"response_modalities": ["TEXT"]}
+    template = track["script_prompt_analysis" if SOURCE_ANALYSIS else "script_prompt"]
+    script_images = 0 if SOURCE_ANALYSIS and not SCRIPT_IMAGE_WITH_ANALYSIS else 1
+    draft = template + SCRIPT_TEXT_OUTPUT
+    revision = build_script_prompt(feedback, template)
+    revision_config = dict(text_config)
+    if SCRIPT_REVISION_MODE == "patch":
+        revision += SCRIPT_PATCH_INSTRUCTIONS + script
+        revision_config["response_mime_type"] = "application/json"
+    else:
+        revision += SCRIPT_TEXT_OUTPUT
+    draft_size = DRAFT_IMAGE_RESOLUTION if PROGRESSIVE_RESOLUTION else IMAGE_RESOLUTION
+    image_prompt = build_image_edit_prompt(script, feedback, track["image_prompt"])
+    costs = {
+        "script": sample_request_cost(SCRIPT_MODEL, "script", template, draft, script_images, text_config),
+        "revision": sample_request_cost(SCRIPT_MODEL, "script", template, revision, script_images, revision_config),
+        "image": sample_request_cost(
+            IMAGE_MODEL,
+            "image",
+            track["image_prompt"],
+            image_prompt,
+            1,
+            {"response_modalities": ["IMAGE"], "image_config": {"image_size": draft_size}},
+        ),
+        "eval": sample_request_cost(EVAL_MODEL, "eval", track["eval_prompt"], track["eval_prompt"], 2, text_config),
+    }
+    if SCRIPT_PAGES_PER_REQUEST > 1:
+        pages = SCRIPT_PAGES_PER_REQUEST
+        multi = template + SCRIPT_MULTI_PAGE_INSTRUCTIONS + "".join(f"<PAGE_{n}></PAGE_{n}>" for n in range(1, pages + 1))
+        multi_config = dict(text_config, response_mime_type="application/json")
+        costs["script"] = (
+            sample_request_cost(SCRIPT_MODEL, "script", template, multi, script_images * pages, multi_config) / pages
+        )
+    if SOURCE_ANALYSIS:
+        costs["analysis"] = sample_request_cost(ANALYSIS_MODEL, "analysis", "", SOURCE_ANALYSIS_PROMPT, 1, text_config)
+    if TRIAGE_CLASSIFY:
+        costs["triage"] = sample_request_cost(TRIAGE_MODEL, "triage", "", TRIAGE_PROMPT, 1, text_config)
+    if PROGRESSIVE_RESOLUTION:
+        costs["final"] = sample_request_cost(
+            IMAGE_MODEL,
+            "final",
+            track["image_prompt"],
+            image_prompt,
+            1,
+            {"response_modalities": ["IMAGE"], "image_config": {"image_size": IMAGE_RESOLUTION}},
+        )
+    return costs
+
+
+def observed_rounds(job_keys: List[str], jobs: Dict[str, Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Verdicts of earlier runs in this folder, one dict (job_key -> O/X) per out folder that has an eval log."""
+    tracks = list({id(jobs[k]["track"]): jobs[k]["track"] for k in job_keys}.values())
+    wanted = set(job_keys)
+    rounds: List[Dict[str, str]] = []
+    for iteration in range(0, MAX_ITERATIONS + 1):
+        verdicts: Dict[str, str] = {}
+        for track in tracks:
+            log = load_eval_log(os.path.join(output_dir_for(track, iteration), "eval_log.tsv"))
+            for base, (ox, _) in log.items():
+                key = job_key_for(track, base)
+                if key in wanted:
+                    verdicts[key] = ox
+        if not verdicts:
+            break
+        rounds.append(verdicts)
+    return rounds
+
+
+def print_cost_estimate(tracks: List[Dict[str, Any]], jobs: Dict[str, Dict[str, Any]], job_keys: List[str]):
+    """DRY_RUN: expected spend per step from page count, resolution and pass rates (observed or assumed)."""
+    costs = sample_costs(tracks[0])
+    pages = len(job_keys)
+    if pages:
+        originals = {(jobs[k]["track"]["volume_root"], jobs[k]["base"]) for k in job_keys}
+        share = len(originals) / pages  # analysis/triage run once per original page
+        for name in ("analysis", "triage"):
+            if name in costs:
+                costs[name] *= share
+    rates = run_budget.observed_pass_rates(observed_rounds(job_keys, jobs))
+    basis = "observed in earlier eval logs" if rates else "assumed (DRY_RUN_PASS_RATE)"
+    rows = run_budget.estimate_run(pages, MAX_ITERATIONS, rates or [DRY_RUN_PASS_RATE], costs, CANDIDATES_PER_FAILING_PAGE)
+
+    print("\n=== Dry run: estimated cost (nothing submitted) ===")
+    print(f"Pages in the loop: {pages}   draft resolution: {DRAFT_IMAGE_RESOLUTION if PROGRESSIVE_RESOLUTION else IMAGE_RESOLUTION}")
+    print("Per request: " + ", ".join(f"{name} ${usd:.4f}" for name, usd in costs.items()))
+    print("Pass rates per round (" + basis + "): " + ", ".join(f"{r:.0%}" for r in (rates or [DRY_RUN_PASS_RATE])))
+    print("step\trenders\tusd\texpected_passing")
+    total = 0.0
+    for row in rows:
+        total += row["usd"]
+        print(f"{row['step']}\t{row['renders']:.0f}\t{row['usd']:.2f}\t{row['expected_passing']:.1f}")
+    print(f"Estimated total: ${total:.2f} (batch pricing; select_best_outputs.py ranking not included)")
+    if BUDGET is not None and BUDGET.spent:
+        print(f"Already recorded for this folder: ${BUDGET.spent:.2f}")
+    if BUDGET_USD and (BUDGET.spent if BUDGET else 0.0) + total > BUDGET_USD:
+        print(f"[BUDGET] The estimate exceeds BUDGET_USD (${BUDGET_USD:.2f}); the run would stop early.")
+
+
+def expected_gain(stats: Dict[str, Any]) -> float:
+    """Rough value of one more round: pages refined less often, and whose failure keeps changing, rank higher."""
+    reasons = stats["fail_reasons"]
+    moving = 1.0 - 0.5 * reason_similarity(reasons[-1], reasons[-2]) if len(reasons) >= 2 else 1.0
+    return moving / (1 + stats["rounds"])
+
+
+def schedule_refinement(
+    failing_keys: List[str],
+    variant_counts: Dict[str, int],
+    job_keys: List[str],
+    page_stats: Dict[str, Dict[str, Any]],
+    costs: Dict[str, float],
+) -> List[str]:
+    """
+    Failing pages to regenerate this round, best expected gain first. Past BUDGET_SOFT_USD only
+    BUDGET_SOFT_PAGE_FRACTION of them; under BUDGET_USD only as many as the remaining budget covers
+    (with this round's evaluation of every page). Raises BudgetExhausted when not even one fits.
+    """
+    if BUDGET is None or (BUDGET.hard_usd <= 0 and BUDGET.soft_usd <= 0):
+        return failing_keys
+    ranked = sorted(failing_keys, key=lambda k: -expected_gain(page_stats[k]))
+    if BUDGET.over_soft():
+        ranked = ranked[: max(1, math.ceil(len(ranked) * BUDGET_SOFT_PAGE_FRACTION))]
+    remaining = BUDGET.remaining()
+    if remaining is not None:
+        available = remaining / BUDGET.calibration() - len(job_keys) * costs["eval"]
+        chosen: List[str] = []
+        for key in ranked:
+            variants = variant_counts[key]
+            cost = costs["revision"] + variants * costs["image"] + (variants - 1) * costs["eval"]
+            if cost <= available:
+                chosen.append(key)
+                available -= cost
+        if not chosen:
+            raise run_budget.BudgetExhausted(
+                f"${remaining:.2f} left is not enough for another refinement round of {len(failing_keys)} failing page(s)."
+            )
+        ranked = chosen
+    scheduled = set(ranked)
+    deferred = len(failing_keys) - len(scheduled)
+    if deferred:
+        print(f"[BUDGET] Regenerating {len(scheduled)} of {len(failing_keys)} failing page(s) this round (${BUDGET.spent:.2f} spent).")
+        METRICS.inc("budget_deferred_pages_total", deferred, "Failing pages not regenerated in a round because of the budget")
+    return [k for k in failing_keys if k in scheduled]
+
+
+def report_budget():
+    if BUDGET is None or not BUDGET.spent_this_run:
+        return
+    cap = f" of ${BUDGET.hard_usd:.2f}" if BUDGET.hard_usd > 0 else ""
+    print(
+        f"[INFO] Spend: ${BUDGET.spent_this_run:.2f} this run, ${BUDGET.spent:.2f}{cap} recorded for this folder "
+        f"({BUDGET.ledger_path})."
+    )
+
+
+# =========================================
+# Main Pipeline Execution
+# =========================================
+def process_pages(
+    job_keys: List[str],
+    jobs: Dict[str, Dict[str, Any]],
+    tracks: List[Dict[str, Any]],
+    derived: Dict[str, Optional[str]],
+    client_text,
+    client_image,
+    costs: Dict[str, float],
+    page_stats: Dict[str, Dict[str, Any]],
+    last_results: Dict[str, str],
+    rounds: List[Dict[str, Any]],
+    keep: Optional[Callable[[List[str]], List[str]]] = None,
+):
+    """
+    Full loop for `job_keys`: Stage 1, evaluation, refinement rounds and final renders.
+    page_stats / last_results / rounds are filled in for the report (in work-queue mode they are
+    shared by every shard, so all counts here look at `job_keys` only); `keep` (work-queue mode)
+    drops pages whose lease was lost before each refinement round.
+    """
+    suggestions_map: Dict[str, List[str]] = {key: [] for key in job_keys}
+    for key in job_keys:
+        last_results[key] = "X"
+    page_stats.update(new_page_stats(job_keys))
+    record_page_states(last_results)
+    # Only the output trees these pages live in (a library shard spans a few volumes)
+    active = {id(jobs[key]["track"]) for key in job_keys}
+    tracks = [track for track in tracks if id(track) in active]
+
+    # ==============================
+    # Stage 0 (optional): language-neutral source analysis
+    # ==============================
+    if SOURCE_ANALYSIS:
+        run_source_analysis(job_keys, jobs, client_text)
+
+    # ==============================
+    # Stage 1: Initial Translation -> out1 (iteration_index = 0 for scripts)
+    # ==============================
+    for key in jobs_without_output(job_keys, jobs, 0):
+        page_stats[key]["renders"] += 1
+    generate_outputs(0, job_keys, jobs, client_text, client_image, suggestions_map, last_results)
+    mirror_duplicates(0, jobs, derived)
+
+    # =====================================
+    # Detect completed out iterations (resume)
+    # =====================================
+    completed_iter = detect_last_complete_iteration(job_keys, jobs)
+    baseline_iter_index = completed_iter
+    if completed_iter > 0:
+        print(
+            f"[INFO] Detected completed iteration {completed_iter}. "
+            f"Resuming from there using folder(s): "
+            f"{', '.join(output_dir_for(t, completed_iter) for t in tracks)}"
+        )
+
+    # =====================================
+    # Evaluate baseline folder (INIT or outK)
+    # =====================================
+    results = evaluate_iteration(baseline_iter_index, job_keys, jobs, client_text, suggestions_map, last_results)
+    update_convergence(baseline_iter_index, results, page_stats)
+    rounds.append(
+        {
+            "iteration": baseline_iter_index,
+            "renders": sum(st["renders"] for st in page_stats.values()),
+            "newly_passed": sum(1 for ox, _ in results.values() if ox == "O"),
+            "passed": sum(1 for k in job_keys if last_results.get(k) == "O"),
+            "stalled": 0,
+        }
+    )
+
+    # =====================================
+    # Iterative Refinement Rounds
+    # =====================================
+    start_iteration = baseline_iter_index + 1
+    last_iteration = baseline_iter_index
+
+    for iteration in range(start_iteration, MAX_ITERATIONS + 1):
+        stalled = {k for k in job_keys if page_stats[k]["stalled_at"] is not None and last_results.get(k) != "O"}
+        failing_keys = [k for k in job_keys if last_results.get(k, "X") != "O" and k not in stalled]
+        if keep is not None:
+            failing_keys = keep(failing_keys)
+        if not failing_keys:
+            print(f"All remaining failing pages ({len(stalled)}) are stalled. Stopping early.")
+            break
+        variant_counts = plan_variants(failing_keys, len(stalled))
+        failing_keys = schedule_refinement(failing_keys, variant_counts, job_keys, page_stats, costs)
+        deferred = {k for k in variant_counts if k not in failing_keys}
+        for track in tracks:
+            prev_output_dir = output_dir_for(track, iteration - 1)
+            if not os.path.isdir(prev_output_dir):
+                raise RuntimeError(f"Expected previous output folder not found: {prev_output_dir}")
+            os.makedirs(output_dir_for(track, iteration), exist_ok=True)
+        METRICS.set("current_iteration", iteration, "Refinement iteration currently running")
+        print(f"\n=== Iteration {iteration}: Regeneration -> {', '.join(output_dir_for(t, iteration) for t in tracks)} ===")
+
+        # 1) Copy already-passing (O), stalled and budget-deferred images forward
+        carry_forward_passing(iteration, job_keys, jobs, last_results, stalled | deferred)
+
+        # 2) Regenerate the scheduled failing images with new scripts for this iteration
+        variant_counts = {k: variant_counts[k] for k in failing_keys}
+        record_page_states(last_results, stalled_count=stalled_count(page_stats, last_results))
+        generate_outputs(
+            iteration,
+            failing_keys,
+            jobs,
+            client_text,
+            client_image,
+            suggestions_map,
+            last_results,
+            variant_counts,
+        )
+        for key in failing_keys:
+            page_stats[key]["rounds"] += 1
+            page_stats[key]["renders"] += variant_counts[key]
+
+        # 3) Evaluate the new output folder(s); budget-deferred pages are unchanged and keep their verdict,
+        #    which is not counted again towards stalling
+        failed_before = {k for k in job_keys if last_results.get(k) != "O"}
+        carried = {k: results[k] for k in deferred if k in results}
+        results = evaluate_iteration(iteration, job_keys, jobs, client_text, suggestions_map, last_results, carried)
+        update_convergence(iteration, {k: v for k, v in results.items() if k not in deferred}, page_stats)
+        mirror_duplicates(iteration, jobs, derived)
+        last_iteration = iteration
+        stalled_now = sum(1 for k in job_keys if page_stats[k]["stalled_at"] is not None and last_results.get(k) != "O")
+        record_page_states(last_results, stalled_count=stalled_count(page_stats, last_results))
+        passed_now = sum(1 for k in job_keys if last_results.get(k) == "O")
+        rounds.append(
+            {
+                "iteration": iteration,
+                "renders": sum(variant_counts.values()),
+                "newly_passed": sum(1 for k in failed_before if last_results.get(k) == "O"),
+                "passed": passed_now,
+                "stalled": stalled_now,
+            }
+        )
+
+        if all(last_results.get(k) == "O" for k in job_keys):
+            print(f"All images passed at iteration {iteration}. Stopping early.")
+            break
+
+    # =====================================
+    # Progressive mode: final high-resolution renders of passing pages
+    # =====================================
+    if PROGRESSIVE_RESOLUTION:
+        render_final(last_iteration, job_keys, jobs, client_image, last_results)
+        mirror_duplicates(last_iteration, jobs, derived, final=True)
+
+    if TILING:
+        stitch_tiled_pages(jobs, job_keys, derived)
+
+
+def run_work_queue(
+    queue_path: str,
+    job_keys: List[str],
+    process: Callable[..., None],
+    last_results: Dict[str, str],
+    redo: Optional[List[str]] = None,
+):
+    """
+    Work-queue mode: claim shards of pages from the queue until none are left, and mark them done.
+    Pages are claimed in `job_keys` order (see LIBRARY_PRIORITY); `redo` pages (changed sources)
+    are queued again even if they were done.
+    """
+    import work_queue  # sqlite3 is only needed in queue mode
+
+    queue = work_queue.WorkQueue(
+        queue_path,
+        worker_id=WORKER_ID or None,
+        lease_sec=WORK_QUEUE_LEASE_SEC,
+        max_attempts=WORK_QUEUE_MAX_ATTEMPTS,
+    )
+    priorities = {key: float(index) for index, key in enumerate(job_keys)}
+    added = queue.add_tasks(job_keys, priorities)
+    queue.prioritize(priorities)
+    if redo:
+        added += queue.requeue(redo)
+    print(f"[QUEUE] Worker {queue.worker_id} on {queue_path} ({added} new page(s) queued).")
+    known = set(job_keys)
+    while True:
+        shard = queue.claim(WORK_QUEUE_CLAIM, only=known)
+        if not shard:
+            break
+        print(f"\n[QUEUE] Claimed {len(shard)} page(s): {', '.join(shard[:5])}{' ...' if len(shard) > 5 else ''}")
+        METRICS.inc("queue_claimed_pages_total", len(shard), "Pages claimed from the shared work queue")
+        heartbeat = work_queue.Heartbeat(queue, shard, WORK_QUEUE_HEARTBEAT_SEC)
         try:
-            client_image.close()
-        except Exception:
-            pass
+            with heartbeat:
+                process(shard, keep=lambda keys: [k for k in keys if k not in heartbeat.lost])
+        except BaseException:
+            queue.release([key for key in shard if key not in heartbeat.lost])
+            raise
+        for key in shard:
+            if key in heartbeat.lost or not queue.complete(key, last_results.get(key, "X")):
+                print(f"[QUEUE] {key}: lease lost, leaving its result to the current owner.")
+    counts = queue.counts()
+    print("[QUEUE] No pages left to claim. Queue: " + ", ".join(f"{n} {state}" for state, n in sorted(counts.items())))
+
+
+def supersede_pages(tracks: List[Dict[str, Any]], bases: List[str]):
+    """
+    A source page changed: move everything produced from the old version (outputs of every
+    round, candidates, final render, scripts, feedback, analysis) to BASE_DIR/_superseded/<time>/
+    and drop its eval-log verdicts, so the page is translated again from scratch.
+    """
+    dest_root = os.path.join(BASE_DIR, SUPERSEDED_DIR_NAME, time.strftime("%Y%m%d-%H%M%S"))
+    for track in tracks:
+        for base in list(bases):
+            manifest = page_tiles.load_manifest(page_tiles.manifest_path(track["tiles_dir"], base))
+            if manifest:
+                bases = bases + [page_tiles.tile_base(base, i) for i in range(1, len(manifest["files"]) + 1)]
+    bases = list(dict.fromkeys(bases))
+    wanted = set(bases)
+    moved = 0
+
+    def move(path: str):
+        nonlocal moved
+        if not os.path.isfile(path):
+            return
+        rel = os.path.relpath(path, BASE_DIR)
+        dest = os.path.join(dest_root, rel if not rel.startswith(os.pardir) else os.path.basename(path))
         try:
-            client_text.close()
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(path, dest)
+            moved += 1
+        except Exception as e:
+            print(f"[WARN] Failed to move superseded {path}: {e}")
+
+    for track in tracks:
+        for iteration_index in range(0, MAX_ITERATIONS + 1):
+            folder = output_dir_for(track, iteration_index)
+            log_path = os.path.join(folder, "eval_log.tsv")
+            if os.path.isfile(log_path):
+                try:
+                    with open(log_path, "r", encoding="utf-8") as f:
+                        lines = f.readlines()
+                    kept = [line for line in lines if (line.split("\t", 2) + [""])[1].strip() not in wanted]
+                    if len(kept) != len(lines):
+                        tmp_path = f"{log_path}.{os.getpid()}.tmp"
+                        with open(tmp_path, "w", encoding="utf-8") as f:
+                            f.writelines(kept)
+                        os.replace(tmp_path, log_path)
+                except Exception as e:
+                    print(f"[WARN] Failed to drop superseded verdicts from {log_path}: {e}")
+            for base in bases:
+                page = {"track": track, "base": base}
+                move(os.path.join(folder, f"{base}.jpg"))
+                for variant in range(2, max(CANDIDATES_PER_FAILING_PAGE, MAX_CANDIDATES_PER_PAGE) + 1):
+                    move(candidate_path_for(page, iteration_index, variant))
+                move(script_path_for(base, iteration_index, track["scripts_dir"]))
+                move(feedback_path_for(base, iteration_index, track["scripts_dir"]))
+        for base in bases:
+            move(os.path.join(track["final_dir"], f"{base}.jpg"))
+            move(os.path.join(track["analysis_dir"], f"{base}.json"))
+    print(f"[WATCH] {len(bases)} changed page(s): {moved} old file(s) moved to {dest_root}")
+
+
+def watch_input(
+    tracks: List[Dict[str, Any]],
+    jobs: Dict[str, Dict[str, Any]],
+    derived: Dict[str, Optional[str]],
+    client_text,
+    process: Callable[..., None],
+    last_results: Dict[str, str],
+    known: page_watch.Snapshot,
+    after_drop: Callable[[], None],
+):
+    """
+    WATCH_INPUT: wait for pages to be added to or changed in INPUT_DIR and translate just those,
+    reusing this process's clients, caches and metrics. `jobs` / `derived` are refreshed in place.
+    Runs until interrupted.
+    """
+    state_path = os.path.join(BASE_DIR, WATCH_STATE_NAME)
+    watcher = page_watch.FolderWatcher(INPUT_DIR, WATCH_POLL_SEC)
+    print(f"\n[WATCH] Watching {INPUT_DIR} for new pages ({watcher.mode}); Ctrl+C to stop.")
+    try:
+        while True:
+            snap = page_watch.wait_for_drop(watcher, lambda: list_images(INPUT_DIR), known, WATCH_DEBOUNCE_SEC)
+            added, changed, removed = page_watch.diff_snapshots(known, snap)
+            if removed:
+                print(f"[WATCH] {len(removed)} page(s) left {INPUT_DIR}; their outputs are kept.")
+            changed_bases = list(dict.fromkeys(normalized_base_from_filename(n) for n in changed))
+            if changed_bases:
+                supersede_pages(tracks, changed_bases)
+            bases = set(changed_bases) | {normalized_base_from_filename(n) for n in added}
+
+            jobs.clear()
+            jobs.update(collect_jobs(tracks))
+            derived.clear()
+            if PAGE_TRIAGE:
+                derived.update(derived_jobs(jobs, triage_pages(jobs, client_text)))
+                copy_through_pages(jobs, derived)
+            new_keys = [key for key, job in jobs.items() if job.get("page", job["base"]) in bases and key not in derived]
+            print(f"[WATCH] {len(added)} new and {len(changed)} changed page(s); {len(new_keys)} job(s) to translate.")
+            METRICS.inc("watch_pages_total", len(added), "Input pages picked up in watch mode", kind="added")
+            METRICS.inc("watch_pages_total", len(changed), "Input pages picked up in watch mode", kind="changed")
+            if new_keys:
+                if WORK_QUEUE:
+                    redo = [key for key in new_keys if jobs[key].get("page", jobs[key]["base"]) in changed_bases]
+                    run_work_queue(WORK_QUEUE, new_keys, process, last_results, redo)
+                else:
+                    process(new_keys)
+            for iteration_index in range(0, MAX_ITERATIONS + 1):
+                mirror_duplicates(iteration_index, jobs, derived)
+            if PROGRESSIVE_RESOLUTION:
+                mirror_duplicates(0, jobs, derived, final=True)
+            if TILING:
+                stitch_tiled_pages(jobs, list(jobs), derived)
+            known = snap
+            try:
+                page_watch.save_snapshot(state_path, known)
+            except Exception as e:
+                print(f"[WARN] Failed to save watch state {state_path}: {e}")
+            after_drop()
+            print(f"[WATCH] Waiting for new pages in {INPUT_DIR}.")
+    except KeyboardInterrupt:
+        print("\n[WATCH] Stopped.")
+    finally:
+        watcher.close()
+
+
+def load_tracks() -> Tuple[List[str], List[Dict[str, Any]]]:
+    """(page names in INPUT_DIR, output tracks) for INPUT_DIR or the library; creates each track's folders (not under DRY_RUN)."""
+    if LIBRARY_DIR:
+        if WATCH_INPUT:
+            raise RuntimeError("WATCH_INPUT watches INPUT_DIR and cannot be combined with LIBRARY_DIR.")
+        if not os.path.isdir(LIBRARY_DIR):
+            raise RuntimeError(f"Library directory not found: {LIBRARY_DIR}")
+        images: List[str] = []
+        tracks = library_tracks()
+        if not tracks:
+            raise RuntimeError(f"No volume folders with images found under {LIBRARY_DIR}")
+        volume_count = len({track["volume"] for track in tracks})
+        print(f"Found {volume_count} volume(s) in {LIBRARY_DIR}; outputs go to {LIBRARY_OUTPUT_DIR} ({LIBRARY_PRIORITY} order).")
+    else:
+        if not os.path.isdir(INPUT_DIR) and not page_sources.is_archive(INPUT_DIR):
+            raise RuntimeError(f"Input directory not found: {INPUT_DIR}")
+        if WATCH_INPUT and page_sources.is_archive(INPUT_DIR):
+            raise RuntimeError("WATCH_INPUT needs INPUT_DIR to be a folder, not an archive.")
+        images = list_images(INPUT_DIR)
+        if not images and not WATCH_INPUT:
+            raise RuntimeError(f"No images found in input directory: {INPUT_DIR}")
+        print(f"Found {len(images)} image(s) in {INPUT_DIR}.")
+        tracks = build_tracks()
+    for track in tracks if not DRY_RUN else []:
+        os.makedirs(track["scripts_dir"], exist_ok=True)
+        os.makedirs(track["init_dir"], exist_ok=True)
+    if len(tracks) > 1:
+        print(f"Target languages: {', '.join(t['lang'] + ' -> ' + t['root'] for t in tracks)}")
+    return images, tracks
+
+
+def make_clients(api_keys: List[str]):
+    """(client_text, client_image); with several keys each is a ClientPool."""
+    # With several keys each client is a pool; rate limits are per model, so the image and text
+    # pools keep separate buckets but share uploads and caches.
+    pool_options = {
+        "batch_per_min": POOL_BATCH_CREATES_PER_MIN,
+        "online_per_min": POOL_ONLINE_CALLS_PER_MIN,
+        "cooldown_sec": POOL_COOLDOWN_SEC,
+    }
+    client_text = make_client(
+        api_keys, backend=GENAI_BACKEND, http_options={"api_version": "v1alpha"}, pool_options=pool_options
+    )
+    if isinstance(client_text, ClientPool):
+        pool_options["shared_with"] = client_text
+        print(f"[INFO] Spreading requests over {len(client_text)} API keys.")
+    client_image = make_client(api_keys, backend=GENAI_BACKEND, pool_options=pool_options)
+    set_upload_client(client_text)
+    return client_text, client_image
+
+
+def close_clients(client_text, client_image):
+    for name, client in (("text", client_text), ("image", client_image)):
+        if isinstance(client, ClientPool):
+            print(f"[INFO] Key pool ({name}): {client.summary()}")
+    for client in (client_image, client_text):
+        try:
+            client.close()
         except Exception:
             pass
 
 
+def evaluate_only(iteration: Optional[int] = None):
+    """
+    Evaluate the existing outputs of round `iteration` (default: the newest complete round)
+    without generating anything; verdicts already in its eval_log.tsv are kept.
+    """
+    api_keys = resolve_api_keys(API_KEY, API_KEYS)
+    if not api_keys and resolve_backend(GENAI_BACKEND) != "fake":
+        raise RuntimeError("API key not found. Set API_KEY or GEMINI_API_KEY/GOOGLE_API_KEY.")
+    _, tracks = load_tracks()
+    jobs = collect_jobs(tracks)
+    job_keys = list(jobs.keys())
+    if iteration is None:
+        iteration = detect_last_complete_iteration(job_keys, jobs)
+
+    global BUDGET
+    BUDGET = run_budget.RunBudget(os.path.join(BASE_DIR, run_budget.LEDGER_FILE_NAME), BUDGET_USD, BUDGET_SOFT_USD)
+    client_text, client_image = make_clients(api_keys)
+    try:
+        if PAGE_TRIAGE:
+            derived = derived_jobs(jobs, triage_pages(jobs, client_text))
+            job_keys = [key for key in job_keys if key not in derived]
+        suggestions_map: Dict[str, List[str]] = {key: [] for key in job_keys}
+        results = evaluate_iteration(iteration, job_keys, jobs, client_text, suggestions_map, {})
+        passed = sum(1 for ox, _ in results.values() if ox == "O")
+        print(f"\n[EVAL] Iteration {iteration}: {passed}/{len(results)} page(s) passed.")
+    finally:
+        release_prompt_caches()
+        report_budget()
+        report_prompt_cache_savings()
+        close_clients(client_text, client_image)
+
+
+def main():
+    api_keys = resolve_api_keys(API_KEY, API_KEYS)
+    if not api_keys and not DRY_RUN and resolve_backend(GENAI_BACKEND) != "fake":
+        raise RuntimeError("API key not found. Set API_KEY or GEMINI_API_KEY/GOOGLE_API_KEY.")
+    if REGION_COMPOSITE and importlib.util.find_spec("numpy") is None:
+        raise RuntimeError("REGION_COMPOSITE needs NumPy (pip install numpy).")
+
+    images, tracks = load_tracks()
+
+    # Watch mode: pages replaced since the last run are redone from scratch
+    known: page_watch.Snapshot = {}
+    redo_bases: List[str] = []
+    if WATCH_INPUT and not DRY_RUN:
+        known = page_watch.take_snapshot(INPUT_DIR, images)
+        previous = page_watch.load_snapshot(os.path.join(BASE_DIR, WATCH_STATE_NAME))
+        _, changed, _ = page_watch.diff_snapshots(previous, known)
+        redo_bases = list(dict.fromkeys(normalized_base_from_filename(n) for n in changed))
+        if redo_bases:
+            supersede_pages(tracks, redo_bases)
+
+    jobs = collect_jobs(tracks)
+    job_keys = list(jobs.keys())
+
+    global BUDGET
+    BUDGET = run_budget.RunBudget(
+        os.path.join(BASE_DIR, run_budget.LEDGER_FILE_NAME), BUDGET_USD, BUDGET_SOFT_USD, read_only=DRY_RUN
+    )
+    if DRY_RUN:
+        if PAGE_TRIAGE:
+            derived = derived_jobs(jobs, stored_triage(jobs))
+            job_keys = [key for key in job_keys if key not in derived]
+        print_cost_estimate(tracks, jobs, job_keys)
+        return
+    if BUDGET.hard_usd > 0 and BUDGET.spent >= BUDGET.hard_usd:
+        print(f"[BUDGET] ${BUDGET.spent:.2f} already recorded for this folder reaches BUDGET_USD; nothing to do.")
+        return
+    costs = sample_costs(tracks[0])
+
+    client_text, client_image = make_clients(api_keys)
+
+    start_metrics()
+
+    # Triage: blank / text-free pages and duplicate scans skip the loop
+    derived: Dict[str, Optional[str]] = {}
+    if PAGE_TRIAGE:
+        derived = derived_jobs(jobs, triage_pages(jobs, client_text))
+        copy_through_pages(jobs, derived)
+        job_keys = [key for key in job_keys if key not in derived]
+
+    last_results: Dict[str, str] = {}
+    page_stats: Dict[str, Dict[str, Any]] = {}
+    rounds: List[Dict[str, Any]] = []
+    METRICS.set("current_iteration", 0, "Refinement iteration currently running")
+
+    def process(keys: List[str], keep: Optional[Callable[[List[str]], List[str]]] = None):
+        process_pages(
+            keys, jobs, tracks, derived, client_text, client_image, costs, page_stats, last_results, rounds, keep
+        )
+
+    try:
+        if not job_keys:
+            mirror_duplicates(0, jobs, derived)
+            print("All pages were handled by triage; nothing to translate.")
+        elif WORK_QUEUE or LIBRARY_DIR:
+            # A library always runs through a queue: shards finish in priority order and a stopped run resumes
+            queue_path = WORK_QUEUE or os.path.join(LIBRARY_OUTPUT_DIR, LIBRARY_QUEUE_NAME)
+            redo = [key for key in job_keys if jobs[key].get("page", jobs[key]["base"]) in redo_bases]
+            run_work_queue(queue_path, job_keys, process, last_results, redo)
+        else:
+            process(job_keys)
+        if TILING:
+            stitch_tiled_pages(jobs, list(jobs), derived)
+        if job_keys:
+            write_page_report(jobs, page_stats, last_results, rounds)
+
+        if WATCH_INPUT:
+            try:
+                page_watch.save_snapshot(os.path.join(BASE_DIR, WATCH_STATE_NAME), known)
+            except Exception as e:
+                print(f"[WARN] Failed to save watch state: {e}")
+
+            def after_drop():
+                write_page_report(jobs, page_stats, last_results, rounds)
+                publish_metrics()
+
+            watch_input(tracks, jobs, derived, client_text, process, last_results, known, after_drop)
+
+    except run_budget.BudgetExhausted as e:
+        print(f"\n[BUDGET] Stopping: {e}")
+        print("[BUDGET] Outputs, scripts and eval logs so far are on disk; raise BUDGET_USD and rerun to resume.")
+        METRICS.inc("budget_stops_total", 1, "Runs stopped by the hard budget cap")
+        write_page_report(jobs, page_stats, last_results, rounds)
+
+    finally:
+        release_prompt_caches()
+        report_budget()
+        report_prompt_cache_savings()
+        publish_metrics()
+        METRICS.close()
+        close_clients(client_text, client_image)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,337 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import pathlib
+import argparse
+import datetime
+import subprocess
+import contextlib
+from typing import List, Dict, Any, Optional
+
+# =========================================
+# End-to-end benchmark for allloopv3.main + select_best_outputs.main
+# =========================================
+# Every scenario runs in a fresh subprocess against the fake backend (genai_backend.py),
+# so wall time and peak RSS are not polluted by earlier runs. Results are appended to
+# RESULTS_PATH and compared with the previous run of the same scenario.
+#
+#   python bench.py                       # 100 pages
+#   python bench.py --pages 100 1000 10000 --label my-branch
+#   python bench.py --pages 1000 --baseline main --fail-on-regression
+
+BASE_DIR = pathlib.Path(__file__).resolve().parent
+BENCH_DIR = BASE_DIR / "bench_results"
+RESULTS_PATH = BENCH_DIR / "results.jsonl"
+VOLUMES_DIR = BENCH_DIR / "volumes"
+RUNS_DIR = BENCH_DIR / "runs"
+
+# Synthetic page sizes (width, height); spreads included. Formats alternate between PNG and JPEG.
+PAGE_SIZES = [(720, 1024), (1064, 1504), (1440, 2048), (2100, 1500)]
+REGRESSION_THRESHOLD = 0.10  # Relative increase that counts as a regression
+
+# Metrics compared between runs (lower is better for all of them)
+COMPARED_METRICS = [
+    "wall_sec",
+    "peak_rss_bytes",
+    "encoded_bytes",
+    "upload_bytes",
+    "model_calls_total",
+    "work_sec",
+]
+
+
+# =========================================
+# Synthetic volumes
+# =========================================
+def ensure_volume(pages: int, seed: int) -> pathlib.Path:
+    """Create (once) a folder of `pages` synthetic manga pages with mixed PNG/JPEG sizes."""
+    from PIL import Image, ImageDraw
+
+    folder = VOLUMES_DIR / f"p{pages}-s{seed}"
+    marker = folder / ".complete"
+    if marker.is_file():
+        return folder
+    shutil.rmtree(folder, ignore_errors=True)
+    folder.mkdir(parents=True)
+    rng = random.Random(seed)
+    print(f"[BENCH] Generating {pages} synthetic page(s) in {folder} ...")
+    for i in range(1, pages + 1):
+        w, h = rng.choice(PAGE_SIZES)
+        img = Image.new("RGB", (w, h), (rng.randint(200, 255),) * 3)
+        draw = ImageDraw.Draw(img)
+        for _ in range(rng.randint(3, 7)):  # panels
+            x0, y0 = rng.randint(0, w // 2), rng.randint(0, h // 2)
+            draw.rectangle([x0, y0, x0 + rng.randint(w // 4, w // 2), y0 + rng.randint(h // 6, h // 3)],
+                           outline=(0, 0, 0), width=4, fill=(rng.randint(80, 220),) * 3)
+        for _ in range(rng.randint(2, 6)):  # bubbles
+            cx, cy = rng.randint(0, w), rng.randint(0, h)
+            rx, ry = rng.randint(40, 120), rng.randint(60, 180)
+            draw.ellipse([cx - rx, cy - ry, cx + rx, cy + ry], outline=(0, 0, 0), width=3, fill=(255, 255, 255))
+        if i % 2:
+            img.save(folder / f"page_{i:05d}.png", format="PNG")
+        else:
+            img.save(folder / f"page_{i:05d}.jpg", format="JPEG", quality=90)
+    marker.write_text("ok", encoding="utf-8")
+    return folder
+
+
+# =========================================
+# Worker (one scenario, runs in its own process)
+# =========================================
+def _count_encoded(module, counter: Dict[str, int]):
+    original = module.image_part_dict
+
+    def counting_image_part_dict(path, *args, **kwargs):
+        part = original(path, *args, **kwargs)
+        counter["encoded_bytes"] += len(part["inline_data"]["data"]) * 3 // 4
+        return part
+
+    module.image_part_dict = counting_image_part_dict
+
+
+def run_scenario(params: Dict[str, Any]) -> Dict[str, Any]:
+    import resource
+
+    os.environ["MANGA_GENAI_BACKEND"] = "fake"
+    import genai_backend
+
+    backend = genai_backend.configure_fake_backend(
+        seed=params["seed"],
+        pass_rate=params["pass_rate"],
+        queue_polls=params["queue_polls"],
+        queue_latency_sec=params["queue_latency_sec"],
+        request_failure_rate=params["failure_rate"],
+    )
+
+    import allloopv3
+    import select_best_outputs
+
+    run_dir = RUNS_DIR / params["scenario"]
+    shutil.rmtree(run_dir, ignore_errors=True)
+    run_dir.mkdir(parents=True)
+
+    allloopv3.BASE_DIR = run_dir
+    allloopv3.INPUT_DIR = params["volume_dir"]
+    allloopv3.INIT_OUTPUT_DIR = str(run_dir / "out1")
+    allloopv3.SCRIPTS_DIR = str(run_dir / "scripts")
+    allloopv3.SOURCE_ANALYSIS_DIR = str(run_dir / "source_analysis")
+    allloopv3.MAX_ITERATIONS = params["iterations"]
+    allloopv3.BATCH_SIZE = params["batch_size"]
+    allloopv3.POLL_INTERVAL_SEC = params["poll_interval_sec"]
+
+    select_best_outputs.BASE_DIR = run_dir
+    select_best_outputs.INPUT_DIR = params["volume_dir"]
+    select_best_outputs.FINAL_DIR = str(run_dir / "manga_out")
+    select_best_outputs.BEST_LOG_PATH = str(run_dir / "manga_best_k.tsv")
+    select_best_outputs.BATCH_SIZE = params["batch_size"]
+    select_best_outputs.POLL_INTERVAL_SEC = params["poll_interval_sec"]
+    select_best_outputs.RETRY_BACKOFF_SEC = 0
+
+    counter = {"encoded_bytes": 0}
+    _count_encoded(allloopv3, counter)
+    _count_encoded(select_best_outputs, counter)
+
+    log_path = run_dir / "pipeline.log"
+    with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(
+        sys.stdout if params["verbose"] else log
+    ):
+        t0 = time.perf_counter()
+        allloopv3.main()
+        t1 = time.perf_counter()
+        select_best_outputs.main()
+        t2 = time.perf_counter()
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+    stats = backend.stats
+    calls = dict(stats["requests"])
+    wall = t2 - t0
+    return {
+        "wall_sec": round(wall, 3),
+        "loop_sec": round(t1 - t0, 3),
+        "select_sec": round(t2 - t1, 3),
+        "peak_rss_bytes": peak_rss,
+        "encoded_bytes": counter["encoded_bytes"],
+        "upload_bytes": stats["upload_bytes"],
+        "model_calls": calls,
+        "model_calls_total": sum(calls.values()),
+        "batches_created": stats["batches_created"],
+        "batch_polls": stats["batch_polls"],
+        "poll_wait_sec": round(stats["batch_wait_sec"], 3),
+        "work_sec": round(max(0.0, wall - stats["batch_wait_sec"]), 3),
+    }
+
+
+# =========================================
+# Results store + comparison
+# =========================================
+def git_revision() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, timeout=10
+        )
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def load_results() -> List[Dict[str, Any]]:
+    records: List[Dict[str, Any]] = []
+    if not RESULTS_PATH.is_file():
+        return records
+    with open(RESULTS_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def append_result(record: Dict[str, Any]):
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+    with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def find_reference(records: List[Dict[str, Any]], scenario: str, baseline: Optional[str]) -> Optional[Dict[str, Any]]:
+    for rec in reversed(records):
+        if rec.get("scenario") != scenario:
+            continue
+        if baseline and rec.get("label") != baseline:
+            continue
+        return rec
+    return None
+
+
+def compare(current: Dict[str, Any], reference: Dict[str, Any]) -> List[str]:
+    """Print a delta table and return the names of regressed metrics."""
+    regressions: List[str] = []
+    print(f"  vs {reference.get('label') or '-'} @ {reference.get('git')} ({reference.get('timestamp')}):")
+    for name in COMPARED_METRICS:
+        new = current["metrics"].get(name)
+        old = reference.get("metrics", {}).get(name)
+        if new is None or old is None:
+            continue
+        delta = (new - old) / old if old else 0.0
+        flag = ""
+        if delta > REGRESSION_THRESHOLD:
+            flag = "  <-- REGRESSION"
+            regressions.append(name)
+        print(f"    {name:<18} {old:>14} -> {new:>14}  ({delta:+.1%}){flag}")
+    return regressions
+
+
+def print_metrics(metrics: Dict[str, Any]):
+    for key in [
+        "wall_sec", "loop_sec", "select_sec", "poll_wait_sec", "work_sec",
+        "peak_rss_bytes", "encoded_bytes", "upload_bytes", "batches_created", "batch_polls",
+    ]:
+        print(f"    {key:<18} {metrics[key]}")
+    calls = ", ".join(f"{k}={v}" for k, v in sorted(metrics["model_calls"].items()))
+    print(f"    {'model_calls':<18} {metrics['model_calls_total']} ({calls})")
+
+
+# =========================================
+# Entry point
+# =========================================
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="End-to-end benchmark on the fake genai backend.")
+    ap.add_argument("--pages", type=int, nargs="+", default=[100], help="Volume sizes to run (e.g. 100 1000 10000)")
+    ap.add_argument("--iterations", type=int, default=3, help="MAX_ITERATIONS for the loop")
+    ap.add_argument("--batch-size", type=int, default=1000, help="BATCH_SIZE for both scripts")
+    ap.add_argument("--pass-rate", type=float, default=0.6, help="Fake evaluator O probability")
+    ap.add_argument("--failure-rate", type=float, default=0.0, help="Fake per-request failure probability")
+    ap.add_argument("--queue-polls", type=int, default=1, help="Polls a fake batch stays RUNNING")
+    ap.add_argument("--queue-latency", type=float, default=0.0, help="Seconds a fake batch stays RUNNING")
+    ap.add_argument("--poll-interval", type=float, default=0.0, help="POLL_INTERVAL_SEC used by the scripts")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--label", default="", help="Free-form label stored with the result (e.g. branch name)")
+    ap.add_argument("--baseline", default="", help="Compare against the latest run with this label")
+    ap.add_argument("--no-save", action="store_true", help="Do not append results to the results file")
+    ap.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if any metric regressed")
+    ap.add_argument("--verbose", action="store_true", help="Show pipeline output instead of logging it")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    return ap.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.worker:
+        params = json.loads(args.worker)
+        result = run_scenario(params)
+        with open(params["result_path"], "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    records = load_results()
+    any_regression = False
+    for pages in args.pages:
+        volume_dir = ensure_volume(pages, args.seed)
+        scenario = f"p{pages}-it{args.iterations}-b{args.batch_size}-pr{args.pass_rate}-fr{args.failure_rate}"
+        params = {
+            "scenario": scenario,
+            "volume_dir": str(volume_dir),
+            "iterations": args.iterations,
+            "batch_size": args.batch_size,
+            "pass_rate": args.pass_rate,
+            "failure_rate": args.failure_rate,
+            "queue_polls": args.queue_polls,
+            "queue_latency_sec": args.queue_latency,
+            "poll_interval_sec": args.poll_interval,
+            "seed": args.seed,
+            "verbose": args.verbose,
+            "result_path": str(BENCH_DIR / f".result-{scenario}.json"),
+        }
+        print(f"\n[BENCH] Scenario {scenario}")
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(params["result_path"])
+        proc = subprocess.run(
+            [sys.executable, str(pathlib.Path(__file__).resolve()), "--worker", json.dumps(params)],
+            cwd=BASE_DIR,
+            stderr=None if args.verbose else subprocess.PIPE,
+            text=True,
+        )
+        if proc.returncode != 0 or not os.path.isfile(params["result_path"]):
+            print(f"[BENCH] Scenario {scenario} failed (exit {proc.returncode}).")
+            if proc.stderr:
+                print(proc.stderr[-4000:])
+            any_regression = True
+            continue
+        with open(params["result_path"], "r", encoding="utf-8") as f:
+            metrics = json.load(f)
+        os.remove(params["result_path"])
+
+        record = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "label": args.label,
+            "git": git_revision(),
+            "scenario": scenario,
+            "params": {k: v for k, v in params.items() if k not in ("volume_dir", "verbose", "result_path")},
+            "metrics": metrics,
+        }
+        print_metrics(record["metrics"])
+        reference = find_reference(records, scenario, args.baseline or None)
+        if reference:
+            if compare(record, reference):
+                any_regression = True
+        else:
+            print("  (no earlier run of this scenario to compare with)")
+        if not args.no_save:
+            append_result(record)
+            records.append(record)
+
+    if not args.no_save:
+        print(f"\nResults appended to {RESULTS_PATH}")
+    return 1 if (any_regression and args.fail_on_regression) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+from typing import List, Optional, Set, Tuple
+
+from PIL import Image, ImageChops, ImageFilter
+
+# =========================================
+# Changed regions between two renders of a page (PIL only)
+# =========================================
+# Used by allloopv3.py in FOCUSED_EVAL mode: a regenerated page is compared with the version
+# that received the last verdict, and only the regions that differ are sent for evaluation.
+
+WORK_PX = 512            # comparison runs at this long side
+DIFF_THRESHOLD = 24      # gray-level difference counted as a change
+GRID_CELLS = 48          # cells along the long side; changes are grouped per cell
+CELL_MIN_SHARE = 0.02    # a cell counts as changed when this share of its pixels differs
+MAX_ASPECT_DRIFT = 0.03
+PAD = 0.02               # margin added around each region (share of the page)
+
+Region = Tuple[float, float, float, float]  # left, top, right, bottom as fractions of the page
+
+
+def _merge(boxes: List[Region]) -> List[Region]:
+    merged = list(boxes)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                a, b = merged[i], merged[j]
+                if a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]:
+                    merged[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def changed_regions(before: Image.Image, after: Image.Image) -> Optional[List[Region]]:
+    """
+    Padded boxes around the parts of `after` that differ from `before`, largest first ([] when
+    nothing changed). None when the two cannot be compared (different framing).
+    """
+    bw, bh = before.size
+    aw, ah = after.size
+    if abs((bw / bh) / (aw / ah) - 1.0) > MAX_ASPECT_DRIFT:
+        return None
+    scale = WORK_PX / float(max(aw, ah))
+    size = (max(1, round(aw * scale)), max(1, round(ah * scale)))
+    a = before.convert("L").resize(size, Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    b = after.convert("L").resize(size, Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    mask = ImageChops.difference(a, b).point(lambda v: 255 if v > DIFF_THRESHOLD else 0)
+
+    cols = max(1, round(GRID_CELLS * size[0] / max(size)))
+    rows = max(1, round(GRID_CELLS * size[1] / max(size)))
+    cells = mask.resize((cols, rows), Image.BOX)
+    level = 255 * CELL_MIN_SHARE
+    px = cells.load()
+    todo: Set[Tuple[int, int]] = {(x, y) for y in range(rows) for x in range(cols) if px[x, y] > level}
+
+    boxes: List[Region] = []
+    while todo:
+        stack = [todo.pop()]
+        x0 = x1 = stack[0][0]
+        y0 = y1 = stack[0][1]
+        while stack:
+            x, y = stack.pop()
+            x0, x1, y0, y1 = min(x0, x), max(x1, x), min(y0, y), max(y1, y)
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    cell = (x + dx, y + dy)
+                    if cell in todo:
+                        todo.discard(cell)
+                        stack.append(cell)
+        boxes.append(
+            (
+                max(0.0, x0 / cols - PAD),
+                max(0.0, y0 / rows - PAD),
+                min(1.0, (x1 + 1) / cols + PAD),
+                min(1.0, (y1 + 1) / rows + PAD),
+            )
+        )
+    boxes = _merge(boxes)
+    boxes.sort(key=lambda r: (r[2] - r[0]) * (r[3] - r[1]), reverse=True)
+    return boxes
+
+
+def region_area(regions: List[Region]) -> float:
+    """Share of the page covered by the (non-overlapping) regions."""
+    return sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions)
+
+
+def crop(img: Image.Image, region: Region, max_px: int) -> Image.Image:
+    """The region of `img` (RGB), scaled down so its long side is at most max_px."""
+    w, h = img.size
+    box = (round(region[0] * w), round(region[1] * h), round(region[2] * w), round(region[3] * h))
+    part = img.convert("RGB").crop(box)
+    if max(part.size) > max_px > 0:
+        factor = max_px / float(max(part.size))
+        part = part.resize((max(1, round(part.size[0] * factor)), max(1, round(part.size[1] * factor))), Image.LANCZOS)
+    return part
@@ -0,0 +1,336 @@
+import hashlib
+import io
+import os
+import re
+import time
+import zipfile
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# =========================================
+# Volume export: CBZ / PDF (stdlib + PIL)
+# =========================================
+# Used by select_best_outputs.py when EXPORT_FORMATS is set. Selected pages are written into
+# the archive in page order while selection is still running (a page goes in as soon as every
+# page before it is final), so the volume is ready the moment its last page is chosen.
+# JPEG pages are stored as-is in both formats (CBZ members are not compressed, PDF pages embed
+# the JPEG stream directly); other formats are encoded once for the PDF only.
+#
+# A manifest next to the exports (<name>.pages.tsv) records what went in. When a later run
+# re-selects individual pages, only those pages are rewritten: the CBZ gets the new member
+# appended and a new central directory, the PDF an incremental update section. The files are
+# rebuilt from scratch when the page list changed or dead space from replaced pages piles up.
+
+FORMATS = ("cbz", "pdf")
+MANIFEST_SUFFIX = ".pages.tsv"
+MANIFEST_HEADER = "index\tbase\tmember\tsize\tmtime_ns\tsha1\n"
+COMPACT_RATIO = 2.0        # rebuild once an export is this many times larger than its live pages
+COMPACT_SLACK = 1 << 20    # ... plus this many bytes
+
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)\s+%%EOF\s*$")
+
+
+def load_manifest(path: str) -> Dict[str, Dict[str, str]]:
+    records: Dict[str, Dict[str, str]] = {}
+    if not os.path.isfile(path):
+        return records
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 6 or parts[0] == "index":
+                    continue
+                index, base, member, size, mtime_ns, sha1 = parts
+                records[base] = {"index": index, "member": member, "size": size, "mtime_ns": mtime_ns, "sha1": sha1}
+    except Exception as e:
+        print(f"[WARN] Failed to load export manifest {path}: {e}")
+    return records
+
+
+def save_manifest(path: str, records: Dict[str, Dict[str, str]]):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(MANIFEST_HEADER)
+        for base, rec in sorted(records.items(), key=lambda item: int(item[1]["index"])):
+            f.write(f"{rec['index']}\t{base}\t{rec['member']}\t{rec['size']}\t{rec['mtime_ns']}\t{rec['sha1']}\n")
+    os.replace(tmp_path, path)
+
+
+def pdf_image(data: bytes) -> Tuple[bytes, int, int, str]:
+    """(JPEG bytes, width, height, PDF colour space) of a page; only non-JPEG/CMYK pages are re-encoded."""
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format == "JPEG" and img.mode in ("RGB", "L"):
+            return data, img.width, img.height, "/DeviceGray" if img.mode == "L" else "/DeviceRGB"
+        rgb = img.convert("RGB")
+    buf = io.BytesIO()
+    rgb.save(buf, format="JPEG", quality=95)
+    return buf.getvalue(), rgb.width, rgb.height, "/DeviceRGB"
+
+
+class PdfWriter:
+    """
+    One image per page, written object by object. Object numbers are fixed per page slot
+    (3 + 3*i page, +1 content stream, +2 image), so a page can later be replaced by an
+    incremental update that redefines just those three objects.
+    """
+
+    def __init__(self, f: BinaryIO, slots: int, dpi: float, append: bool = False):
+        self.f = f
+        self.size = 3 + 3 * slots
+        self.dpi = dpi
+        self.offsets: Dict[int, int] = {}
+        self.kids: List[int] = []
+        if not append:
+            f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _obj(self, num: int, body: str, stream: Optional[bytes] = None):
+        self.offsets[num] = self.f.tell()
+        self.f.write(f"{num} 0 obj\n{body}".encode("ascii"))
+        if stream is not None:
+            self.f.write(b"\nstream\n")
+            self.f.write(stream)
+            self.f.write(b"\nendstream")
+        self.f.write(b"\nendobj\n")
+
+    def page(self, slot: int, data: bytes):
+        jpeg, width, height, colour = pdf_image(data)
+        w, h = width * 72.0 / self.dpi, height * 72.0 / self.dpi
+        num = 3 + 3 * slot
+        self._obj(
+            num,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w:.2f} {h:.2f}] "
+            f"/Resources << /XObject << /Im0 {num + 2} 0 R >> >> /Contents {num + 1} 0 R >>",
+        )
+        content = f"q {w:.2f} 0 0 {h:.2f} 0 0 cm /Im0 Do Q".encode("ascii")
+        self._obj(num + 1, f"<< /Length {len(content)} >>", content)
+        self._obj(
+            num + 2,
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace {colour} "
+            f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>",
+            jpeg,
+        )
+        self.kids.append(num)
+
+    def close(self, prev_xref: Optional[int] = None):
+        """Write the page tree (full file) or only the xref of the replaced objects (update)."""
+        if prev_xref is None:
+            self._obj(1, "<< /Type /Catalog /Pages 2 0 R >>")
+            kids = " ".join(f"{num} 0 R" for num in self.kids)
+            self._obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.kids)} >>")
+        xref_at = self.f.tell()
+        out = ["xref\n"]
+        if prev_xref is None:
+            out.append(f"0 {self.size}\n0000000000 65535 f \n")
+            for num in range(1, self.size):
+                out.append(f"{self.offsets[num]:010d} 00000 n \n" if num in self.offsets else "0000000000 65535 f \n")
+        else:
+            for num in sorted(self.offsets):
+                out.append(f"{num} 1\n{self.offsets[num]:010d} 00000 n \n")
+        prev = f" /Prev {prev_xref}" if prev_xref is not None else ""
+        out.append(f"trailer\n<< /Size {self.size} /Root 1 0 R{prev} >>\nstartxref\n{xref_at}\n%%EOF\n")
+        self.f.write("".join(out).encode("ascii"))
+
+
+def zip_member_info(member: str, mtime: float) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(member, date_time=time.localtime(max(mtime, 315532800))[:6])
+    info.compress_type = zipfile.ZIP_STORED  # JPEGs do not compress further
+    return info
+
+
+class VolumeExporter:
+    """
+    Packages one volume's final pages (`pages` = (base, path) in reading order) into
+    `<out_base>.cbz` / `.pdf`. Call page_ready(base) whenever a page's file is final and
+    finish() once selection is over.
+    """
+
+    def __init__(self, pages: List[Tuple[str, str]], out_base: str, formats: List[str], dpi: float = 150.0):
+        self.pages = pages
+        self.formats = [fmt for fmt in formats if fmt in FORMATS]
+        for fmt in formats:
+            if fmt not in FORMATS:
+                print(f"[WARN] Unknown export format {fmt!r}; supported: {', '.join(FORMATS)}.")
+        self.paths = {fmt: f"{out_base}.{fmt}" for fmt in self.formats}
+        self.manifest_path = out_base + MANIFEST_SUFFIX
+        self.dpi = dpi
+        self.previous = load_manifest(self.manifest_path)
+        self.records: Dict[str, Dict[str, str]] = {}
+        self.ready: set = set()
+        self.next = 0
+        self.done = not self.formats
+        self.width = max(3, len(str(len(pages))))
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._pdf_file: Optional[BinaryIO] = None
+        self._pdf: Optional[PdfWriter] = None
+        # A run over the same page list only patches pages that changed; anything else is (re)built while selecting.
+        self.streaming = not self._can_update()
+        if self.formats:
+            os.makedirs(os.path.dirname(os.path.abspath(out_base)), exist_ok=True)
+
+    def _can_update(self) -> bool:
+        if not self.previous or not all(os.path.isfile(path) for path in self.paths.values()):
+            return False
+        existing = [(str(i), base) for i, (base, path) in enumerate(self.pages) if os.path.isfile(path)]
+        recorded = sorted(((rec["index"], base) for base, rec in self.previous.items()), key=lambda r: int(r[0]))
+        return existing == recorded
+
+    def _member(self, index: int, base: str, path: str) -> str:
+        ext = os.path.splitext(path)[1].lower() or ".jpg"
+        return f"{index + 1:0{self.width}d}_{base}{ext}"
+
+    def _read(self, index: int, base: str, path: str) -> Tuple[bytes, Dict[str, str], float]:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        rec = {
+            "index": str(index),
+            "member": self._member(index, base, path),
+            "size": str(st.st_size),
+            "mtime_ns": str(st.st_mtime_ns),
+            "sha1": hashlib.sha1(data).hexdigest(),
+        }
+        return data, rec, st.st_mtime
+
+    # ---- full build (streamed in page order) ----
+    def _write_page(self, index: int, base: str, path: str):
+        if self._zip is None and self._pdf is None:
+            if "cbz" in self.paths:
+                self._zip = zipfile.ZipFile(self.paths["cbz"] + ".part", "w", zipfile.ZIP_STORED)
+            if "pdf" in self.paths:
+                self._pdf_file = open(self.paths["pdf"] + ".part", "wb")
+                self._pdf = PdfWriter(self._pdf_file, len(self.pages), self.dpi)
+        data, rec, mtime = self._read(index, base, path)
+        if self._zip is not None:
+            self._zip.writestr(zip_member_info(rec["member"], mtime), data)
+        if self._pdf is not None:
+            self._pdf.page(index, data)
+        self.records[base] = rec
+
+    def _close_full(self):
+        if self._zip is not None:
+            self._zip.close()
+            os.replace(self.paths["cbz"] + ".part", self.paths["cbz"])
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf_file.close()
+            os.replace(self.paths["pdf"] + ".part", self.paths["pdf"])
+        self._zip = self._pdf = self._pdf_file = None
+        save_manifest(self.manifest_path, self.records)
+        self.done = True
+        print(f"[EXPORT] {len(self.records)} page(s) -> {', '.join(self.paths.values())}")
+
+    def _abort(self):
+        for handle in (self._zip, self._pdf_file):
+            try:
+                if handle is not None:
+                    handle.close()
+            except Exception:
+                pass
+        for path in self.paths.values():
+            if os.path.isfile(path + ".part"):
+                os.remove(path + ".part")
+        self._zip = self._pdf = self._pdf_file = None
+        self.records = {}
+        self.next = 0
+
+    def page_ready(self, base: str):
+        self.ready.add(base)
+        if self.done or not self.streaming:
+            return
+        try:
+            while self.next < len(self.pages) and self.pages[self.next][0] in self.ready:
+                self._write_page(self.next, *self.pages[self.next])
+                self.next += 1
+            if self.next == len(self.pages):
+                self._close_full()
+        except Exception as e:
+            print(f"[WARN] Streaming export failed, rebuilding it at the end: {e}")
+            self._abort()
+            self.ready = set()
+
+    def _build_rest(self):
+        missing = []
+        for index in range(self.next, len(self.pages)):
+            base, path = self.pages[index]
+            if os.path.isfile(path):
+                self._write_page(index, base, path)
+            else:
+                missing.append(base)
+        self.next = len(self.pages)
+        if missing:
+            print(f"[WARN] Export leaves out {len(missing)} page(s) without a selected image: {', '.join(missing[:5])}")
+        self._close_full()
+
+    # ---- incremental update ----
+    def _update(self):
+        records = {base: dict(rec) for base, rec in self.previous.items()}
+        changed: List[Tuple[int, str, bytes, float]] = []
+        for index, (base, path) in enumerate(self.pages):
+            rec = records.get(base)
+            if rec is None:
+                continue
+            st = os.stat(path)
+            if rec["size"] == str(st.st_size) and rec["mtime_ns"] == str(st.st_mtime_ns):
+                continue
+            data, new_rec, mtime = self._read(index, base, path)
+            new_rec["member"] = rec["member"]
+            records[base] = new_rec
+            if new_rec["sha1"] != rec["sha1"]:
+                changed.append((index, base, data, mtime))
+        if not changed:
+            save_manifest(self.manifest_path, records)
+            self.done = True
+            print(f"[EXPORT] {', '.join(self.paths.values())} already up to date.")
+            return
+
+        live = sum(int(rec["size"]) for rec in records.values())
+        if any(os.path.getsize(path) > COMPACT_RATIO * live + COMPACT_SLACK for path in self.paths.values()):
+            print("[EXPORT] Replaced pages left too much dead space; rebuilding the export.")
+            self.next = 0
+            self._build_rest()
+            return
+
+        if "cbz" in self.paths:
+            # Append the new members and drop the old entries from the central directory.
+            with zipfile.ZipFile(self.paths["cbz"], "a", zipfile.ZIP_STORED) as zf:
+                for index, base, data, mtime in changed:
+                    member = records[base]["member"]
+                    old = zf.NameToInfo.pop(member, None)
+                    position = len(zf.filelist)
+                    if old is not None:
+                        position = zf.filelist.index(old)
+                        zf.filelist.remove(old)
+                    zf.writestr(zip_member_info(member, mtime), data)
+                    zf.filelist.insert(position, zf.filelist.pop())
+        if "pdf" in self.paths:
+            with open(self.paths["pdf"], "r+b") as f:
+                f.seek(max(0, os.path.getsize(self.paths["pdf"]) - 1024))
+                match = _STARTXREF_RE.search(f.read())
+                if match is None:
+                    raise ValueError(f"{self.paths['pdf']} has no trailer")
+                f.seek(0, os.SEEK_END)
+                writer = PdfWriter(f, len(self.pages), self.dpi, append=True)
+                for index, base, data, mtime in changed:
+                    writer.page(index, data)
+                writer.close(prev_xref=int(match.group(1)))
+        save_manifest(self.manifest_path, records)
+        self.done = True
+        print(f"[EXPORT] Updated {len(changed)} re-selected page(s) in {', '.join(self.paths.values())}")
+
+    def finish(self):
+        if self.done:
+            return
+        try:
+            if self.streaming:
+                self._build_rest()
+            else:
+                self._update()
+        except Exception as e:
+            print(f"[WARN] Export update failed ({e}); rebuilding {', '.join(self.paths.values())}.")
+            self._abort()
+            try:
+                self._build_rest()
+            except Exception as e2:
+                self._abort()
+                print(f"[WARN] Export failed: {e2}")
@@ -0,0 +1,894 @@
+import os
+import re
+import time
+import zlib
+import base64
+import json
+import random
+import pathlib
+import threading
+from io import BytesIO
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional, Union
+
+# =========================================
+# Client factory (real Gemini API or offline fake)
+# =========================================
+# allloopv3.py and select_best_outputs.py create their clients through make_client().
+# The backend is chosen by the script's GENAI_BACKEND setting or the MANGA_GENAI_BACKEND
+# environment variable:
+#   "genai" (default) -> google.genai.Client
+#   "fake"            -> FakeClient, a deterministic local stand-in (no network, no API key)
+# Given several API keys, make_client() returns a ClientPool over one client per key.
+
+BACKEND_ENV_VAR = "MANGA_GENAI_BACKEND"
+API_KEYS_ENV_VAR = "GEMINI_API_KEYS"
+
+
+def resolve_backend(configured: str = "") -> str:
+    return (configured or os.environ.get(BACKEND_ENV_VAR) or "genai").strip().lower()
+
+
+def make_client(
+    api_key: Union[str, List[str]],
+    backend: str = "",
+    http_options: Optional[Dict[str, Any]] = None,
+    pool_options: Optional[Dict[str, Any]] = None,
+):
+    """One client for one key; a ClientPool (pool_options = its keyword arguments) for several."""
+    keys = [api_key] if isinstance(api_key, str) else list(api_key)
+    if len(keys) > 1:
+        return ClientPool([make_client(k, backend, http_options) for k in keys], **(pool_options or {}))
+    api_key = keys[0] if keys else ""
+    backend = resolve_backend(backend)
+    if backend == "fake":
+        return FakeClient(get_fake_backend(), api_key)
+    if backend != "genai":
+        raise RuntimeError(f"Unknown GENAI backend: {backend!r} (expected 'genai' or 'fake')")
+
+    from google import genai
+
+    if http_options:
+        return genai.Client(api_key=api_key, http_options=http_options)
+    return genai.Client(api_key=api_key)
+
+
+def resolve_api_keys(configured_key: str = "", configured_keys: Optional[List[str]] = None) -> List[str]:
+    """
+    API keys to use, in order of precedence: the script's API_KEYS list, its API_KEY,
+    GEMINI_API_KEYS (comma-separated), then GEMINI_API_KEY / GOOGLE_API_KEY.
+    """
+    keys = [k.strip() for k in (configured_keys or []) if k and k.strip()]
+    if not keys and configured_key:
+        keys = [configured_key.strip()]
+    if not keys:
+        keys = [k.strip() for k in os.environ.get(API_KEYS_ENV_VAR, "").split(",") if k.strip()]
+    if not keys:
+        single = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY") or ""
+        keys = [single] if single else []
+    return list(dict.fromkeys(keys))
+
+
+# =========================================
+# Client pool (several API keys / projects)
+# =========================================
+# make_client() with more than one key returns a ClientPool with the same surface as one
+# client. Batch creations and online calls go to the least busy (then least recently used)
+# key that has rate-limit tokens left; a 429 / RESOURCE_EXHAUSTED answer puts that key in a cool-down and the call
+# is retried on another key. Uploaded files and cached contents belong to one project, so
+# the pool re-creates them on another key the first time a request sent there uses them.
+
+QUOTA_ERROR_RE = re.compile(r"\b429\b|RESOURCE_EXHAUSTED|quota|rate limit", re.IGNORECASE)
+RETRY_DELAY_RE = re.compile(r"retry[ _-]?(?:delay|after|in)\D{0,8}(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+TERMINAL_BATCH_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+
+def is_quota_error(exc: BaseException) -> bool:
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    return code == 429 or bool(QUOTA_ERROR_RE.search(str(exc)))
+
+
+class TokenBucket:
+    """`rate_per_min` calls per minute with bursts of up to a minute's worth; rate 0 = unlimited."""
+
+    def __init__(self, rate_per_min: float):
+        self.rate = max(0.0, rate_per_min) / 60.0
+        self.capacity = max(1.0, rate_per_min)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        if self.rate > 0:
+            self.wait_time(now)
+            self.tokens -= 1.0
+
+
+class _PoolKey:
+    def __init__(self, index: int, client, batch_per_min: float, online_per_min: float):
+        self.index = index
+        self.client = client
+        self.buckets = {"batch": TokenBucket(batch_per_min), "online": TokenBucket(online_per_min)}
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.last_used = 0.0
+        self.inflight = 0
+        self.stats = {"batches": 0, "online": 0, "throttled": 0, "replicated": 0}
+
+
+class ClientPool:
+    """
+    Several clients (one per API key) behind the batches / models / files / caches surface.
+    batch_per_min / online_per_min are each key's own limits (0 = only react to 429s).
+    Pools over the same keys in the same order can pass `shared_with` to know each other's
+    uploads and caches (e.g. files uploaded through the text client, used by image requests).
+    """
+
+    def __init__(
+        self,
+        clients: List[Any],
+        batch_per_min: float = 0.0,
+        online_per_min: float = 0.0,
+        cooldown_sec: float = 60.0,
+        max_cooldown_sec: float = 900.0,
+        shared_with: Optional["ClientPool"] = None,
+    ):
+        if not clients:
+            raise ValueError("ClientPool needs at least one client")
+        self._keys = [_PoolKey(i, c, batch_per_min, online_per_min) for i, c in enumerate(clients)]
+        self.cooldown_sec = cooldown_sec
+        self.max_cooldown_sec = max_cooldown_sec
+        self._lock = threading.Lock()
+        self._job_owner: Dict[str, int] = {}
+        # file uri / cache name -> owner key, per-key replicas and how to re-create it
+        self._resources: Dict[str, Dict[str, Any]] = shared_with._resources if shared_with else {}
+        self.batches = _PoolBatches(self)
+        self.models = _PoolModels(self)
+        self.files = _PoolFiles(self)
+        self.caches = _PoolCaches(self)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    # ---- dispatch ----
+    def _acquire(self, kind: str) -> _PoolKey:
+        """Wait for a key that is not cooling down and has a token for `kind`, and take the token."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                keys = self._keys
+                ready = [k for k in keys if k.cooldown_until <= now and k.buckets[kind].wait_time(now) <= 0]
+                if ready:
+                    slot = min(ready, key=lambda k: (k.inflight, k.last_used))
+                    slot.buckets[kind].take(now)
+                    slot.last_used = now
+                    return slot
+                delay = min(max(k.cooldown_until - now, k.buckets[kind].wait_time(now)) for k in keys)
+            time.sleep(min(max(delay, 0.05), 30.0))
+
+    def _throttle(self, slot: _PoolKey, exc: BaseException):
+        match = RETRY_DELAY_RE.search(str(exc))
+        delay = float(match.group(1)) if match else min(self.max_cooldown_sec, self.cooldown_sec * (2 ** slot.strikes))
+        with self._lock:
+            slot.strikes += 1
+            slot.stats["throttled"] += 1
+            slot.cooldown_until = time.monotonic() + delay
+        others = "retrying on another key" if len(self._keys) > 1 else "waiting"
+        print(f"[POOL] Key #{slot.index + 1} throttled ({type(exc).__name__}); cooling down {delay:.0f}s, {others}.")
+
+    def _call(self, kind: str, fn):
+        """Run fn(slot) on a ready key; quota errors move on to the next key. Returns (slot, result)."""
+        attempts = 0
+        while True:
+            slot = self._acquire(kind)
+            try:
+                result = fn(slot)
+            except Exception as e:
+                attempts += 1
+                if not is_quota_error(e) or attempts >= 4 * len(self._keys):
+                    raise
+                self._throttle(slot, e)
+                continue
+            slot.strikes = 0
+            slot.stats[kind if kind == "online" else "batches"] += 1
+            return slot, result
+
+    # ---- per-project resources ----
+    def _register(self, name: str, owner: int, recreate):
+        with self._lock:
+            self._resources[name] = {"owner": owner, "recreate": recreate, "replicas": {owner: name}, "created": {}}
+
+    def _replica(self, name: str, slot: _PoolKey) -> str:
+        rec = self._resources.get(name)
+        if rec is None:
+            return name  # not created through this pool (e.g. an upload from an earlier run)
+        local = rec["replicas"].get(slot.index)
+        if local is None:
+            local = rec["recreate"](slot.client)
+            rec["replicas"][slot.index] = local
+            rec["created"][slot.index] = time.time()
+            slot.stats["replicated"] += 1
+        return local
+
+    def _localize(self, req: Dict[str, Any], slot: _PoolKey) -> Dict[str, Any]:
+        """Copy of `req` with file URIs and cached contents replaced by the slot's own replicas."""
+        config = req.get("config")
+        if isinstance(config, dict) and config.get("cached_content"):
+            local = self._replica(config["cached_content"], slot)
+            if local != config["cached_content"]:
+                req = dict(req, config=dict(config, cached_content=local))
+        contents = req.get("contents")
+        if not isinstance(contents, list):
+            return req
+        new_contents = []
+        changed = False
+        for content in contents:
+            parts = content.get("parts") if isinstance(content, dict) else None
+            if not parts:
+                new_contents.append(content)
+                continue
+            new_parts = []
+            for part in parts:
+                uri = (part.get("file_data") or {}).get("file_uri") if isinstance(part, dict) else None
+                local = self._replica(uri, slot) if uri else uri
+                if local != uri:
+                    part = dict(part, file_data=dict(part["file_data"], file_uri=local))
+                    changed = True
+                new_parts.append(part)
+            new_contents.append(dict(content, parts=new_parts))
+        return dict(req, contents=new_contents) if changed else req
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"key #{k.index + 1}: {k.stats['batches']} batch(es), {k.stats['online']} call(s), "
+            f"{k.stats['throttled']} throttled, {k.stats['replicated']} replicated"
+            for k in self._keys
+        )
+
+    def close(self):
+        for k in self._keys:
+            try:
+                k.client.close()
+            except Exception:
+                pass
+
+
+class _PoolBatches:
+    def __init__(self, pool: ClientPool):
+        self._pool = pool
+
+    def create(self, model: str, src, config=None):
+        pool = self._pool
+        src = list(src)
+
+        def create_on(slot: _PoolKey):
+            local_src = [pool._localize(req, slot) for req in src]
+            return slot.client.batches.create(model=model, src=local_src, config=config)
+
+        slot, job = pool._call("batch", create_on)
+        with pool._lock:
+            pool._job_owner[job.name] = slot.index
+            slot.inflight += 1
+        return job
+
+    def get(self, name: str):
+        pool = self._pool
+        owner = pool._job_owner.get(name)
+        while True:
+            slot = pool._keys[owner or 0]
+            try:
+                job = slot.client.batches.get(name=name)
+            except Exception as e:
+                if not is_quota_error(e):
+                    raise
+                pool._throttle(slot, e)
+                time.sleep(max(0.0, slot.cooldown_until - time.monotonic()))
+                continue
+            if owner is not None and job.state.name in TERMINAL_BATCH_STATES:
+                with pool._lock:
+                    if pool._job_owner.pop(name, None) is not None:
+                        slot.inflight -= 1
+            return job
+
+
+class _PoolModels:
+    def __init__(self, pool: ClientPool):
+        self._pool = pool
+
+    def generate_content(self, model: str, contents, config=None):
+        pool = self._pool
+        req = {"contents": contents if isinstance(contents, list) else [contents], "config": config}
+
+        def call_on(slot: _PoolKey):
+            local = pool._localize(req, slot)
+            return slot.client.models.generate_content(model=model, contents=local["contents"], config=local["config"])
+
+        return pool._call("online", call_on)[1]
+
+
+class _PoolFiles:
+    def __init__(self, pool: ClientPool):
+        self._pool = pool
+
+    def upload(self, file, config=None):
+        def send(client):
+            if hasattr(file, "seek"):
+                file.seek(0)  # in-memory pages are read again by every attempt and replica
+            return client.files.upload(file=file, config=config)
+
+        slot, uploaded = self._pool._call("online", lambda s: send(s.client))
+        self._pool._register(uploaded.uri, slot.index, lambda client: send(client).uri)
+        return uploaded
+
+
+class _PoolCaches:
+    def __init__(self, pool: ClientPool):
+        self._pool = pool
+
+    def create(self, model: str, config=None):
+        slot, cache = self._pool._call("online", lambda s: s.client.caches.create(model=model, config=config))
+        self._pool._register(cache.name, slot.index, lambda client: client.caches.create(model=model, config=config).name)
+        return cache
+
+    def replica_times(self, name: str) -> List[float]:
+        """Creation times (time.time()) of the copies of cache `name` made for other keys; each is stored and billed separately."""
+        rec = self._pool._resources.get(name)
+        return list(rec["created"].values()) if rec else []
+
+    def delete(self, name: str):
+        pool = self._pool
+        rec = pool._resources.pop(name, None)
+        replicas = rec["replicas"] if rec else {0: name}
+        first_error = None
+        for index, local in replicas.items():
+            try:
+                pool._keys[index].client.caches.delete(name=local)
+            except Exception as e:
+                first_error = first_error or e
+        if first_error is not None:
+            raise first_error
+
+
+# =========================================
+# Fake backend configuration
+# =========================================
+def _env_float(name: str, default: float) -> float:
+    raw = os.environ.get(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        print(f"[WARN] Ignoring invalid {name}={raw!r}")
+        return default
+
+
+class FakeBackendConfig:
+    """
+    Knobs for the fake backend. Every value can also be set through FAKE_GENAI_<NAME>
+    environment variables (e.g. FAKE_GENAI_PASS_RATE=0.7).
+    """
+
+    def __init__(self):
+        self.seed = 0                       # Base seed; identical seed + inputs -> identical outputs
+        self.queue_polls = 1                # batches.get() calls a job stays RUNNING before finishing
+        self.queue_latency_sec = 0.0        # Minimum wall-clock time a job stays RUNNING
+        self.online_latency_sec = 0.0       # Delay for models.generate_content
+        self.batch_failure_rate = 0.0       # Probability a whole batch ends JOB_STATE_FAILED
+        self.request_failure_rate = 0.0     # Probability one inlined response carries an error instead
+        self.drop_rate = 0.0                # Probability one response comes back without any candidates
+        self.pass_rate = 0.5                # Probability an evaluation returns "O"
+        self.image_dir = ""                 # Canned output images (picked deterministically); "" = echo input
+        self.quota_error_rate = 0.0         # Probability a create/generate/upload call is refused with 429
+        self.throttled_keys = ""            # Comma-separated API keys whose calls are always refused with 429
+
+    @classmethod
+    def from_env(cls) -> "FakeBackendConfig":
+        cfg = cls()
+        cfg.seed = int(_env_float("FAKE_GENAI_SEED", cfg.seed))
+        cfg.queue_polls = int(_env_float("FAKE_GENAI_QUEUE_POLLS", cfg.queue_polls))
+        cfg.queue_latency_sec = _env_float("FAKE_GENAI_QUEUE_LATENCY_SEC", cfg.queue_latency_sec)
+        cfg.online_latency_sec = _env_float("FAKE_GENAI_ONLINE_LATENCY_SEC", cfg.online_latency_sec)
+        cfg.batch_failure_rate = _env_float("FAKE_GENAI_BATCH_FAILURE_RATE", cfg.batch_failure_rate)
+        cfg.request_failure_rate = _env_float("FAKE_GENAI_REQUEST_FAILURE_RATE", cfg.request_failure_rate)
+        cfg.drop_rate = _env_float("FAKE_GENAI_DROP_RATE", cfg.drop_rate)
+        cfg.pass_rate = _env_float("FAKE_GENAI_PASS_RATE", cfg.pass_rate)
+        cfg.image_dir = os.environ.get("FAKE_GENAI_IMAGE_DIR", cfg.image_dir)
+        cfg.quota_error_rate = _env_float("FAKE_GENAI_QUOTA_ERROR_RATE", cfg.quota_error_rate)
+        cfg.throttled_keys = os.environ.get("FAKE_GENAI_THROTTLED_KEYS", cfg.throttled_keys)
+        return cfg
+
+
+# =========================================
+# Fake backend (shared by every FakeClient in the process)
+# =========================================
+CANDIDATE_TAG_RE = re.compile(r"<CANDIDATE_(\d+)>")
+PAGE_TAG_RE = re.compile(r"<PAGE_(\d+)>")
+
+FAKE_EVAL_REASONS = [
+    "Re-translate the top-right speech bubble into natural Korean and keep it on two short horizontal lines.",
+    "Japanese sound effect in the bottom panel was left untranslated; localize it into Korean.",
+    "The narration box in panel 1 uses vertical Korean; rewrite it as horizontal lines with a smaller font.",
+    "Tone of the second bubble is too formal for this character; use casual speech.",
+]
+
+
+class FakeBackend:
+    """
+    Deterministic in-process replacement for the parts of the Gemini API this repo uses:
+    batches.create / batches.get with inlined responses, models.generate_content, files.upload
+    and caches.create / caches.delete.
+    Responses depend only on the seed, the request content and how often the same request was sent.
+    """
+
+    def __init__(self, config: Optional[FakeBackendConfig] = None):
+        self.config = config or FakeBackendConfig.from_env()
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._seen: Dict[str, int] = {}
+        self._canned: Optional[List[str]] = None
+        self._files: Dict[str, bytes] = {}  # uri -> uploaded bytes
+        self._caches: Dict[str, Dict[str, Any]] = {}  # name -> {"model", "contents"}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats: Dict[str, Any] = {
+            "batches_created": 0,
+            "batch_polls": 0,
+            "online_calls": 0,
+            "requests": {},          # kind -> count ("script", "image", "eval", "rank", "analysis", ...)
+            "upload_bytes": 0,       # inline image data + prompt text received
+            "batch_wait_sec": 0.0,   # wall time between batch creation and the first terminal poll
+            "files_uploaded": 0,
+            "file_upload_bytes": 0,
+            "caches_created": 0,
+            "cached_requests": 0,    # requests that referenced cached content
+            "quota_errors": 0,       # calls refused with a simulated 429
+        }
+
+    # ---- request inspection ----
+    @staticmethod
+    def _parts(request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        parts: List[Dict[str, Any]] = []
+        for content in request.get("contents") or []:
+            if isinstance(content, dict):
+                parts.extend(content.get("parts") or [])
+        return parts
+
+    @staticmethod
+    def _modalities(request: Dict[str, Any]) -> List[str]:
+        config = request.get("config") or {}
+        return [str(m).upper() for m in (config.get("response_modalities") or ["TEXT"])]
+
+    def classify(self, request: Dict[str, Any]) -> str:
+        if "IMAGE" in self._modalities(request):
+            return "image"
+        text = "".join(p.get("text", "") for p in self._parts(request))
+        if "<CANDIDATE_1>" in text:
+            return "rank"
+        if "<TRANSLATED_IMAGE>" in text:
+            return "eval"
+        if "=== REVISION MODE ===" in text:
+            return "patch"
+        if "=== MULTI-PAGE MODE ===" in text:
+            return "multi_script"
+        if "TEXT or NO_TEXT" in text:
+            return "triage"
+        if "manga page analyst" in text:
+            return "analysis"
+        if "consolidate reviewer notes" in text:
+            return "feedback"
+        return "script"
+
+    def _fingerprint(self, model: str, request: Dict[str, Any]) -> str:
+        crc = zlib.crc32(model.encode("utf-8"))
+        seed = (request.get("config") or {}).get("seed")
+        if seed is not None:
+            crc = zlib.crc32(f"seed={seed}".encode("ascii"), crc)
+        for part in self._parts(request):
+            if "text" in part:
+                crc = zlib.crc32(part["text"].encode("utf-8"), crc)
+            elif "inline_data" in part:
+                data = part["inline_data"].get("data", "")
+                data = data if isinstance(data, (bytes, bytearray)) else str(data).encode("ascii")
+                crc = zlib.crc32(data[:512] + data[-512:] + str(len(data)).encode("ascii"), crc)
+            elif "file_data" in part:
+                crc = zlib.crc32(str(part["file_data"].get("file_uri", "")).encode("utf-8"), crc)
+        return f"{crc:08x}"
+
+    def _rng(self, model: str, request: Dict[str, Any]) -> random.Random:
+        fp = self._fingerprint(model, request)
+        with self._lock:
+            n = self._seen.get(fp, 0)
+            self._seen[fp] = n + 1
+        return random.Random(f"{self.config.seed}|{fp}|{n}")
+
+    def _count(self, kind: str, request: Dict[str, Any]):
+        size = 0
+        for part in self._parts(request):
+            if "text" in part:
+                size += len(part["text"].encode("utf-8"))
+            elif "inline_data" in part:
+                size += len(part["inline_data"].get("data", ""))
+        with self._lock:
+            self.stats["requests"][kind] = self.stats["requests"].get(kind, 0) + 1
+            self.stats["upload_bytes"] += size
+
+    # ---- response synthesis ----
+    def _canned_images(self) -> List[str]:
+        if self._canned is None:
+            folder = self.config.image_dir
+            exts = {".png", ".jpg", ".jpeg", ".webp"}
+            if folder and os.path.isdir(folder):
+                self._canned = sorted(
+                    os.path.join(folder, f) for f in os.listdir(folder) if pathlib.Path(f).suffix.lower() in exts
+                )
+            else:
+                self._canned = []
+        return self._canned
+
+    def _image_part(self, request: Dict[str, Any], rng: random.Random):
+        canned = self._canned_images()
+        if canned:
+            path = canned[rng.randrange(len(canned))]
+            with open(path, "rb") as f:
+                data = f.read()
+            mime = "image/png" if path.lower().endswith(".png") else "image/jpeg"
+            return SimpleNamespace(text=None, inline_data=SimpleNamespace(mime_type=mime, data=data))
+        for part in self._parts(request):
+            file_data = part.get("file_data")
+            if file_data and file_data.get("file_uri") in self._files:
+                data = self._files[file_data["file_uri"]]
+                return SimpleNamespace(
+                    text=None,
+                    inline_data=SimpleNamespace(mime_type=file_data.get("mime_type", "image/png"), data=data),
+                )
+            inline = part.get("inline_data")
+            if inline:
+                data = inline.get("data", b"")
+                if isinstance(data, str):
+                    data = base64.b64decode(data)
+                return SimpleNamespace(
+                    text=None,
+                    inline_data=SimpleNamespace(mime_type=inline.get("mime_type", "image/png"), data=bytes(data)),
+                )
+        return SimpleNamespace(text=None, inline_data=SimpleNamespace(mime_type="image/png", data=_blank_png()))
+
+    def _text(self, kind: str, request: Dict[str, Any], rng: random.Random) -> str:
+        if kind == "eval":
+            if rng.random() < self.config.pass_rate:
+                return "O\nAll text is translated and placed horizontally."
+            return "X\n" + rng.choice(FAKE_EVAL_REASONS)
+        if kind == "rank":
+            text = "".join(p.get("text", "") for p in self._parts(request))
+            n = max([int(m) for m in CANDIDATE_TAG_RE.findall(text)] or [1])
+            return f"BEST: {rng.randint(1, n)}\nFake ranking."
+        if kind == "triage":
+            return "TEXT" if rng.random() < 0.9 else "NO_TEXT"
+        if kind == "patch":
+            text = "".join(p.get("text", "") for p in self._parts(request))
+            previous = text.split("=== PREVIOUS SCRIPT ===", 1)[-1].split("=== END PREVIOUS SCRIPT ===", 1)[0]
+            lines = [line for line in previous.splitlines() if "Translation:" in line]
+            if not lines or rng.random() < 0.1:
+                return json.dumps({"edits": [{"find": "(no such line)", "replace": ""}]})
+            line = rng.choice(lines)
+            return json.dumps({"edits": [{"find": line, "replace": line.rstrip('"') + ' (revised)"'}]}, ensure_ascii=False)
+        if kind == "feedback":
+            return "\n".join(rng.sample(FAKE_EVAL_REASONS, 2))
+        if kind == "analysis":
+            panels, elements = [], []
+            for panel in range(1, rng.randint(2, 4) + 1):
+                top = (panel - 1) * 250
+                panels.append({"panel": panel, "box": [top, 0, top + 240, 1000]})
+                elements.append(
+                    {
+                        "id": f"P{panel}-B1",
+                        "panel": panel,
+                        "type": "speech",
+                        "box": [top + 20, 600, top + 120, 700],
+                        "orientation": "vertical",
+                        "source_text": "テスト",
+                        "speaker": "",
+                        "notes": "",
+                    }
+                )
+            return json.dumps({"panels": panels, "elements": elements}, ensure_ascii=False)
+        if kind == "multi_script":
+            text = "".join(p.get("text", "") for p in self._parts(request))
+            count = max([int(m) for m in PAGE_TAG_RE.findall(text)] or [1])
+            pages = [{"page": n, "script": self._script(rng)} for n in range(1, count + 1)]
+            if count > 1 and rng.random() < 0.1:
+                pages.pop(rng.randrange(count))  # incomplete answer: the caller falls back to single pages
+            return json.dumps({"pages": pages}, ensure_ascii=False)
+        return self._script(rng)
+
+    @staticmethod
+    def _script(rng: random.Random) -> str:
+        lines = []
+        for panel in range(1, rng.randint(2, 4) + 1):
+            lines.append(f"Panel {panel}")
+            lines.append(f"  - Location: Bubble 1 in Panel {panel}.")
+            lines.append(f'  - Source Text: 「テスト{panel}」')
+            lines.append(f'  - Korean Translation: "테스트 {panel}"')
+            lines.append(f'  - Font/Layout Hint: about 8–10 px. Line 1: "테스트 {panel}"')
+        return "\n".join(lines)
+
+    def _expand_cached(self, model: str, request: Dict[str, Any]):
+        """Prepend the referenced cached contents, as the real API does. Returns (request, error)."""
+        name = (request.get("config") or {}).get("cached_content")
+        if not name:
+            return request, None
+        with self._lock:
+            cache = self._caches.get(name)
+            self.stats["cached_requests"] += 1
+        if cache is None:
+            return request, {"code": 404, "message": f"fake backend: cached content {name} not found"}
+        if cache["model"] != model:
+            return request, {"code": 400, "message": f"fake backend: cached content {name} belongs to {cache['model']}"}
+        return dict(request, contents=list(cache["contents"]) + list(request.get("contents") or [])), None
+
+    def respond(self, model: str, request: Dict[str, Any]):
+        """Return (response, error) for one request."""
+        sent = request
+        request, cache_error = self._expand_cached(model, request)
+        kind = self.classify(request)
+        self._count(kind, sent)
+        if cache_error:
+            return None, cache_error
+        rng = self._rng(model, request)
+        if rng.random() < self.config.request_failure_rate:
+            return None, {"code": 500, "message": "fake backend: simulated request failure"}
+        if rng.random() < self.config.drop_rate:
+            return SimpleNamespace(candidates=[], prompt_feedback=None, usage_metadata=None), None
+        if kind == "image":
+            part = self._image_part(request, rng)
+            size = ((request.get("config") or {}).get("image_config") or {}).get("image_size")
+            if size in IMAGE_SIZE_LONG_SIDE:
+                part = _resize_image_part(part, IMAGE_SIZE_LONG_SIDE[size])
+        else:
+            part = SimpleNamespace(text=self._text(kind, request, rng), inline_data=None)
+        response = SimpleNamespace(
+            candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+            prompt_feedback=None,
+            usage_metadata=None,
+        )
+        return response, None
+
+    # ---- quota ----
+    def check_quota(self, api_key: str, operation: str):
+        """Raise a simulated 429 for throttled keys (and at quota_error_rate) before an API call."""
+        throttled = {k.strip() for k in self.config.throttled_keys.split(",") if k.strip()}
+        with self._lock:
+            n = self.stats["quota_errors"] + sum(self.stats["requests"].values()) + self.stats["batches_created"]
+        refused = api_key in throttled or (
+            self.config.quota_error_rate > 0
+            and random.Random(f"{self.config.seed}|quota|{operation}|{api_key}|{n}").random() < self.config.quota_error_rate
+        )
+        if refused:
+            with self._lock:
+                self.stats["quota_errors"] += 1
+            raise FakeQuotaError(f"429 RESOURCE_EXHAUSTED: fake backend quota exceeded for {operation}")
+
+    # ---- files ----
+    def upload_file(self, file, mime_type: Optional[str] = None):
+        """`file` is a path or a binary stream, like files.upload accepts."""
+        if hasattr(file, "read"):
+            data = file.read()
+        else:
+            with open(file, "rb") as f:
+                data = f.read()
+        with self._lock:
+            self.stats["files_uploaded"] += 1
+            self.stats["file_upload_bytes"] += len(data)
+            n = self.stats["files_uploaded"]
+            uri = f"fake://files/{n:06d}"
+            self._files[uri] = data
+        return SimpleNamespace(name=f"files/fake-{n:06d}", uri=uri, mime_type=mime_type or "image/png")
+
+    # ---- context caches ----
+    def create_cache(self, model: str, config: Dict[str, Any]):
+        contents = list(config.get("contents") or [])
+        if config.get("system_instruction"):
+            contents.insert(0, {"role": "user", "parts": [{"text": str(config["system_instruction"])}]})
+        chars = sum(len(p.get("text", "")) for p in self._parts({"contents": contents}))
+        with self._lock:
+            self.stats["caches_created"] += 1
+            name = f"cachedContents/fake-{self.stats['caches_created']:06d}"
+            self._caches[name] = {"model": model, "contents": contents}
+        return SimpleNamespace(
+            name=name,
+            model=model,
+            display_name=config.get("display_name", ""),
+            usage_metadata=SimpleNamespace(total_token_count=max(1, chars // 4)),
+        )
+
+    def delete_cache(self, name: str):
+        with self._lock:
+            self._caches.pop(name, None)
+
+    # ---- batch bookkeeping ----
+    def create_batch(self, model: str, src: List[Dict[str, Any]], config: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self.stats["batches_created"] += 1
+            name = f"batches/fake-{self.stats['batches_created']:06d}"
+        display_name = (config or {}).get("display_name", "")
+        batch_rng = random.Random(f"{self.config.seed}|batch|{display_name}|{name}")
+        failed = batch_rng.random() < self.config.batch_failure_rate
+        responses = []
+        if not failed:
+            for request in src:
+                resp, err = self.respond(model, request)
+                responses.append(SimpleNamespace(response=resp, error=err, metadata=None))
+        job = {
+            "name": name,
+            "display_name": display_name,
+            "polls_left": max(0, self.config.queue_polls),
+            "created_at": time.monotonic(),
+            "ready_at": time.monotonic() + max(0.0, self.config.queue_latency_sec),
+            "finished": False,
+            "final_state": "JOB_STATE_FAILED" if failed else "JOB_STATE_SUCCEEDED",
+            "responses": responses,
+        }
+        with self._lock:
+            self._jobs[name] = job
+        return _job_view(job, "JOB_STATE_PENDING")
+
+    def get_batch(self, name: str):
+        with self._lock:
+            self.stats["batch_polls"] += 1
+            job = self._jobs.get(name)
+            if job is None:
+                raise RuntimeError(f"fake backend: unknown batch {name}")
+            if job["polls_left"] > 0 or time.monotonic() < job["ready_at"]:
+                job["polls_left"] = max(0, job["polls_left"] - 1)
+                return _job_view(job, "JOB_STATE_RUNNING")
+            if not job["finished"]:
+                job["finished"] = True
+                self.stats["batch_wait_sec"] += time.monotonic() - job["created_at"]
+        return _job_view(job, job["final_state"])
+
+
+def _job_view(job: Dict[str, Any], state: str):
+    dest = None
+    if state == "JOB_STATE_SUCCEEDED":
+        dest = SimpleNamespace(inlined_responses=list(job["responses"]))
+    return SimpleNamespace(
+        name=job["name"],
+        display_name=job["display_name"],
+        state=SimpleNamespace(name=state),
+        dest=dest,
+    )
+
+
+IMAGE_SIZE_LONG_SIDE = {"1K": 1024, "2K": 2048, "4K": 4096}
+
+
+def _resize_image_part(part, long_side: int):
+    """Scale an image part so its long side matches the requested image_size (as the real model does)."""
+    from PIL import Image
+
+    img = Image.open(BytesIO(part.inline_data.data)).convert("RGB")
+    scale = long_side / max(img.size)
+    img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return SimpleNamespace(text=None, inline_data=SimpleNamespace(mime_type="image/png", data=buf.getvalue()))
+
+
+_BLANK_PNG: Optional[bytes] = None
+
+
+def _blank_png() -> bytes:
+    global _BLANK_PNG
+    if _BLANK_PNG is None:
+        from PIL import Image
+
+        buf = BytesIO()
+        Image.new("RGB", (64, 96), "white").save(buf, format="PNG")
+        _BLANK_PNG = buf.getvalue()
+    return _BLANK_PNG
+
+
+_FAKE_BACKEND: Optional[FakeBackend] = None
+
+
+def get_fake_backend() -> FakeBackend:
+    """Process-wide fake backend shared by every FakeClient (so stats cover both scripts)."""
+    global _FAKE_BACKEND
+    if _FAKE_BACKEND is None:
+        _FAKE_BACKEND = FakeBackend()
+    return _FAKE_BACKEND
+
+
+def configure_fake_backend(**overrides) -> FakeBackend:
+    """Replace the shared fake backend with a fresh one (env defaults + keyword overrides)."""
+    global _FAKE_BACKEND
+    cfg = FakeBackendConfig.from_env()
+    for key, value in overrides.items():
+        if not hasattr(cfg, key):
+            raise AttributeError(f"Unknown fake backend setting: {key}")
+        setattr(cfg, key, value)
+    _FAKE_BACKEND = FakeBackend(cfg)
+    return _FAKE_BACKEND
+
+
+# =========================================
+# Fake client (same surface as google.genai.Client for this repo)
+# =========================================
+class FakeQuotaError(RuntimeError):
+    code = 429
+
+
+class _FakeBatches:
+    def __init__(self, backend: FakeBackend, api_key: str = ""):
+        self._backend = backend
+        self._api_key = api_key
+
+    def create(self, model: str, src, config=None):
+        self._backend.check_quota(self._api_key, "batches.create")
+        return self._backend.create_batch(model, list(src), config)
+
+    def get(self, name: str):
+        return self._backend.get_batch(name)
+
+
+class _FakeModels:
+    def __init__(self, backend: FakeBackend, api_key: str = ""):
+        self._backend = backend
+        self._api_key = api_key
+
+    def generate_content(self, model: str, contents, config=None):
+        self._backend.check_quota(self._api_key, "models.generate_content")
+        with self._backend._lock:
+            self._backend.stats["online_calls"] += 1
+        if self._backend.config.online_latency_sec > 0:
+            time.sleep(self._backend.config.online_latency_sec)
+        if isinstance(contents, dict):
+            contents = [contents]
+        request = {"contents": list(contents), "config": dict(config or {})}
+        response, error = self._backend.respond(model, request)
+        if response is None:
+            raise RuntimeError(f"fake backend: {error['message']}")
+        return response
+
+
+class _FakeFiles:
+    def __init__(self, backend: FakeBackend, api_key: str = ""):
+        self._backend = backend
+        self._api_key = api_key
+
+    def upload(self, file, config=None):
+        self._backend.check_quota(self._api_key, "files.upload")
+        mime_type = (config or {}).get("mime_type") if isinstance(config, dict) else None
+        return self._backend.upload_file(file, mime_type)
+
+
+class _FakeCaches:
+    def __init__(self, backend: FakeBackend, api_key: str = ""):
+        self._backend = backend
+        self._api_key = api_key
+
+    def create(self, model: str, config=None):
+        self._backend.check_quota(self._api_key, "caches.create")
+        return self._backend.create_cache(model, dict(config or {}))
+
+    def delete(self, name: str):
+        self._backend.delete_cache(name)
+
+
+class FakeClient:
+    def __init__(self, backend: FakeBackend, api_key: str = ""):
+        self.backend = backend
+        self.batches = _FakeBatches(backend, api_key)
+        self.models = _FakeModels(backend, api_key)
+        self.files = _FakeFiles(backend, api_key)
+        self.caches = _FakeCaches(backend, api_key)
+
+    def close(self):
+        pass
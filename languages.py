@@ -0,0 +1,135 @@
+import re
+from typing import Dict
+
+# =========================================
+# Target languages (shared by allloopv3.py and select_best_outputs.py)
+# =========================================
+# The prompts in both scripts are written for Korean. The fragments that do not carry over by
+# renaming the language are {field} placeholders filled from the target's profile (PROMPT_FIELDS):
+# which languages count as source text, the script name, the unit of the characters-per-width
+# hint and the spelling rule. localize_prompt() fills them and retargets the rest; codes name the
+# per-language output trees (BASE_DIR/<code>/...).
+PROMPT_FIELDS = ("source_langs", "script", "char_unit", "chars_per_width", "script_rule")
+
+LANGUAGE_PROFILES: Dict[str, Dict[str, str]] = {
+    "Korean": {
+        "code": "ko",
+        "native": "한국어",
+        "source_langs": "Japanese or English",
+        "script": "Hangul",
+        "char_unit": "Hangul characters",
+        "chars_per_width": "5–6 Hangul characters",
+        "script_rule": "in Hangul (Korean script), not in English and not in romanization",
+    },
+    "English": {
+        "code": "en",
+        "native": "English",
+        "source_langs": "Japanese",
+        "script": "the Latin alphabet",
+        "char_unit": "letters",
+        "chars_per_width": "9–11 letters",
+        "script_rule": "in standard English spelling, not in romanized Japanese",
+    },
+    "Chinese": {
+        "code": "zh",
+        "native": "中文",
+        "source_langs": "Japanese or English",
+        "script": "Simplified Chinese characters",
+        "char_unit": "Chinese characters",
+        "chars_per_width": "5–6 Chinese characters",
+        "script_rule": "in Simplified Chinese characters, not in English and not in pinyin",
+    },
+    "Traditional Chinese": {
+        "code": "zh-hant",
+        "native": "繁體中文",
+        "source_langs": "Japanese or English",
+        "script": "Traditional Chinese characters",
+        "char_unit": "Chinese characters",
+        "chars_per_width": "5–6 Chinese characters",
+        "script_rule": "in Traditional Chinese characters, not in English and not in pinyin",
+    },
+    "Spanish": {
+        "code": "es",
+        "native": "Español",
+        "source_langs": "Japanese or English",
+        "script": "the Latin alphabet",
+        "char_unit": "letters",
+        "chars_per_width": "9–11 letters",
+        "script_rule": "in standard Spanish spelling with its accents, not in English and not in romanized Japanese",
+    },
+    "French": {
+        "code": "fr",
+        "native": "Français",
+        "source_langs": "Japanese or English",
+        "script": "the Latin alphabet",
+        "char_unit": "letters",
+        "chars_per_width": "9–11 letters",
+        "script_rule": "in standard French spelling with its accents, not in English and not in romanized Japanese",
+    },
+    "German": {
+        "code": "de",
+        "native": "Deutsch",
+        "source_langs": "Japanese or English",
+        "script": "the Latin alphabet",
+        "char_unit": "letters",
+        "chars_per_width": "8–10 letters",
+        "script_rule": "in standard German spelling with its umlauts, not in English and not in romanized Japanese",
+    },
+}
+
+# Source-language lists in clauses about text that must not stay on the page
+_UNTRANSLATED_CLAUSE = re.compile(r"\b(?:untranslated|remaining|left as)\s+([A-Z]\w*(?:\s*(?:/|,|\bor\b|\band\b)?\s*[A-Z]\w*)*)")
+
+
+def language_profile(lang: str) -> Dict[str, str]:
+    profile = LANGUAGE_PROFILES.get(lang)
+    if profile:
+        return profile
+    code = re.sub(r"[^a-z0-9]+", "-", lang.lower()).strip("-") or "lang"
+    return {
+        "code": code,
+        "native": lang,
+        "source_langs": "Japanese or English",
+        "script": f"the {lang} writing system",
+        "char_unit": "characters",
+        "chars_per_width": "5–6 characters",
+        "script_rule": f"in the {lang} writing system, not in English and not in romanization",
+    }
+
+
+def fill_language_fields(text: str, lang: str) -> str:
+    """Fill the PROMPT_FIELDS placeholders of a Korean prompt fragment for `lang` (no header)."""
+    profile = language_profile(lang)
+    for field in PROMPT_FIELDS:
+        text = text.replace("{" + field + "}", profile[field])
+    if lang != "Korean":
+        text = re.sub(r"\bKorean\b", lang, text)
+    return text
+
+
+def localize_prompt(prompt: str, lang: str) -> str:
+    """The prompts are written for Korean; fill their language fields and retarget them to `lang`."""
+    text = fill_language_fields(prompt, lang)
+    if lang == "Korean":
+        return text
+    profile = language_profile(lang)
+    header = (
+        f"\nTarget language: {lang} ({profile['native']}).\n"
+        f"Some examples below are written in Korean; apply the same rules to {lang} text.\n"
+    )
+    return header + text
+
+
+def check_prompts(prompts: Dict[str, str], lang: str):
+    """
+    Raise ValueError if a localized prompt still has an unfilled language field, or names the
+    target language itself among the untranslated / remaining source languages.
+    """
+    target = re.compile(rf"\b{re.escape(lang)}\b")
+    for name, prompt in prompts.items():
+        for field in PROMPT_FIELDS:
+            if "{" + field + "}" in prompt:
+                raise ValueError(f"{name} for {lang} has an unfilled {{{field}}} field")
+        for match in _UNTRANSLATED_CLAUSE.finditer(prompt):
+            if target.search(match.group(1)):
+                raise ValueError(f"{name} for {lang} asks to remove {lang} text: {match.group(0)!r}")
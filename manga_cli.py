@@ -0,0 +1,343 @@
+import os
+import re
+import sys
+import ast
+import json
+import pathlib
+import argparse
+from typing import List, Dict, Any, Optional
+
+# =========================================
+# Command line entry point
+# =========================================
+# One front end for the pipeline scripts. Only the standard library is imported here; the
+# pipeline modules (and with them PIL, NumPy, google.genai) are imported by the subcommand
+# that needs them, so `status` reads the output folders straight from disk and answers
+# without loading a model client or touching the network (cheap enough to poll from cron).
+#
+#   python manga_cli.py run --input manga --set MAX_ITERATIONS=3
+#   python manga_cli.py run --dry-run
+#   python manga_cli.py status [--json]
+#   python manga_cli.py eval-only [--iteration 2]
+#   python manga_cli.py select
+#   python manga_cli.py export --format cbz pdf
+#   python manga_cli.py bench --pages 100 1000
+#
+# Any module setting can be overridden with --set NAME=VALUE (a Python literal, or plain text).
+
+BASE_DIR = pathlib.Path(__file__).resolve().parent
+OUT_PREFIX = "out"                      # Same as OUTPUT_BASE_NAME in allloopv3.py
+FINAL_RENDER_DIR_NAME = "out_final"     # Same as FINAL_OUTPUT_DIR_NAME in allloopv3.py
+SELECTED_DIR_NAME = "manga_out"         # Same as FINAL_DIR in select_best_outputs.py
+LEDGER_FILE_NAME = "cost_ledger.tsv"    # Same as run_budget.LEDGER_FILE_NAME
+QUEUE_FILE_NAME = "library_queue.sqlite"  # Same as LIBRARY_QUEUE_NAME in allloopv3.py
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".webp"}
+# Folders that never hold an output tree (status does not descend into them)
+SKIP_DIRS = {"scripts", "source_analysis", "manga", SELECTED_DIR_NAME, "export", "bench_results", "__pycache__"}
+OUT_DIR_RE = re.compile(rf"{re.escape(OUT_PREFIX)}(\d+)")
+
+
+# =========================================
+# Settings overrides
+# =========================================
+def parse_value(text: str) -> Any:
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def apply_overrides(module, args: argparse.Namespace, extra: Optional[Dict[str, Any]] = None):
+    """
+    Set module-level settings from the command line: --base-dir moves every path setting that
+    lives under the module's BASE_DIR, then the named options and --set NAME=VALUE are applied.
+    """
+    if getattr(args, "base_dir", ""):
+        old = str(module.BASE_DIR)
+        new = pathlib.Path(args.base_dir).resolve()
+        for name, value in list(vars(module).items()):
+            if name.isupper() and isinstance(value, str) and (value == old or value.startswith(old + os.sep)):
+                setattr(module, name, str(new) + value[len(old) :])
+        module.BASE_DIR = new
+    settings: Dict[str, Any] = dict(extra or {})
+    if getattr(args, "input", ""):
+        settings["INPUT_DIR"] = os.path.abspath(args.input)
+    if getattr(args, "lang", None):
+        settings["TARGET_LANGS"] = list(args.lang)
+    if getattr(args, "backend", ""):
+        settings["GENAI_BACKEND"] = args.backend
+    for item in getattr(args, "set", None) or []:
+        name, sep, text = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--set expects NAME=VALUE, got {item!r}")
+        settings[name.strip()] = parse_value(text.strip())
+    for name, value in settings.items():
+        if not name.isupper() or not hasattr(module, name):
+            raise SystemExit(f"Unknown setting for {module.__name__}: {name}")
+        current = getattr(module, name)
+        if current is not None and not isinstance(value, type(current)):
+            if isinstance(current, float) and isinstance(value, int) and not isinstance(value, bool):
+                value = float(value)
+            elif isinstance(current, str):
+                value = str(value)
+            else:
+                raise SystemExit(f"{name} expects {type(current).__name__}, got {value!r}")
+        setattr(module, name, value)
+
+
+# =========================================
+# Status (files only: no pipeline imports, no network)
+# =========================================
+def count_images(folder: str) -> int:
+    try:
+        with os.scandir(folder) as entries:
+            return sum(1 for e in entries if os.path.splitext(e.name)[1].lower() in IMAGE_EXTS and e.is_file())
+    except OSError:
+        return 0
+
+
+def read_verdicts(log_path: str) -> Dict[str, str]:
+    """base -> last O/X recorded in an eval_log.tsv."""
+    verdicts: Dict[str, str] = {}
+    try:
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t", 3)
+                if len(parts) < 3 or parts[0] == "iteration" or not parts[1].strip():
+                    continue
+                verdicts[parts[1].strip()] = (parts[2].strip().upper() or "X")[:1]
+    except OSError:
+        pass
+    return verdicts
+
+
+def find_trees(base_dir: str) -> List[str]:
+    """Every folder under base_dir holding an out1 folder (language subfolders and library volumes included)."""
+    trees: List[str] = []
+    for root, dirs, _ in os.walk(base_dir):
+        if f"{OUT_PREFIX}1" in dirs:
+            trees.append(root)
+        dirs[:] = sorted(
+            d
+            for d in dirs
+            if d not in SKIP_DIRS and not d.startswith((".", "_")) and not OUT_DIR_RE.fullmatch(d) and d != FINAL_RENDER_DIR_NAME
+        )
+    return trees
+
+
+def tree_status(root: str) -> Dict[str, Any]:
+    outs = []
+    with os.scandir(root) as entries:
+        for e in entries:
+            m = OUT_DIR_RE.fullmatch(e.name)
+            if m and e.is_dir():
+                outs.append((int(m.group(1)), e.path))
+    rounds = []
+    latest: Dict[str, str] = {}  # newest verdict of every page
+    for number, path in sorted(outs):
+        verdicts = read_verdicts(os.path.join(path, "eval_log.tsv"))
+        latest.update(verdicts)
+        passed = sum(1 for v in verdicts.values() if v == "O")
+        rounds.append(
+            {
+                "round": number,
+                "images": count_images(path),
+                "evaluated": len(verdicts),
+                "passed": passed,
+                "failed": len(verdicts) - passed,
+            }
+        )
+    return {
+        "root": root,
+        "pages": rounds[0]["images"] if rounds else 0,
+        "passed": sum(1 for v in latest.values() if v == "O"),
+        "rounds": rounds,
+        "final_renders": count_images(os.path.join(root, FINAL_RENDER_DIR_NAME)),
+        "selected": count_images(os.path.join(root, SELECTED_DIR_NAME)),
+    }
+
+
+def ledger_status(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.isfile(path):
+        return None
+    spent = 0.0
+    batches = 0
+    by_stage: Dict[str, float] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 5 or parts[0] == "timestamp":
+                continue
+            try:
+                usd = float(parts[4])
+            except ValueError:
+                continue
+            if parts[1] in ("reserve", "release"):
+                continue  # batches in flight (run_budget.RESERVE / RELEASE), not spend
+            spent += usd
+            batches += parts[1] != "cache"  # context-cache storage, not a batch
+            by_stage[parts[1]] = by_stage.get(parts[1], 0.0) + usd
+    return {"path": path, "usd": round(spent, 4), "batches": batches, "by_stage": {k: round(v, 4) for k, v in by_stage.items()}}
+
+
+def queue_status(path: str) -> Optional[Dict[str, int]]:
+    if not os.path.isfile(path):
+        return None
+    import sqlite3
+
+    conn = sqlite3.connect(f"{pathlib.Path(path).resolve().as_uri()}?mode=ro", uri=True, timeout=5)
+    try:
+        return dict(conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+    except sqlite3.Error as e:
+        print(f"[WARN] Failed to read work queue {path}: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def report_status(args: argparse.Namespace) -> Dict[str, Any]:
+    base_dir = os.path.abspath(args.base_dir or BASE_DIR)
+    queue_paths = [args.queue] if args.queue else [os.path.join(base_dir, "library_out", QUEUE_FILE_NAME)]
+    return {
+        "base_dir": base_dir,
+        "trees": [tree_status(root) for root in find_trees(base_dir)],
+        "spend": ledger_status(os.path.join(base_dir, LEDGER_FILE_NAME)),
+        "queue": next((q for q in (queue_status(p) for p in queue_paths) if q is not None), None),
+    }
+
+
+def print_status(status: Dict[str, Any]):
+    base_dir = status["base_dir"]
+    if not status["trees"]:
+        print(f"No output folders ({OUT_PREFIX}1, {OUT_PREFIX}2, ...) under {base_dir}.")
+    for tree in status["trees"]:
+        name = os.path.relpath(tree["root"], base_dir)
+        print(f"{'.' if name == '.' else name}: {tree['passed']}/{tree['pages']} page(s) passed")
+        for r in tree["rounds"]:
+            verdicts = f"{r['passed']} O / {r['failed']} X" if r["evaluated"] else "not evaluated"
+            print(f"  {OUT_PREFIX}{r['round']:<8} {r['images']:>6} image(s)  {verdicts}")
+        if tree["final_renders"]:
+            print(f"  {FINAL_RENDER_DIR_NAME:<11} {tree['final_renders']:>6} image(s)")
+        if tree["selected"]:
+            print(f"  {SELECTED_DIR_NAME:<11} {tree['selected']:>6} image(s)")
+    spend = status["spend"]
+    if spend:
+        stages = ", ".join(f"{stage} ${usd:.2f}" for stage, usd in sorted(spend["by_stage"].items()))
+        print(f"Spend: ${spend['usd']:.2f} over {spend['batches']} batch(es) ({stages})")
+    if status["queue"]:
+        print("Queue: " + ", ".join(f"{state} {count}" for state, count in sorted(status["queue"].items())))
+
+
+# =========================================
+# Subcommands
+# =========================================
+def cmd_status(args: argparse.Namespace) -> int:
+    status = report_status(args)
+    if args.json:
+        json.dump(status, sys.stdout, indent=2)
+        print()
+    else:
+        print_status(status)
+    return 0
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    import allloopv3
+
+    extra: Dict[str, Any] = {}
+    if args.iterations is not None:
+        extra["MAX_ITERATIONS"] = args.iterations
+    if args.dry_run:
+        extra["DRY_RUN"] = True
+    apply_overrides(allloopv3, args, extra)
+    allloopv3.main()
+    return 0
+
+
+def cmd_eval_only(args: argparse.Namespace) -> int:
+    import allloopv3
+
+    apply_overrides(allloopv3, args)
+    allloopv3.evaluate_only(args.iteration)
+    return 0
+
+
+def cmd_select(args: argparse.Namespace) -> int:
+    import select_best_outputs
+
+    apply_overrides(select_best_outputs, args, {"EXPORT_FORMATS": args.format} if args.format else None)
+    select_best_outputs.main()
+    return 0
+
+
+def cmd_export(args: argparse.Namespace) -> int:
+    import select_best_outputs
+
+    apply_overrides(select_best_outputs, args, {"EXPORT_FORMATS": args.format} if args.format else None)
+    select_best_outputs.export_selected()
+    return 0
+
+
+def cmd_bench(args: argparse.Namespace) -> int:
+    import bench
+
+    return bench.main(args.bench_args)
+
+
+# =========================================
+# Entry point
+# =========================================
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Manga translation pipeline.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    def pipeline_options(p: argparse.ArgumentParser):
+        p.add_argument("--base-dir", default="", help="Run folder (outputs, logs, ledger); default: next to the scripts")
+        p.add_argument("--input", default="", help="INPUT_DIR: folder or .cbz/.zip/.tar archive of pages")
+        p.add_argument("--lang", action="append", help="Target language (repeat for several)")
+        p.add_argument("--backend", default="", choices=["", "genai", "fake"], help="GENAI_BACKEND")
+        p.add_argument("--set", action="append", metavar="NAME=VALUE", help="Override any setting of the script")
+
+    p = sub.add_parser("run", help="Translate, evaluate and refine (allloopv3.py)")
+    pipeline_options(p)
+    p.add_argument("--iterations", type=int, help="MAX_ITERATIONS")
+    p.add_argument("--dry-run", action="store_true", help="Print the estimated cost and exit without submitting anything")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("status", help="Progress, verdicts and spend of a run folder (reads files only)")
+    p.add_argument("--base-dir", default="", help="Run folder; default: next to the scripts")
+    p.add_argument("--queue", default="", help="Work queue file to report (default: the library queue)")
+    p.add_argument("--json", action="store_true", help="Machine-readable output")
+    p.set_defaults(func=cmd_status)
+
+    p = sub.add_parser("eval-only", help="Evaluate existing outputs of one round without generating")
+    pipeline_options(p)
+    p.add_argument("--iteration", type=int, help="Round to evaluate (0 = out1); default: the newest complete one")
+    p.set_defaults(func=cmd_eval_only)
+
+    for name, func, help_text in (
+        ("select", cmd_select, "Rank out1..outN and collect the best pages (select_best_outputs.py)"),
+        ("export", cmd_export, "Package the already selected pages as CBZ/PDF"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        pipeline_options(p)
+        p.add_argument("--format", nargs="+", choices=["cbz", "pdf"], help="EXPORT_FORMATS")
+        p.set_defaults(func=func)
+
+    # Everything after "bench" goes to bench.py's own parser (bench --help shows its options)
+    p = sub.add_parser("bench", help="End-to-end benchmark on the fake backend (bench.py)", add_help=False)
+    p.set_defaults(func=cmd_bench)
+    args, rest = ap.parse_known_args(argv)
+    if rest and args.command != "bench":
+        ap.error(f"unrecognized arguments: {' '.join(rest)}")
+    args.bench_args = rest
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
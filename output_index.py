@@ -0,0 +1,180 @@
+import hashlib
+import os
+import shutil
+import threading
+from io import BytesIO
+from typing import Dict, Iterable, List, Tuple
+
+from PIL import Image
+
+# =========================================
+# Output integrity index + atomic writes (PIL only)
+# =========================================
+# Used by allloopv3.py and select_best_outputs.py. Every output image is written to a temporary
+# file next to its destination and renamed into place, so a crash never leaves a half-written
+# page under the real name. Each output folder keeps an append-only INDEX_FILE_NAME with the
+# size, mtime, SHA-1 and decoded dimensions of the images written (or verified) there; resume
+# checks trust a file whose size and mtime still match its entry and decode only the files that
+# are new to the index or changed since. A file that fails to decode is renamed to
+# <name>.corrupt, so every later check sees the page as missing and it is generated again.
+
+INDEX_FILE_NAME = "output_index.tsv"
+INDEX_HEADER = "name\tsize\tmtime_ns\tsha1\twidth\theight\n"
+CORRUPT_SUFFIX = ".corrupt"
+COMPACT_SLACK = 64  # superseded lines tolerated before the index is rewritten on load
+
+Entry = Tuple[int, int, str, int, int]  # size, mtime_ns, sha1, width, height
+
+
+def _tmp_path(path: str) -> str:
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def write_bytes(path: str, data: bytes):
+    """Write `data` to `path` through a temporary file and an atomic rename."""
+    tmp_path = _tmp_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_text(path: str, text: str):
+    write_bytes(path, text.encode("utf-8"))
+
+
+class FolderIndex:
+    """Known-good images of one folder: name -> (size, mtime_ns, sha1, width, height)."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.path = os.path.join(folder, INDEX_FILE_NAME)
+        self.entries: Dict[str, Entry] = {}
+        self._lock = threading.Lock()
+        lines = 0
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        parts = line.rstrip("\n").split("\t")
+                        if len(parts) != 6 or parts[0] == "name":
+                            continue  # header, or a line torn by a crash
+                        try:
+                            self.entries[parts[0]] = (int(parts[1]), int(parts[2]), parts[3], int(parts[4]), int(parts[5]))
+                        except ValueError:
+                            continue
+                        lines += 1
+            except Exception as e:
+                print(f"[WARN] Ignoring unreadable output index {self.path}: {e}")
+        if lines > len(self.entries) + COMPACT_SLACK:
+            self._rewrite()
+
+    def _rewrite(self):
+        body = "".join(self._line(name, entry) for name, entry in self.entries.items())
+        try:
+            write_text(self.path, INDEX_HEADER + body)
+        except Exception as e:
+            print(f"[WARN] Failed to compact output index {self.path}: {e}")
+
+    @staticmethod
+    def _line(name: str, entry: Entry) -> str:
+        return "\t".join([name] + [str(v) for v in entry]) + "\n"
+
+    def record(self, name: str, data: bytes, size: Tuple[int, int]):
+        """Add the file just written as `name` (whose content is `data`)."""
+        self.add(name, hashlib.sha1(data).hexdigest(), size)
+
+    def add(self, name: str, sha1: str, size: Tuple[int, int]):
+        st = os.stat(os.path.join(self.folder, name))
+        entry = (st.st_size, st.st_mtime_ns, sha1, size[0], size[1])
+        with self._lock:
+            self.entries[name] = entry
+            try:
+                new_file = not os.path.isfile(self.path)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    if new_file:
+                        f.write(INDEX_HEADER)
+                    f.write(self._line(name, entry))
+            except Exception as e:
+                print(f"[WARN] Failed to update output index {self.path}: {e}")
+
+    def is_intact(self, name: str) -> bool:
+        """True if the file exists and is a complete image; decodes it only when its stat changed."""
+        path = os.path.join(self.folder, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        entry = self.entries.get(name)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return True
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            with Image.open(BytesIO(data)) as img:
+                img.load()  # a truncated file fails here
+                size = img.size
+        except Exception as e:
+            aside = path + CORRUPT_SUFFIX
+            print(f"[WARN] {path} is damaged ({e}); moved aside as {os.path.basename(aside)} to be generated again.")
+            try:
+                os.replace(path, aside)
+            except OSError:
+                pass
+            return False
+        self.record(name, data, size)
+        return True
+
+
+_INDEXES: Dict[str, FolderIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def folder_index(folder: str) -> FolderIndex:
+    key = os.path.abspath(folder)
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(key)
+        if index is None:
+            index = _INDEXES[key] = FolderIndex(key)
+        return index
+
+
+def is_intact(path: str) -> bool:
+    return folder_index(os.path.dirname(path)).is_intact(os.path.basename(path))
+
+
+def intact_names(folder: str, names: Iterable[str]) -> List[str]:
+    """The names in `folder` whose files are complete images (damaged ones are moved aside)."""
+    index = folder_index(folder)
+    return [name for name in names if index.is_intact(name)]
+
+
+def save_image(img: Image.Image, path: str, format: str = "JPEG", **params):
+    """img.save() through a temporary file, recorded in the folder's index."""
+    buf = BytesIO()
+    img.save(buf, format=format, **params)
+    data = buf.getvalue()
+    write_bytes(path, data)
+    folder_index(os.path.dirname(path)).record(os.path.basename(path), data, img.size)
+
+
+def copy_image(src: str, dst: str):
+    """shutil.copy2() of an intact image through a temporary file (mtime kept), recorded in the destination's index."""
+    src_index = folder_index(os.path.dirname(src))
+    if not src_index.is_intact(os.path.basename(src)):
+        raise OSError(f"{src} is missing or damaged")
+    tmp_path = _tmp_path(dst)
+    try:
+        shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _, _, sha1, width, height = src_index.entries[os.path.basename(src)]
+    folder_index(os.path.dirname(dst)).add(os.path.basename(dst), sha1, (width, height))  # same bytes
@@ -0,0 +1,154 @@
+import io
+import os
+import tarfile
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+# =========================================
+# Page sources: loose files or archive members (stdlib only)
+# =========================================
+# Used by allloopv3.py and select_best_outputs.py so an input folder can also be a CBZ/ZIP or
+# tar archive (INPUT_DIR itself, or one archive per volume in library mode). A page inside an
+# archive is addressed as "<archive path>!/<member name>" and its bytes are read straight from
+# the archive, nothing is extracted to disk. Pages keep the base name of their member, so
+# output names and resume work exactly as for loose files.
+
+MEMBER_SEP = "!/"
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".webp"}
+ZIP_EXTS = (".cbz", ".zip")
+TAR_EXTS = (".cbt", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+OPEN_ARCHIVES = 4  # archives kept open (the member index is read once per archive)
+
+
+def archive_suffix(path: str) -> str:
+    """Archive extension of `path` ("" for anything else)."""
+    lower = path.lower()
+    for ext in ZIP_EXTS + TAR_EXTS:
+        if lower.endswith(ext):
+            return ext
+    return ""
+
+
+def is_archive(path: str) -> bool:
+    return bool(archive_suffix(path)) and os.path.isfile(path)
+
+
+def page_path(folder: str, name: str) -> str:
+    """Source reference of page `name` listed in `folder` (a directory or an archive)."""
+    if is_archive(folder):
+        return f"{folder}{MEMBER_SEP}{name}"
+    return os.path.join(folder, name)
+
+
+def split_source(src: str) -> Tuple[str, Optional[str]]:
+    """(archive, member) for an archive page, (path, None) for a loose file."""
+    if MEMBER_SEP in src:
+        archive, member = src.split(MEMBER_SEP, 1)
+        if archive_suffix(archive):
+            return archive, member
+    return src, None
+
+
+class _Archive:
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime_ns = os.stat(path).st_mtime_ns
+        self._lock = threading.Lock()  # one shared file handle per archive
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._tar: Optional[tarfile.TarFile] = None
+        self._members: Dict[str, int] = {}  # member name -> uncompressed size
+        self._tar_infos: Dict[str, tarfile.TarInfo] = {}
+        if archive_suffix(path) in ZIP_EXTS:
+            self._zip = zipfile.ZipFile(path)
+            for info in self._zip.infolist():
+                if not info.is_dir():
+                    self._members[info.filename] = info.file_size
+        else:
+            self._tar = tarfile.open(path)
+            for info in self._tar.getmembers():
+                if info.isfile():
+                    self._members[info.name] = info.size
+                    self._tar_infos[info.name] = info
+
+    def names(self) -> List[str]:
+        return list(self._members)
+
+    def size(self, member: str) -> int:
+        if member not in self._members:
+            raise FileNotFoundError(f"{member} not found in {self.path}")
+        return self._members[member]
+
+    def read(self, member: str) -> bytes:
+        self.size(member)
+        with self._lock:
+            if self._zip is not None:
+                return self._zip.read(member)
+            f = self._tar.extractfile(self._tar_infos[member])
+            return f.read() if f is not None else b""
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        if self._tar is not None:
+            self._tar.close()
+
+
+_ARCHIVES: "OrderedDict[str, _Archive]" = OrderedDict()
+_ARCHIVES_LOCK = threading.Lock()
+
+
+def _archive(path: str) -> _Archive:
+    key = os.path.abspath(path)
+    mtime_ns = os.stat(key).st_mtime_ns
+    with _ARCHIVES_LOCK:
+        arc = _ARCHIVES.get(key)
+        if arc is not None and arc.mtime_ns == mtime_ns:
+            _ARCHIVES.move_to_end(key)
+            return arc
+        if arc is not None:
+            arc.close()
+        arc = _Archive(key)
+        _ARCHIVES[key] = arc
+        while len(_ARCHIVES) > max(1, OPEN_ARCHIVES):
+            _ARCHIVES.popitem(last=False)[1].close()
+        return arc
+
+
+def list_pages(archive: str) -> List[str]:
+    """Image members of an archive (unsorted); macOS resource forks and hidden files are skipped."""
+    pages = []
+    for name in _archive(archive).names():
+        leaf = name.rsplit("/", 1)[-1]
+        if name.startswith("__MACOSX/") or leaf.startswith("."):
+            continue
+        if os.path.splitext(leaf)[1].lower() in IMAGE_EXTS:
+            pages.append(name)
+    return pages
+
+
+def read_bytes(src: str) -> bytes:
+    archive, member = split_source(src)
+    if member is None:
+        with open(src, "rb") as f:
+            return f.read()
+    return _archive(archive).read(member)
+
+
+def open_page(src: str) -> Union[str, BinaryIO]:
+    """Something Image.open / files.upload accept: the path itself, or the member's bytes in memory."""
+    archive, member = split_source(src)
+    if member is None:
+        return src
+    return io.BytesIO(_archive(archive).read(member))
+
+
+def source_stat(src: str) -> Tuple[int, int]:
+    """(size, mtime_ns) of a page; archive members carry their archive's mtime."""
+    archive, member = split_source(src)
+    if member is None:
+        st = os.stat(src)
+        return st.st_size, st.st_mtime_ns
+    arc = _archive(archive)
+    return arc.size(member), arc.mtime_ns
@@ -0,0 +1,310 @@
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageChops, ImageStat
+
+import page_sources
+
+# =========================================
+# Page tiling (PIL only)
+# =========================================
+# Used by allloopv3.py when TILING is on: double-page spreads are split at the gutter and very
+# large scans into a grid, with a small overlap between neighbours. Grid cuts move to the emptiest
+# row / column nearby (usually a panel gutter), so they rarely cross a speech bubble; a bubble that
+# still crosses a cut belongs to exactly one tile, whose box grows to hold it whole. Every tile is
+# cut once into the tiles folder and goes through script, image and eval as a job of its own; the
+# rendered tiles are stitched back into the page, blending across the overlaps (artwork only: each
+# kept bubble comes from its own tile alone).
+
+TILE_SEP = "__t"               # tile n of page "p012" is "p012__t<n>"
+MANIFEST_SUFFIX = ".tiles.json"
+GUTTER_THUMB_PX = 512          # gutter search runs on a thumbnail this wide
+GUTTER_SEARCH = 0.15           # ... within this share of the width either side of the middle
+CUT_SEARCH = 0.12              # grid cuts move up to this share of a tile's span (tiles may exceed max_px by as much)
+WORK_PX = 768                  # cut and bubble search runs on a thumbnail with this long side
+BRIGHT_LEVEL = 225             # gray level of bubble interiors (as in region_compose)
+BUBBLE_MIN_AREA = 0.0005       # bubble size range, as a share of the page
+BUBBLE_MAX_AREA = 0.12
+BUBBLE_MARGIN = 0.1            # a bubble kept whole grows by this share of its size (outline, tail)
+
+Box = Tuple[int, int, int, int]  # left, top, right, bottom in source pixels
+Keep = List[int]                 # left, top, right, bottom, index of the tile that renders this bubble
+
+
+def tile_base(base: str, index: int) -> str:
+    return f"{base}{TILE_SEP}{index}"
+
+
+def manifest_path(tiles_dir: str, base: str) -> str:
+    return os.path.join(tiles_dir, f"{base}{MANIFEST_SUFFIX}")
+
+
+def _band_score(thumb: Image.Image, pos: int, horizontal: bool) -> float:
+    """Brightness minus spread of the 3-pixel row (horizontal) or column band at pos: high = empty."""
+    tw, th = thumb.size
+    stat = ImageStat.Stat(thumb.crop((0, pos - 1, tw, pos + 2) if horizontal else (pos - 1, 0, pos + 2, th)))
+    return stat.mean[0] - stat.stddev[0]
+
+
+def find_gutter(img: Image.Image) -> int:
+    """x of a spread's gutter: the brightest, flattest column band near the middle (the middle if none stands out)."""
+    w, h = img.size
+    thumb_w = min(GUTTER_THUMB_PX, w)
+    thumb = img.convert("L").resize((thumb_w, max(1, round(h * thumb_w / w))), Image.BILINEAR)
+    middle = thumb_w // 2
+    reach = max(1, int(thumb_w * GUTTER_SEARCH))
+    scores: Dict[int, float] = {}
+    for x in range(max(1, middle - reach), min(thumb_w - 2, middle + reach) + 1):
+        scores[x] = _band_score(thumb, x, False)
+    if not scores:
+        return w // 2
+    ordered = sorted(scores.values())
+    best = max(scores, key=lambda x: (scores[x], -abs(x - middle)))
+    if scores[best] < ordered[len(ordered) // 2] + 10:
+        return w // 2  # artwork runs across the gutter
+    return min(w - 1, max(1, round((best + 0.5) * w / thumb_w)))
+
+
+def _edges(start: int, end: int, max_px: int, thumb: Image.Image, scale: float, horizontal: bool) -> List[int]:
+    """Even cuts of [start, end] into parts of at most max_px, each moved to the emptiest band within CUT_SEARCH."""
+    count = max(1, math.ceil((end - start) / max(1, max_px)))
+    reach = int(CUT_SEARCH * (end - start) / count * scale)
+    limit = thumb.size[1 if horizontal else 0] - 2
+    edges = [start]
+    for i in range(1, count):
+        pos = round((start + i * (end - start) / count) * scale)
+        candidates = range(max(1, pos - reach), min(limit, pos + reach) + 1)
+        if candidates:
+            pos = max(candidates, key=lambda p: (round(_band_score(thumb, p, horizontal)), -abs(p - pos)))
+        edges.append(min(end - 1, max(edges[-1] + 1, round(pos / scale))))
+    return edges + [end]
+
+
+def _crossing_bubbles(thumb: Image.Image, xs: Sequence[int], ys: Sequence[int]) -> List[Box]:
+    """
+    Thumbnail boxes of the bright, bubble-sized blobs (4-connected, as region_compose.bubble_mask
+    sizes them) that cross one of the column cuts `xs` or row cuts `ys` (thumbnail pixels).
+    """
+    tw, th = thumb.size
+    bright = thumb.point(lambda v: 255 if v >= BRIGHT_LEVEL else 0).tobytes()
+    seen = bytearray(tw * th)
+    starts = [y * tw + x for x in xs for y in range(th)] + [y * tw + x for y in ys for x in range(tw)]
+    bubbles: List[Box] = []
+    for start in starts:
+        if not bright[start] or seen[start]:
+            continue
+        seen[start] = 1
+        stack = [start]
+        area = 0
+        x0, y0, x1, y1 = tw, th, 0, 0
+        while stack:
+            i = stack.pop()
+            area += 1
+            y, x = divmod(i, tw)
+            x0, y0, x1, y1 = min(x0, x), min(y0, y), max(x1, x), max(y1, y)
+            for j, inside in ((i - 1, x > 0), (i + 1, x < tw - 1), (i - tw, y > 0), (i + tw, y < th - 1)):
+                if inside and bright[j] and not seen[j]:
+                    seen[j] = 1
+                    stack.append(j)
+        if not BUBBLE_MIN_AREA <= area / float(tw * th) <= BUBBLE_MAX_AREA:
+            continue
+        if y0 == 0 and y1 == th - 1 or x0 == 0 and x1 == tw - 1:
+            continue  # spans the page: background or margin, not a bubble
+        if any(x0 < x - 1 and x1 > x + 1 for x in xs) or any(y0 < y - 1 and y1 > y + 1 for y in ys):
+            bubbles.append((x0, y0, x1 + 1, y1 + 1))
+    return bubbles
+
+
+def plan_tiles(img: Image.Image, max_px: int, spread_aspect: float, overlap: float) -> Tuple[List[Box], List[Keep], int]:
+    """
+    Tile boxes in row-major order, the bubbles kept whole and the number of columns. A spread (width/height >= spread_aspect)
+    is cut at its gutter, then every part whose side exceeds max_px is split, each cut moved to the
+    emptiest row / column nearby. A bubble still crossing a cut goes to the tile holding its centre,
+    whose box grows to contain it. A single box means "not tiled".
+    """
+    w, h = img.size
+    scale = min(1.0, WORK_PX / float(max(w, h)))
+    thumb = img.convert("L").resize((max(3, round(w * scale)), max(3, round(h * scale))), Image.BILINEAR)
+    x_splits = [0, w]
+    if spread_aspect > 0 and w >= h * spread_aspect:
+        x_splits = [0, find_gutter(img), w]
+    xs: List[int] = [0]
+    for start, end in zip(x_splits, x_splits[1:]):
+        xs.extend(_edges(start, end, max_px, thumb, scale, False)[1:])
+    ys = _edges(0, h, max_px, thumb, scale, True)
+    pad = round(overlap * min(w, h))
+    cells: List[Box] = []
+    boxes: List[Box] = []
+    for top, bottom in zip(ys, ys[1:]):
+        for left, right in zip(xs, xs[1:]):
+            cells.append((left, top, right, bottom))
+            boxes.append(
+                (
+                    max(0, left - pad // 2) if left > 0 else 0,
+                    max(0, top - pad // 2) if top > 0 else 0,
+                    min(w, right + pad - pad // 2) if right < w else w,
+                    min(h, bottom + pad - pad // 2) if bottom < h else h,
+                )
+            )
+    keep: List[Keep] = []
+    if len(boxes) < 2:
+        return boxes, keep, 1
+    thumb_cuts = lambda cuts, size: [min(size - 1, round(c * scale)) for c in cuts[1:-1]]
+    for bx0, by0, bx1, by1 in _crossing_bubbles(thumb, thumb_cuts(xs, thumb.size[0]), thumb_cuts(ys, thumb.size[1])):
+        mx = BUBBLE_MARGIN * (bx1 - bx0) / 2 + 2
+        my = BUBBLE_MARGIN * (by1 - by0) / 2 + 2
+        bubble = (
+            max(0, int((bx0 - mx) / scale)),
+            max(0, int((by0 - my) / scale)),
+            min(w, math.ceil((bx1 + mx) / scale)),
+            min(h, math.ceil((by1 + my) / scale)),
+        )
+        cx, cy = (bubble[0] + bubble[2]) / 2, (bubble[1] + bubble[3]) / 2
+        owner = next(i for i, c in enumerate(cells) if c[0] <= cx <= c[2] and c[1] <= cy <= c[3])
+        box = boxes[owner]
+        boxes[owner] = (min(box[0], bubble[0]), min(box[1], bubble[1]), max(box[2], bubble[2]), max(box[3], bubble[3]))
+        keep.append(list(bubble) + [owner])
+    return boxes, keep, len(xs) - 1
+
+
+def load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"[WARN] Ignoring unreadable tile manifest {path}: {e}")
+        return None
+    return data if isinstance(data, dict) and isinstance(data.get("boxes"), list) else None
+
+
+def _current_manifest(path: str, tiles_dir: str, source: List[int], settings: List[float]) -> Optional[Dict[str, Any]]:
+    """The stored manifest when it was cut from this source with these settings and its tiles are all there."""
+    manifest = load_manifest(path)
+    if (
+        manifest is not None
+        and manifest.get("source") == source
+        and manifest.get("settings") == settings
+        and all(os.path.isfile(os.path.join(tiles_dir, name)) for name in manifest.get("files", []))
+    ):
+        return manifest
+    return None
+
+
+def estimate_tiles(src: str, tiles_dir: str, base: str, max_px: int, spread_aspect: float, overlap: float) -> Dict[str, Any]:
+    """
+    Read-only stand-in for prepare_tiles (DRY_RUN): the stored plan when current, else the tiles
+    the page would be cut into, counted from its size alone (gutter assumed in the middle; only
+    "files" is filled in). Nothing is written.
+    """
+    settings = [max_px, spread_aspect, overlap, CUT_SEARCH, BUBBLE_MARGIN]
+    manifest = _current_manifest(manifest_path(tiles_dir, base), tiles_dir, list(page_sources.source_stat(src)), settings)
+    if manifest is not None:
+        return manifest
+    with Image.open(page_sources.open_page(src)) as img:  # reads the header only
+        w, h = img.size
+    widths = [w / 2.0, w / 2.0] if spread_aspect > 0 and w >= h * spread_aspect else [float(w)]
+    count = sum(math.ceil(part / max(1, max_px)) for part in widths) * math.ceil(h / max(1, max_px))
+    ext = ".png" if os.path.splitext(src)[1].lower() == ".png" else ".jpg"
+    return {"files": [f"{tile_base(base, i)}{ext}" for i in range(1, count + 1)] if count > 1 else []}
+
+
+def prepare_tiles(
+    src: str,
+    tiles_dir: str,
+    base: str,
+    max_px: int,
+    spread_aspect: float,
+    overlap: float,
+) -> Dict[str, Any]:
+    """
+    Tile plan of one page, cut into tiles_dir when it has more than one tile. Reused while the
+    source and the settings are unchanged: {"size", "boxes", "columns", "keep", "files", "source", "settings"}.
+    """
+    path = manifest_path(tiles_dir, base)
+    source = list(page_sources.source_stat(src))
+    settings = [max_px, spread_aspect, overlap, CUT_SEARCH, BUBBLE_MARGIN]
+    manifest = _current_manifest(path, tiles_dir, source, settings)
+    if manifest is not None:
+        return manifest
+
+    with Image.open(page_sources.open_page(src)) as img:
+        img.load()
+        boxes, keep, columns = plan_tiles(img, max_px, spread_aspect, overlap)
+        files: List[str] = []
+        if len(boxes) > 1:
+            os.makedirs(tiles_dir, exist_ok=True)
+            lossless = os.path.splitext(src)[1].lower() == ".png"
+            for index, box in enumerate(boxes, start=1):
+                name = f"{tile_base(base, index)}{'.png' if lossless else '.jpg'}"
+                tile = img.crop(box).convert("RGB")
+                tmp_path = os.path.join(tiles_dir, f".{name}.{os.getpid()}.tmp")
+                tile.save(tmp_path, format="PNG" if lossless else "JPEG", quality=95)
+                os.replace(tmp_path, os.path.join(tiles_dir, name))
+                files.append(name)
+        manifest = {
+            "size": list(img.size),
+            "boxes": [list(b) for b in boxes],
+            "columns": columns,
+            "keep": keep,
+            "files": files,
+            "source": source,
+            "settings": settings,
+        }
+    if files:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+    elif os.path.isfile(path):
+        os.remove(path)  # no longer tiled (settings changed)
+    return manifest
+
+
+def _ramp(width: int, height: int, horizontal: bool) -> Image.Image:
+    """0 -> 255 from the left (horizontal) or top edge."""
+    gradient = Image.linear_gradient("L")
+    if horizontal:
+        gradient = gradient.transpose(Image.Transpose.ROTATE_90)
+    return gradient.resize((max(1, width), max(1, height)), Image.BILINEAR)
+
+
+def stitch(
+    size: Sequence[int],
+    boxes: Sequence[Sequence[int]],
+    tiles: Sequence[Image.Image],
+    keep: Sequence[Sequence[int]] = (),
+    columns: int = 0,
+) -> Image.Image:
+    """
+    Reassemble a page from its rendered tiles (any resolution; the page comes out at the tiles'
+    average scale). Each tile fades in across the overlap with the tiles left of and above it
+    (`columns` per row; plans without it have all first-row tiles at the top edge); then every
+    kept bubble is pasted from the tile that owns it, unblended.
+    """
+    w, h = size
+    columns = columns or sum(1 for box in boxes if box[1] == 0)
+    scale = sum(tile.size[0] / float(box[2] - box[0]) for box, tile in zip(boxes, tiles)) / len(tiles)
+    page = Image.new("RGB", (round(w * scale), round(h * scale)), (255, 255, 255))
+    rendered: List[Image.Image] = []
+    for index, (box, tile) in enumerate(zip(boxes, tiles)):
+        left, top, right, bottom = (round(v * scale) for v in box)
+        tile = tile.convert("RGB").resize((right - left, bottom - top), Image.LANCZOS)
+        rendered.append(tile)
+        mask = Image.new("L", tile.size, 255)
+        left_overlap = min(tile.size[0], round(boxes[index - 1][2] * scale) - left) if index % columns else 0
+        top_overlap = min(tile.size[1], round(boxes[index - columns][3] * scale) - top) if index >= columns else 0
+        if left_overlap > 0:
+            mask.paste(_ramp(left_overlap, tile.size[1], True), (0, 0))
+        if top_overlap > 0:
+            band = mask.crop((0, 0, tile.size[0], top_overlap))
+            mask.paste(ImageChops.multiply(band, _ramp(tile.size[0], top_overlap, False)), (0, 0))
+        page.paste(tile, (left, top), mask)
+    for *bubble, owner in keep:
+        left, top, right, bottom = (round(v * scale) for v in bubble)
+        tile_left, tile_top = (round(v * scale) for v in boxes[owner][:2])
+        page.paste(rendered[owner].crop((left - tile_left, top - tile_top, right - tile_left, bottom - tile_top)), (left, top))
+    return page
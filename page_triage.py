@@ -0,0 +1,125 @@
+import hashlib
+import os
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+from PIL import Image, ImageChops, ImageStat
+
+# =========================================
+# Local page triage (PIL only)
+# =========================================
+# Used by allloopv3.py before Stage 1 to find pages that do not need the model loop:
+# blank pages (almost uniform) and duplicate scans. The perceptual hash only sees the layout of
+# the artwork, not the lettering (pages with the same art and different dialogue hash alike), so
+# a hash match is only a candidate: it counts as a duplicate once the full-resolution pixels agree.
+# select_best_outputs.py reads the same TSV to give duplicates their twin's result.
+
+TRIAGE_FILE_NAME = "page_triage.tsv"
+TRIAGE_HEADER = "base_name\tstatus\ttwin\tdhash\tstddev\tclassified\n"
+
+# status values
+TEXT = "text"            # goes through the loop (classified = "y" once the model confirmed it)
+BLANK = "blank"          # copied through unchanged
+NO_TEXT = "no_text"      # copied through unchanged (model classification)
+DUPLICATE = "duplicate"  # reuses the result of `twin`
+
+DIFF_LEVEL = 48            # gray-level difference counted as a changed pixel when confirming a twin
+MAX_DIFF_SHARE = 0.00001   # ... and the share of changed pixels still accepted (a few dozen on a typical scan; one letter is more)
+
+
+def dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """Difference hash: 64 bits for hash_size 8, robust to rescans, resizes and JPEG noise."""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    px = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (1 if px[offset + col] > px[offset + col + 1] else 0)
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def page_signature(source: Union[str, BinaryIO]) -> Tuple[int, float, str]:
+    """(dhash, grayscale standard deviation, SHA-1 of the decoded pixels) of one page (a path or an open image file)."""
+    with Image.open(source) as img:
+        gray = img.convert("L")
+        digest = hashlib.sha1(f"{gray.size}".encode("ascii") + gray.tobytes()).hexdigest()
+        gray.thumbnail((512, 512))
+        return dhash(gray), ImageStat.Stat(gray).stddev[0], digest
+
+
+def pixels_match(a: Union[str, BinaryIO], b: Union[str, BinaryIO]) -> bool:
+    """True if two pages agree pixel for pixel at full resolution (up to MAX_DIFF_SHARE of rescan noise)."""
+    with Image.open(a) as img_a, Image.open(b) as img_b:
+        gray_a = img_a.convert("L")
+        gray_b = img_b.convert("L")
+    (wa, ha), (wb, hb) = gray_a.size, gray_b.size
+    if abs((wa / ha) / (wb / hb) - 1.0) > 0.01:
+        return False
+    if gray_b.size != gray_a.size:
+        gray_b = gray_b.resize(gray_a.size, Image.BILINEAR)
+    changed = sum(ImageChops.difference(gray_a, gray_b).histogram()[DIFF_LEVEL + 1 :])
+    return changed <= MAX_DIFF_SHARE * wa * ha
+
+
+def find_duplicates(
+    hashes: List[Tuple[str, int]],
+    max_distance: int,
+    confirm: Optional[Callable[[str, str], bool]] = None,
+) -> Dict[str, str]:
+    """
+    Map base -> twin base for pages whose hash is within max_distance of an earlier page
+    (input order) and, with `confirm`, whose content confirm(base, twin) accepts. Twins are
+    always pages that are not duplicates themselves.
+    """
+    twins: Dict[str, str] = {}
+    originals: List[Tuple[str, int]] = []
+    for base, h in hashes:
+        for other, other_h in originals:
+            if hamming(h, other_h) > max_distance:
+                continue
+            if confirm is None or confirm(base, other):
+                twins[base] = other
+                break
+        else:
+            originals.append((base, h))
+    return twins
+
+
+def triage_path(base_dir: str) -> str:
+    return os.path.join(base_dir, TRIAGE_FILE_NAME)
+
+
+def load_triage(path: str) -> Dict[str, Dict[str, str]]:
+    records: Dict[str, Dict[str, str]] = {}
+    if not os.path.isfile(path):
+        return records
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 6 or parts[0] == "base_name":
+                    continue
+                base, status, twin, hash_hex, stddev, classified = parts
+                records[base] = {"status": status, "twin": twin, "dhash": hash_hex, "stddev": stddev, "classified": classified}
+    except Exception as e:
+        print(f"[WARN] Failed to load page triage {path}: {e}")
+    return records
+
+
+def save_triage(path: str, records: Dict[str, Dict[str, str]]):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(TRIAGE_HEADER)
+        for base, rec in records.items():
+            f.write(
+                f"{base}\t{rec['status']}\t{rec.get('twin', '')}\t{rec['dhash']}\t{rec['stddev']}\t{rec.get('classified', '')}\n"
+            )
+    os.replace(tmp_path, path)
+
+
+def duplicate_twins(records: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+    return {base: rec["twin"] for base, rec in records.items() if rec["status"] == DUPLICATE and rec.get("twin")}
@@ -0,0 +1,149 @@
+import os
+import select
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# =========================================
+# Input folder watcher (inotify via ctypes, polling fallback)
+# =========================================
+# Used by allloopv3.py in WATCH_INPUT mode: wait until pages are added to or changed in the
+# input folder, wait for the drop to settle (no further changes for the debounce period),
+# and report what changed relative to the pages already processed.
+
+Snapshot = Dict[str, Tuple[int, int]]  # file name -> (size, mtime_ns)
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+
+def take_snapshot(folder: str, names: List[str]) -> Snapshot:
+    snap: Snapshot = {}
+    for name in names:
+        try:
+            st = os.stat(os.path.join(folder, name))
+        except OSError:
+            continue
+        snap[name] = (st.st_size, st.st_mtime_ns)
+    return snap
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> Tuple[List[str], List[str], List[str]]:
+    """(added, changed, removed) file names."""
+    added = [n for n in new if n not in old]
+    changed = [n for n in new if n in old and new[n] != old[n]]
+    removed = [n for n in old if n not in new]
+    return added, changed, removed
+
+
+def load_snapshot(path: str) -> Snapshot:
+    snap: Snapshot = {}
+    if not os.path.isfile(path):
+        return snap
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 3 or parts[0] == "name":
+                    continue
+                snap[parts[0]] = (int(parts[1]), int(parts[2]))
+    except Exception as e:
+        print(f"[WARN] Failed to load watch state {path}: {e}")
+    return snap
+
+
+def save_snapshot(path: str, snap: Snapshot):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("name\tsize\tmtime_ns\n")
+        for name, (size, mtime_ns) in snap.items():
+            f.write(f"{name}\t{size}\t{mtime_ns}\n")
+    os.replace(tmp_path, path)
+
+
+class FolderWatcher:
+    """Blocks until something in `folder` may have changed: inotify on Linux, else a polling interval."""
+
+    def __init__(self, folder: str, poll_sec: float = 10.0, use_inotify: bool = True):
+        self.folder = folder
+        self.poll_sec = max(0.1, poll_sec)
+        self._fd: Optional[int] = None
+        if use_inotify and sys.platform.startswith("linux"):
+            self._fd = self._open_inotify(folder)
+        self.mode = "inotify" if self._fd is not None else "polling"
+
+    @staticmethod
+    def _open_inotify(folder: str) -> Optional[int]:
+        import ctypes
+        import ctypes.util
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            if libc.inotify_add_watch(fd, os.fsencode(folder), _WATCH_MASK) < 0:
+                err = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(err, "inotify_add_watch failed")
+            return fd
+        except (OSError, AttributeError) as e:
+            print(f"[WARN] inotify unavailable for {folder}, polling instead: {e}")
+            return None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """True if an event arrived (inotify) or the poll interval passed; False on timeout."""
+        if self._fd is None:
+            time.sleep(self.poll_sec if timeout is None else min(self.poll_sec, timeout))
+            return timeout is None or timeout >= self.poll_sec
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self._fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def wait_for_drop(
+    watcher: FolderWatcher,
+    list_names: Callable[[], List[str]],
+    known: Snapshot,
+    debounce_sec: float,
+) -> Snapshot:
+    """
+    Block until the folder differs from `known` and then stays unchanged for `debounce_sec`
+    (so half-copied chapters are not picked up). Returns the settled snapshot.
+    """
+    while True:
+        snap = take_snapshot(watcher.folder, list_names())
+        if snap != known:
+            break
+        watcher.wait()
+    quiet_since = time.monotonic()
+    while True:
+        remaining = debounce_sec - (time.monotonic() - quiet_since)
+        if remaining <= 0:
+            settled = take_snapshot(watcher.folder, list_names())
+            if settled == snap:
+                return settled
+            snap = settled
+            quiet_since = time.monotonic()
+            continue
+        if watcher.wait(timeout=remaining) and watcher.mode == "inotify":
+            quiet_since = time.monotonic()
@@ -0,0 +1,179 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+# =========================================
+# Region compositing (NumPy + PIL)
+# =========================================
+# Used by allloopv3.py when REGION_COMPOSITE is on: the image model often redraws artwork it
+# was not asked to touch, which costs an "X" verdict and another round. After each generated
+# page arrives, the difference to the original is split into connected blobs; blobs that lie
+# mostly inside text regions (source-analysis boxes and locally detected speech bubbles) are
+# kept, everything else is reverted to the original artwork.
+
+WORK_PX = 768                # masks are computed at this long side, then scaled up
+MAX_ASPECT_DRIFT = 0.03      # generated page framed differently -> leave it alone
+MAX_CHANGED_FRACTION = 0.6   # most of the page differs -> misaligned or restyled, leave it alone
+BRIGHT_LEVEL = 225           # gray level of bubble interiors
+BUBBLE_MIN_AREA = 0.0005     # bubble size range, as a share of the page
+BUBBLE_MAX_AREA = 0.12
+REGION_PAD_PX = 6            # text regions grow by this much (work resolution)
+CHANGE_CLOSE_PX = 2          # changed pixels this close join one blob
+FEATHER_PX = 2.0             # soft edge of the pasted regions (output resolution)
+
+
+def _dilate(mask: np.ndarray, radius: int) -> np.ndarray:
+    if radius <= 0:
+        return mask
+    img = Image.fromarray(mask.astype(np.uint8) * 255)
+    return np.asarray(img.filter(ImageFilter.MaxFilter(2 * radius + 1))) > 0
+
+
+def label_components(mask: np.ndarray) -> Tuple[np.ndarray, int]:
+    """8-connected components of a boolean mask (run-length union-find, no SciPy). 0 = background."""
+    h, w = mask.shape
+    parent: List[int] = [0]
+
+    def find(a: int) -> int:
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    padded = np.zeros((h, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows: List[List[Tuple[int, int, int]]] = []
+    prev: List[Tuple[int, int, int]] = []
+    for y in range(h):
+        starts = np.flatnonzero(edges[y] == 1)
+        ends = np.flatnonzero(edges[y] == -1)
+        cur: List[Tuple[int, int, int]] = []
+        j = 0
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            while j < len(prev) and prev[j][1] < s:
+                j += 1
+            label = 0
+            k = j
+            while k < len(prev) and prev[k][0] <= e:  # touches [s-1, e] -> 8-connected
+                other = find(prev[k][2])
+                if label == 0:
+                    label = other
+                elif other != label:
+                    low, high = min(label, other), max(label, other)
+                    parent[high] = low
+                    label = low
+                k += 1
+            if label == 0:
+                label = len(parent)
+                parent.append(label)
+            cur.append((s, e, label))
+        rows.append(cur)
+        prev = cur
+
+    roots = np.array([find(i) for i in range(len(parent))], dtype=np.int64)
+    _, compact = np.unique(roots, return_inverse=True)  # root 0 stays 0
+    labels = np.zeros((h, w), dtype=np.int32)
+    for y, runs in enumerate(rows):
+        for s, e, label in runs:
+            labels[y, s:e] = compact[label]
+    return labels, int(compact.max()) if len(compact) else 0
+
+
+def bubble_mask(gray: np.ndarray) -> np.ndarray:
+    """Bounding boxes of bright, bubble-sized blobs (speech bubbles, caption boxes)."""
+    h, w = gray.shape
+    labels, count = label_components(gray >= BRIGHT_LEVEL)
+    mask = np.zeros((h, w), dtype=bool)
+    if not count:
+        return mask
+    areas = np.bincount(labels.ravel(), minlength=count + 1)
+    ys, xs = np.nonzero(labels)
+    lab = labels[ys, xs]
+    y0 = np.full(count + 1, h)
+    x0 = np.full(count + 1, w)
+    y1 = np.zeros(count + 1, dtype=np.int64)
+    x1 = np.zeros(count + 1, dtype=np.int64)
+    np.minimum.at(y0, lab, ys)
+    np.minimum.at(x0, lab, xs)
+    np.maximum.at(y1, lab, ys)
+    np.maximum.at(x1, lab, xs)
+    for i in range(1, count + 1):
+        share = areas[i] / float(h * w)
+        if not BUBBLE_MIN_AREA <= share <= BUBBLE_MAX_AREA:
+            continue
+        if y0[i] == 0 and y1[i] == h - 1 or x0[i] == 0 and x1[i] == w - 1:
+            continue  # spans the page: background or margin, not a bubble
+        mask[y0[i] : y1[i] + 1, x0[i] : x1[i] + 1] = True
+    return mask
+
+
+def box_mask(shape: Tuple[int, int], boxes: Sequence[Sequence[float]]) -> np.ndarray:
+    """Text boxes [ymin, xmin, ymax, xmax] on the 0-1000 scale of the source analysis."""
+    h, w = shape
+    mask = np.zeros((h, w), dtype=bool)
+    for box in boxes:
+        try:
+            ymin, xmin, ymax, xmax = (float(v) for v in box)
+        except (TypeError, ValueError):
+            continue
+        top, bottom = sorted((int(ymin * h / 1000), int(ymax * h / 1000) + 1))
+        left, right = sorted((int(xmin * w / 1000), int(xmax * w / 1000) + 1))
+        mask[max(0, top) : min(h, bottom), max(0, left) : min(w, right)] = True
+    return mask
+
+
+def composite(
+    original: Image.Image,
+    generated: Image.Image,
+    boxes: Optional[Sequence[Sequence[float]]] = None,
+    diff_threshold: int = 32,
+    min_overlap: float = 0.5,
+) -> Tuple[Image.Image, Dict[str, Any]]:
+    """
+    Paste the generated page's changes inside text regions onto the original (at the generated
+    page's size). Returns (image, stats); stats["applied"] is False when the page was left as-is.
+    """
+    gen = generated.convert("RGB")
+    ow, oh = original.size
+    gw, gh = gen.size
+    if abs((ow / oh) / (gw / gh) - 1.0) > MAX_ASPECT_DRIFT:
+        return gen, {"applied": False, "reason": "aspect ratio differs"}
+    base = original.convert("RGB").resize((gw, gh), Image.LANCZOS)
+
+    scale = min(1.0, WORK_PX / float(max(gw, gh)))
+    size = (max(1, round(gw * scale)), max(1, round(gh * scale)))
+    small_base = base.convert("L").resize(size, Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    small_gen = gen.convert("L").resize(size, Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    base_gray = np.asarray(small_base, dtype=np.int16)
+    changed = np.abs(np.asarray(small_gen, dtype=np.int16) - base_gray) > diff_threshold
+    changed_share = float(changed.mean())
+    if changed_share > MAX_CHANGED_FRACTION:
+        return gen, {"applied": False, "reason": f"{changed_share:.0%} of the page changed", "changed": changed_share}
+    if not changed.any():
+        return base, {"applied": True, "changed": 0.0, "kept": 0.0, "reverted": 0.0}
+
+    regions = bubble_mask(base_gray)
+    if boxes:
+        regions |= box_mask(regions.shape, boxes)
+    regions = _dilate(regions, REGION_PAD_PX)
+
+    labels, count = label_components(_dilate(changed, CHANGE_CLOSE_PX))
+    areas = np.bincount(labels.ravel(), minlength=count + 1).astype(np.float64)
+    inside = np.bincount(labels.ravel(), weights=regions.ravel().astype(np.float64), minlength=count + 1)
+    keep = inside >= min_overlap * np.maximum(areas, 1.0)
+    keep[0] = False
+    kept = keep[labels] & changed
+    stats = {
+        "applied": True,
+        "changed": changed_share,
+        "kept": float(kept.mean()),
+        "reverted": float((changed & ~kept).mean()),
+        "blobs_reverted": int(count - keep[1:].sum()),
+    }
+
+    alpha = Image.fromarray(_dilate(keep[labels], 1).astype(np.uint8) * 255).resize((gw, gh), Image.BILINEAR)
+    if FEATHER_PX > 0:
+        alpha = alpha.filter(ImageFilter.GaussianBlur(FEATHER_PX))
+    return Image.composite(gen, base, alpha), stats
@@ -0,0 +1,379 @@
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# =========================================
+# Cost model + run budget (stdlib only)
+# =========================================
+# Used by allloopv3.py to price every batch before it is submitted, keep a ledger of what
+# a run folder has spent (across resumes), enforce the soft/hard caps, and estimate the
+# cost of a whole run without submitting anything (DRY_RUN). Several workers may share one run
+# folder (WORK_QUEUE): the ledger is only read and appended under a file lock, and a batch
+# reserves its estimate in the ledger (a "reserve" line) in the same locked step that checks the
+# hard cap, so batches other workers still have in flight count against it too. The reservation
+# is released ("release" line, same id) when the batch is charged or fails.
+#
+# Prices are USD per 1M tokens at list price; batch jobs are billed at BATCH_DISCOUNT of that.
+# Context caches are billed per 1M tokens per hour they are stored ("cache_storage", no discount).
+# Check https://ai.google.dev/gemini-api/docs/pricing and adjust MODEL_PRICES when they change.
+
+BATCH_DISCOUNT = 0.5
+
+MODEL_PRICES: Dict[str, Dict[str, float]] = {
+    "gemini-3-pro-preview": {"input": 2.00, "cached_input": 0.20, "output": 12.00, "cache_storage": 4.50},
+    "gemini-3-pro-image-preview": {
+        "input": 2.00,
+        "cached_input": 0.20,
+        "output": 12.00,
+        "image_output": 120.00,
+        "cache_storage": 4.50,
+    },
+    "gemini-2.5-pro": {"input": 1.25, "cached_input": 0.125, "output": 10.00, "cache_storage": 4.50},
+    "gemini-2.5-flash": {"input": 0.30, "cached_input": 0.03, "output": 2.50, "cache_storage": 1.00},
+    "gemini-2.5-flash-image": {
+        "input": 0.30,
+        "cached_input": 0.03,
+        "output": 2.50,
+        "image_output": 30.00,
+        "cache_storage": 1.00,
+    },
+}
+DEFAULT_PRICES = {"input": 2.00, "cached_input": 0.20, "output": 12.00, "image_output": 120.00, "cache_storage": 4.50}
+
+INPUT_IMAGE_TOKENS = 1120  # tokens billed per attached page image
+OUTPUT_IMAGE_TOKENS = {"1K": 1120, "2K": 1120, "4K": 2000}
+
+# Expected text output per request (thinking included), by batch stage.
+OUTPUT_TOKENS = {
+    "script": 2500,
+    "patch": 800,
+    "eval": 600,
+    "analysis": 2500,
+    "feedback": 400,
+    "triage": 20,
+    "rank": 300,
+}
+TYPICAL_SCRIPT_TOKENS = 700  # length of a page script, for prompts that embed one
+PAGE_TAG_RE = re.compile(r"<PAGE_\d+>")  # pages of a multi-page script request
+
+LEDGER_FILE_NAME = "cost_ledger.tsv"
+LEDGER_HEADER = "timestamp\tstage\tmodel\trequests\tusd\tbasis\n"
+RESERVE = "reserve"            # ledger stage of a reservation (basis = reservation id); not spend
+RELEASE = "release"            # ... and of its release
+RESERVATION_TTL_SEC = 26 * 3600  # batch jobs expire after 24 h; older open reservations are from workers that died
+
+
+class BudgetExhausted(RuntimeError):
+    """Raised before submitting a batch that would cross the hard cap."""
+
+
+def model_prices(model: str) -> Dict[str, float]:
+    name = model.split("/")[-1]
+    for prefix in sorted(MODEL_PRICES, key=len, reverse=True):
+        if name.startswith(prefix):
+            return MODEL_PRICES[prefix]
+    return DEFAULT_PRICES
+
+
+def token_cost(
+    model: str,
+    input_tokens: int,
+    output_tokens: int = 0,
+    cached_tokens: int = 0,
+    image_output_tokens: int = 0,
+) -> float:
+    prices = model_prices(model)
+    usd = (
+        input_tokens * prices["input"]
+        + cached_tokens * prices["cached_input"]
+        + output_tokens * prices["output"]
+        + image_output_tokens * prices.get("image_output", prices["output"])
+    )
+    return usd / 1_000_000 * BATCH_DISCOUNT
+
+
+def cache_storage_cost(model: str, tokens: int, hours: float) -> float:
+    """Storage cost of a context cache of `tokens` kept for `hours`."""
+    return tokens * model_prices(model)["cache_storage"] * max(0.0, hours) / 1_000_000
+
+
+def request_tokens(req: Dict[str, Any]) -> Tuple[int, int]:
+    """(text tokens, attached images) of one inline request; ~4 characters per token."""
+    chars = 0
+    images = 0
+    for content in req.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                chars += len(part["text"])
+            elif "inline_data" in part or "file_data" in part:
+                images += 1
+    return chars // 4, images
+
+
+def request_pages(req: Dict[str, Any]) -> int:
+    """Pages one script request covers (a multi-page request tags each page as <PAGE_n>)."""
+    tags = 0
+    for content in req.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                tags += len(PAGE_TAG_RE.findall(part["text"]))
+    return max(1, tags)
+
+
+def request_kind(stage: str, req: Dict[str, Any]) -> str:
+    config = req.get("config") or {}
+    if stage == "script" and config.get("response_mime_type") == "application/json" and request_pages(req) == 1:
+        return "patch"
+    return stage
+
+
+def estimate_request_cost(model: str, stage: str, req: Dict[str, Any], cached_tokens: int = 0) -> float:
+    """Predicted cost of one request from its payload and the stage's expected output."""
+    text_tokens, images = request_tokens(req)
+    config = req.get("config") or {}
+    image_output = 0
+    output = 0
+    if "IMAGE" in (config.get("response_modalities") or []):
+        size = (config.get("image_config") or {}).get("image_size") or "1K"
+        image_output = OUTPUT_IMAGE_TOKENS.get(size, OUTPUT_IMAGE_TOKENS["1K"])
+    else:
+        output = OUTPUT_TOKENS.get(request_kind(stage, req), OUTPUT_TOKENS["eval"])
+        if stage == "script":
+            output *= request_pages(req)
+    return token_cost(model, text_tokens + images * INPUT_IMAGE_TOKENS, output, cached_tokens, image_output)
+
+
+def usage_cost(model: str, usage, image_output: bool) -> Optional[float]:
+    """Cost from a response's usage_metadata, or None when the counts are not reported."""
+    prompt = getattr(usage, "prompt_token_count", None) if usage is not None else None
+    if prompt is None:
+        return None
+    cached = int(getattr(usage, "cached_content_token_count", 0) or 0)
+    candidates = int(getattr(usage, "candidates_token_count", 0) or 0)
+    thoughts = int(getattr(usage, "thoughts_token_count", 0) or 0)
+    if image_output:
+        return token_cost(model, int(prompt) - cached, thoughts, cached, candidates)
+    return token_cost(model, int(prompt) - cached, candidates + thoughts, cached)
+
+
+@contextmanager
+def ledger_lock(ledger_path: str):
+    """Exclusive lock on a ledger across processes (a <ledger>.lock file next to it)."""
+    with open(ledger_path + ".lock", "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class RunBudget:
+    """
+    Spend ledger of one run folder. `hard_usd` stops the run before a batch would cross it;
+    `soft_usd` only narrows which pages are refined (see allloopv3.schedule_refinement).
+    0 disables a cap. `spent` covers every worker appending to the same ledger, and `reserved`
+    their open reservations, as of the last reserve(), release() or charge().
+    """
+
+    def __init__(self, ledger_path: str, hard_usd: float = 0.0, soft_usd: float = 0.0, read_only: bool = False):
+        self.ledger_path = ledger_path
+        self.read_only = read_only  # DRY_RUN: read the ledger once, without its lock file; nothing is appended
+        self.hard_usd = hard_usd
+        self.soft_usd = soft_usd
+        self.spent = 0.0
+        self.spent_this_run = 0.0
+        self.estimated_this_run = 0.0
+        self._offset = 0  # bytes of the ledger already added to `spent`
+        self._reservations: Dict[str, Tuple[float, float]] = {}  # open reservation id -> (timestamp, usd)
+        self._lock = threading.Lock()
+        if read_only:
+            self._refresh()
+            return
+        with self._lock, ledger_lock(self.ledger_path):
+            self._refresh()
+
+    def _refresh(self):
+        """Add the ledger lines appended since the last read (call with the ledger locked)."""
+        if not os.path.isfile(self.ledger_path):
+            return
+        try:
+            with open(self.ledger_path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except Exception as e:
+            print(f"[WARN] Failed to load cost ledger {self.ledger_path}: {e}")
+            return
+        complete = data[: data.rfind(b"\n") + 1]
+        self._offset += len(complete)
+        for line in complete.decode("utf-8", errors="replace").splitlines():
+            parts = line.split("\t")
+            if len(parts) != 6 or parts[0] == "timestamp":
+                continue
+            try:
+                if parts[1] == RESERVE:
+                    self._reservations[parts[5]] = (float(parts[0]), float(parts[4]))
+                elif parts[1] == RELEASE:
+                    self._reservations.pop(parts[5], None)
+                else:
+                    self.spent += float(parts[4])
+            except ValueError:
+                continue
+
+    def _append(self, line: str):
+        """Append one ledger line (call with the ledger locked, after _refresh)."""
+        try:
+            with open(self.ledger_path, "ab") as f:
+                if f.tell() == 0:
+                    f.write(LEDGER_HEADER.encode("utf-8"))
+                f.write(f"{time.time():.0f}\t{line}\n".encode("utf-8"))
+                self._offset = f.tell()
+        except Exception as e:
+            print(f"[WARN] Failed to append to cost ledger {self.ledger_path}: {e}")
+
+    @property
+    def reserved(self) -> float:
+        """Estimates of the batches still in flight in any worker (reservations younger than RESERVATION_TTL_SEC)."""
+        now = time.time()
+        return sum(usd for ts, usd in self._reservations.values() if now - ts < RESERVATION_TTL_SEC)
+
+    def remaining(self) -> Optional[float]:
+        return None if self.hard_usd <= 0 else max(0.0, self.hard_usd - self.spent - self.reserved)
+
+    def over_soft(self) -> bool:
+        return self.soft_usd > 0 and self.spent >= self.soft_usd
+
+    def calibration(self) -> float:
+        """Charged / estimated cost of this run's batches so far (1.0 until something was charged)."""
+        if self.estimated_this_run <= 0 or self.spent_this_run <= 0:
+            return 1.0
+        return self.spent_this_run / self.estimated_this_run
+
+    def reserve(self, stage: str, model: str, requests: int, estimate: float, label: str) -> str:
+        """
+        Check the hard cap against everything spent and reserved in the folder, and reserve `estimate`
+        for a batch about to be submitted. Returns the reservation id for charge() / release().
+        """
+        reservation = uuid.uuid4().hex[:16]
+        with self._lock, ledger_lock(self.ledger_path):
+            self._refresh()
+            committed = self.spent + self.reserved
+            if self.hard_usd > 0 and committed + estimate > self.hard_usd:
+                raise BudgetExhausted(
+                    f"{label} would cost ~${estimate:.2f}; ${committed:.2f} of the ${self.hard_usd:.2f} budget "
+                    "already spent or reserved by batches in flight."
+                )
+            self._reservations[reservation] = (time.time(), estimate)
+            self._append(f"{RESERVE}\t{model}\t{requests}\t{estimate:.6f}\t{reservation}")
+        return reservation
+
+    def release(self, reservation: str, model: str = ""):
+        """Drop a reservation whose batch was not charged (creation failed, job did not succeed)."""
+        if not reservation:
+            return
+        with self._lock, ledger_lock(self.ledger_path):
+            self._refresh()
+            self._reservations.pop(reservation, None)
+            self._append(f"{RELEASE}\t{model}\t0\t0.000000\t{reservation}")
+
+    def charge(
+        self,
+        stage: str,
+        model: str,
+        requests: int,
+        usd: float,
+        estimate: float,
+        basis: str,
+        reservation: str = "",
+    ):
+        """Record a cost; with `reservation`, it replaces that reservation in the same locked step."""
+        with self._lock, ledger_lock(self.ledger_path):
+            self._refresh()
+            self.spent += usd
+            self.spent_this_run += usd
+            self.estimated_this_run += estimate
+            self._append(f"{stage}\t{model}\t{requests}\t{usd:.6f}\t{basis}")
+            if reservation:
+                self._reservations.pop(reservation, None)
+                self._append(f"{RELEASE}\t{model}\t0\t0.000000\t{reservation}")
+
+
+def observed_pass_rates(rounds: List[Dict[str, str]]) -> List[float]:
+    """
+    Pass rate per round from earlier verdicts (base -> "O"/"X" for out1, out2, ... in order):
+    round 0 is the share of pages passing; later rounds the share of previously failing pages
+    that pass.
+    """
+    rates: List[float] = []
+    prev: Dict[str, str] = {}
+    for current in rounds:
+        if not current:
+            break
+        if not prev:
+            rates.append(sum(1 for r in current.values() if r == "O") / len(current))
+        else:
+            retried = [b for b, r in prev.items() if r != "O" and b in current]
+            if retried:
+                rates.append(sum(1 for b in retried if current[b] == "O") / len(retried))
+        prev = current
+    return rates
+
+
+def estimate_run(
+    pages: int,
+    max_iterations: int,
+    pass_rates: List[float],
+    costs: Dict[str, float],
+    candidates_per_page: int = 1,
+) -> List[Dict[str, Any]]:
+    """
+    Expected cost per step of a run. `costs` holds the per-request cost of "script",
+    "revision", "image", "eval", and optionally "analysis", "triage" and "final".
+    pass_rates[i] is the chance a still-failing page passes in round i (last rate repeats).
+    Every round evaluates all pages again (carried-forward ones included) plus extra variants.
+    """
+
+    def rate_at(i: int) -> float:
+        return pass_rates[min(i, len(pass_rates) - 1)] if pass_rates else 0.5
+
+    rows: List[Dict[str, Any]] = []
+    pre = pages * (costs.get("analysis", 0.0) + costs.get("triage", 0.0))
+    if pre:
+        rows.append({"step": "triage/analysis", "renders": 0, "usd": pre, "expected_passing": 0.0})
+    failing = pages * (1.0 - rate_at(0))
+    rows.append(
+        {
+            "step": "stage 1",
+            "renders": pages,
+            "usd": pages * (costs["script"] + costs["image"] + costs["eval"]),
+            "expected_passing": pages - failing,
+        }
+    )
+    for it in range(1, max_iterations + 1):
+        if failing < 0.5:
+            break
+        renders = failing * max(1, candidates_per_page)
+        usd = failing * costs["revision"] + renders * costs["image"] + (pages - failing + renders) * costs["eval"]
+        failing *= 1.0 - rate_at(it)
+        rows.append({"step": f"iteration {it}", "renders": renders, "usd": usd, "expected_passing": pages - failing})
+    if costs.get("final"):
+        passing = pages - failing
+        rows.append({"step": "final", "renders": passing, "usd": passing * costs["final"], "expected_passing": passing})
+    return rows
@@ -0,0 +1,168 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# =========================================
+# Lightweight Prometheus-style metrics (stdlib only)
+# =========================================
+# Used by allloopv3.py to expose run progress either over HTTP
+# (scrape http://host:PORT/metrics) or as a node_exporter textfile.
+
+DEFAULT_LATENCY_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in items
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class RunMetrics:
+    """
+    In-memory counters, gauges and histograms rendered in the Prometheus text format.
+    All metric names get the given prefix (e.g. "manga_").
+    """
+
+    def __init__(self, prefix: str = "manga_"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._values: Dict[str, Dict[LabelKey, float]] = {}
+        self._hists: Dict[str, Dict[LabelKey, List[float]]] = {}  # bucket counts..., sum, count
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._server: Optional[Any] = None  # http.server.ThreadingHTTPServer (imported only when serving)
+
+    def _declare(self, name: str, mtype: str, help_text: str):
+        if name not in self._meta:
+            self._meta[name] = (mtype, help_text)
+
+    def inc(self, name: str, value: float = 1.0, help_text: str = "", **labels):
+        with self._lock:
+            self._declare(name, "counter", help_text)
+            series = self._values.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, help_text: str = "", **labels):
+        with self._lock:
+            self._declare(name, "gauge", help_text)
+            self._values.setdefault(name, {})[_label_key(labels)] = float(value)
+
+    def add(self, name: str, value: float, help_text: str = "", **labels):
+        """Increment (or decrement) a gauge."""
+        with self._lock:
+            self._declare(name, "gauge", help_text)
+            series = self._values.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, help_text: str = "", buckets=DEFAULT_LATENCY_BUCKETS, **labels):
+        with self._lock:
+            self._declare(name, "histogram", help_text)
+            bounds = self._buckets.setdefault(name, tuple(buckets))
+            series = self._hists.setdefault(name, {})
+            key = _label_key(labels)
+            h = series.get(key)
+            if h is None:
+                h = [0.0] * (len(bounds) + 2)
+                series[key] = h
+            for i, upper in enumerate(bounds):
+                if value <= upper:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._values.get(name, {}).get(_label_key(labels), 0.0)
+
+    def histogram_sum(self, name: str) -> float:
+        """Sum of all observations of one histogram across every label set."""
+        with self._lock:
+            return sum(h[-2] for h in self._hists.get(name, {}).values())
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._meta):
+                mtype, help_text = self._meta[name]
+                full = self.prefix + name
+                if help_text:
+                    lines.append(f"# HELP {full} {help_text}")
+                lines.append(f"# TYPE {full} {mtype}")
+                if mtype == "histogram":
+                    bounds = self._buckets[name]
+                    for key, h in sorted(self._hists.get(name, {}).items()):
+                        for upper, count in zip(bounds, h):
+                            le = _format_labels(key, ("le", _format_value(upper)))
+                            lines.append(f"{full}_bucket{le} {_format_value(count)}")
+                        le_inf = _format_labels(key, ("le", "+Inf"))
+                        lines.append(f"{full}_bucket{le_inf} {_format_value(h[-1])}")
+                        lines.append(f"{full}_sum{_format_labels(key)} {_format_value(h[-2])}")
+                        lines.append(f"{full}_count{_format_labels(key)} {_format_value(h[-1])}")
+                else:
+                    for key, value in sorted(self._values.get(name, {}).items()):
+                        lines.append(f"{full}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Atomically write the current metrics (node_exporter textfile collector format)."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int, host: str = "0.0.0.0"):
+        """Serve /metrics on a daemon thread for the lifetime of the process."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+        thread.start()
+        self._server = server
+        return server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -4,23 +4,41 @@ import time
 import base64
 import mimetypes
 import pathlib
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from PIL import Image
-from google import genai
+
+import export_pages
+from genai_backend import ClientPool, make_client, resolve_api_keys, resolve_backend
+from languages import check_prompts, language_profile, localize_prompt
+import output_index
+import page_sources
+import page_triage
 
 # =========================================
 # Configuration
 # =========================================
 BASE_DIR = pathlib.Path(__file__).resolve().parent
-INPUT_DIR = str(BASE_DIR / "manga")        # Original manga images
+INPUT_DIR = str(BASE_DIR / "manga")        # Original manga images (folder or .cbz/.zip/.tar archive)
 FINAL_DIR = str(BASE_DIR / "manga_out")    # Folder to collect best images
 OUT_PREFIX = "out"                         # out1, out2, out3, ...
+FINAL_RENDER_DIR_NAME = "out_final"        # High-resolution renders from allloopv3.py progressive mode (used as-is when present)
 BATCH_SIZE = 1000                             # How many pages to compare per ranking batch
 BEST_LOG_PATH = str(BASE_DIR / "manga_best_k.tsv")
+TARGET_LANGS = ["Korean"]                  # Same list as allloopv3.py; several = select per language tree (BASE_DIR/<code>/)
+
+# Export (optional): package the selected pages as a volume while they are being selected
+EXPORT_FORMATS: List[str] = []             # e.g. ["cbz"] or ["cbz", "pdf"]; [] = no export
+EXPORT_DIR = str(BASE_DIR / "export")      # <EXPORT_DIR>/<name>.cbz / .pdf (+ <name>.pages.tsv manifest)
+EXPORT_NAME = ""                           # "" = name of INPUT_DIR (archive extension dropped); "-<code>" is added per language
+EXPORT_PDF_DPI = 150                       # Pixel density used for the PDF page size
 
 API_KEY = ""  # or use GEMINI_API_KEY / GOOGLE_API_KEY from env
+API_KEYS: List[str] = []  # Several keys (one per project): ranking batches are spread over them; or GEMINI_API_KEYS="key1,key2"
+GENAI_BACKEND = ""  # "" = MANGA_GENAI_BACKEND env or "genai"; "fake" = offline deterministic backend
 MAX_RANK_RETRIES = 3                       # How many times to retry ranking when model / k값 문제가 있을 때
+POLL_INTERVAL_SEC = 10                     # Poll interval for ranking batch jobs (sec)
+RETRY_BACKOFF_SEC = 5                      # Pause before retrying a failed ranking batch (sec)
 
 # =========================================
 # Helpers
@@ -42,7 +60,10 @@ def normalized_base_from_filename(filename: str) -> str:
 
 
 def list_images(folder: str) -> List[str]:
+    """Page names in a folder, or member names when `folder` is a CBZ/ZIP/tar archive."""
     exts = {".png", ".jpg", ".jpeg", ".webp"}
+    if page_sources.is_archive(folder):
+        return sorted(page_sources.list_pages(folder), key=natural_key)
     try:
         files = [f for f in os.listdir(folder) if pathlib.Path(f).suffix.lower() in exts]
     except FileNotFoundError:
@@ -52,8 +73,7 @@ def list_images(folder: str) -> List[str]:
 
 def image_part_dict(path: str) -> Dict[str, Any]:
     mt = mimetypes.guess_type(path)[0] or "image/png"
-    with open(path, "rb") as f:
-        raw = f.read()
+    raw = page_sources.read_bytes(path)
     b64 = base64.b64encode(raw).decode("ascii")
     return {"inline_data": {"mime_type": mt, "data": b64}}
 
@@ -107,7 +127,7 @@ Priority 2: Forbid true vertical Korean writing.
 
 Priority 3: Translation and guideline quality.
 - Prefer candidates where:
-  - all visible Japanese or English text has been translated into natural Korean,
+  - all visible {source_langs} text has been translated into natural Korean,
   - Korean is placed inside the correct bubbles and text areas,
   - the overall panel layout and artwork are preserved as closely as possible,
   - sound effects (SFX) are localized into natural Korean where appropriate,
@@ -157,29 +177,33 @@ def try_parse_best_index(text: str, num_candidates: int) -> Optional[int]:
     return None
 
 
-def ensure_best_log_header():
+def ensure_best_log_header(path: Optional[str] = None):
     """
-    Ensure BEST_LOG_PATH exists and has a header line.
+    Ensure the best log (default BEST_LOG_PATH) exists and has a header line.
     """
-    if not os.path.isfile(BEST_LOG_PATH):
-        with open(BEST_LOG_PATH, "w", encoding="utf-8") as f:
+    path = path or BEST_LOG_PATH
+    if not os.path.isfile(path):
+        with open(path, "w", encoding="utf-8") as f:
             f.write("base_name\tbest_index\tcandidate_folder\tcandidate_filename\n")
 
 
 # =========================================
 # Folder helpers
 # =========================================
-def find_out_folders() -> List[str]:
+def find_out_folders(root: Optional[str] = None) -> List[str]:
     """
-    Find all outN folders (out1, out2, ...) under BASE_DIR and return their paths sorted by N.
+    Find all outN folders (out1, out2, ...) under root (default BASE_DIR) and return their paths sorted by N.
     """
+    root = root or str(BASE_DIR)
     folders = []
-    for name in os.listdir(BASE_DIR):
+    if not os.path.isdir(root):
+        return []
+    for name in os.listdir(root):
         m = re.fullmatch(rf"{OUT_PREFIX}(\d+)", name)
         if not m:
             continue
         num = int(m.group(1))
-        path = os.path.join(BASE_DIR, name)
+        path = os.path.join(root, name)
         if os.path.isdir(path):
             folders.append((num, path))
     folders.sort(key=lambda x: x[0])
@@ -200,30 +224,60 @@ def build_folder_index(folder: str) -> Dict[str, str]:
 # =========================================
 # Main logic
 # =========================================
-def main():
-    # API key
-    api_key = API_KEY or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY") or ""
-    if not api_key:
-        raise RuntimeError("API key not found. Set API_KEY or GEMINI_API_KEY/GOOGLE_API_KEY.")
-
-    # Input check
-    if not os.path.isdir(INPUT_DIR):
-        raise RuntimeError(f"Input directory not found: {INPUT_DIR}")
-    orig_files = list_images(INPUT_DIR)
-    if not orig_files:
-        raise RuntimeError(f"No images found in input directory: {INPUT_DIR}")
-
-    base_to_orig: Dict[str, str] = {}
-    for img in orig_files:
-        base = normalized_base_from_filename(img)
-        base_to_orig[base] = os.path.join(INPUT_DIR, img)
-    all_bases = sorted(base_to_orig.keys(), key=natural_key)
-    print(f"Found {len(all_bases)} base page(s) in {INPUT_DIR}.")
+def selection_trees() -> List[Dict[str, str]]:
+    """
+    One tree with the classic layout for a single target language, otherwise one tree
+    per language under BASE_DIR/<code>/ (the layout allloopv3.py writes).
+    """
+    langs = [lang for lang in TARGET_LANGS if lang] or ["Korean"]
+    input_name = os.path.basename(os.path.normpath(INPUT_DIR))
+    export_name = EXPORT_NAME or input_name[: len(input_name) - len(page_sources.archive_suffix(input_name))]
+    if len(langs) == 1:
+        return [
+            {
+                "lang": langs[0],
+                "root": str(BASE_DIR),
+                "final_dir": FINAL_DIR,
+                "best_log": BEST_LOG_PATH,
+                "export_name": export_name,
+            }
+        ]
+    trees = []
+    for lang in langs:
+        code = language_profile(lang)["code"]
+        root = os.path.join(BASE_DIR, code)
+        trees.append(
+            {
+                "lang": lang,
+                "root": root,
+                "final_dir": os.path.join(root, os.path.basename(FINAL_DIR)),
+                "best_log": os.path.join(root, os.path.basename(BEST_LOG_PATH)),
+                "export_name": f"{export_name}-{code}",
+            }
+        )
+    return trees
+
+
+def select_for_tree(
+    tree: Dict[str, str],
+    all_bases: List[str],
+    base_to_orig: Dict[str, str],
+    client_text,
+):
+    """
+    Rank every page of one output tree (its out1, out2, ... folders) and collect the best
+    candidates into that tree's final folder.
+    """
+    root = tree["root"]
+    final_dir = tree["final_dir"]
+    best_log_path = tree["best_log"]
+    rank_prompt = localize_prompt(RANK_PROMPT, tree["lang"])
+    check_prompts({"rank_prompt": rank_prompt}, tree["lang"])
 
     # Find outN folders
-    out_folders = find_out_folders()
+    out_folders = find_out_folders(root)
     if not out_folders:
-        raise RuntimeError("No outN folders found (e.g., out1, out2, out3...). Nothing to compare.")
+        raise RuntimeError(f"No outN folders found in {root} (e.g., out1, out2, out3...). Nothing to compare.")
     print("Detected output folders (in order):")
     for f in out_folders:
         print(" -", os.path.basename(f))
@@ -236,23 +290,53 @@ def main():
         print(f"Folder {os.path.basename(f)} has {len(idx)} image(s).")
 
     # Prepare final folder
-    os.makedirs(FINAL_DIR, exist_ok=True)
+    os.makedirs(final_dir, exist_ok=True)
+
+    # Export: pages go into the CBZ/PDF in order as soon as they (and all pages before them) are selected
+    exporter = export_pages.VolumeExporter(
+        [(base, os.path.join(final_dir, f"{base}.jpg")) for base in all_bases],
+        os.path.join(EXPORT_DIR, tree["export_name"]),
+        EXPORT_FORMATS,
+        EXPORT_PDF_DPI,
+    )
 
     # Ensure BEST log header
-    ensure_best_log_header()
+    ensure_best_log_header(best_log_path)
 
-    # Init client
-    client_text = genai.Client(api_key=api_key, http_options={"api_version": "v1alpha"})
+    # Pages with a final high-resolution render (progressive mode) passed evaluation: no ranking needed
+    final_index = build_folder_index(os.path.join(root, FINAL_RENDER_DIR_NAME))
+    if final_index:
+        print(f"Folder {FINAL_RENDER_DIR_NAME} has {len(final_index)} final render(s); using them as-is.")
+
+    # Duplicate scans (allloopv3.py page triage) take their twin's pick instead of being ranked again
+    twins = page_triage.duplicate_twins(page_triage.load_triage(page_triage.triage_path(str(BASE_DIR))))
+    twins = {base: twin for base, twin in twins.items() if base in all_bases and twin in all_bases}
 
     # Collect bases that need model ranking (>=2 candidates)
     bases_need_rank = []
     base_to_candidates: Dict[str, List[str]] = {}
 
     for base in all_bases:
+        if base in twins:
+            continue
+        if base in final_index:
+            src = final_index[base]
+            dst = os.path.join(final_dir, f"{base}.jpg")
+            try:
+                img = Image.open(src).convert("RGB")
+                output_index.save_image(img, dst, format="JPEG", quality=95)
+                print(f"[FINAL] {base}: copied final render to {os.path.basename(final_dir)}.")
+                with open(best_log_path, "a", encoding="utf-8") as lf:
+                    lf.write(f"{base}\t1\t{FINAL_RENDER_DIR_NAME}\t{os.path.basename(src)}\n")
+                exporter.page_ready(base)
+                continue
+            except Exception as e:
+                print(f"[WARN] Failed to copy final render for {base}, ranking drafts instead: {e}")
+
         candidates: List[str] = []
         for idx in folder_indices:
             path = idx.get(base)
-            if path and os.path.isfile(path):
+            if path and output_index.is_intact(path):
                 candidates.append(path)
         if not candidates:
             print(f"[WARN] No candidates found for base {base}. Skipping.")
@@ -261,16 +345,17 @@ def main():
         if len(candidates) == 1:
             # Single candidate: just copy it as the best
             src = candidates[0]
-            dst = os.path.join(FINAL_DIR, f"{base}.jpg")
+            dst = os.path.join(final_dir, f"{base}.jpg")
             try:
                 img = Image.open(src).convert("RGB")
-                img.save(dst, format="JPEG", quality=95)
+                output_index.save_image(img, dst, format="JPEG", quality=95)
                 print(f"[COPY-ONLY] {base}: only 1 candidate, copied to manga_out.")
 
                 cand_folder = os.path.basename(os.path.dirname(src))
                 cand_file = os.path.basename(src)
-                with open(BEST_LOG_PATH, "a", encoding="utf-8") as lf:
+                with open(best_log_path, "a", encoding="utf-8") as lf:
                     lf.write(f"{base}\t1\t{cand_folder}\t{cand_file}\n")
+                exporter.page_ready(base)
             except Exception as e:
                 print(f"[WARN] Failed to copy-only {base}: {e}")
             continue
@@ -307,7 +392,7 @@ def main():
                     {
                         "role": "user",
                         "parts": [
-                            {"text": RANK_PROMPT},
+                            {"text": rank_prompt},
                             {"text": "<ORIGINAL_IMAGE>"},
                             image_part_dict(orig_path),
                             {"text": "</ORIGINAL_IMAGE>"},
@@ -340,7 +425,7 @@ def main():
                 )
             except Exception as e:
                 print(f"[ERROR] Failed to create ranking batch (attempt {attempt}): {e}")
-                time.sleep(5)
+                time.sleep(RETRY_BACKOFF_SEC)
                 continue
 
             # Poll
@@ -357,18 +442,18 @@ def main():
                     job_done = status
                     break
                 print(f"  - Ranking batch status: {state} (polling...)")
-                time.sleep(10)
+                time.sleep(POLL_INTERVAL_SEC)
 
             if not job_done or job_done.state.name != "JOB_STATE_SUCCEEDED":
                 err_state = job_done.state.name if job_done else "Unknown"
                 print(f"[ERROR] Ranking batch ended with state: {err_state}")
-                time.sleep(5)
+                time.sleep(RETRY_BACKOFF_SEC)
                 continue
 
             inline_responses = (job_done.dest.inlined_responses or []) if job_done.dest else []
             if not inline_responses:
                 print("[WARN] No inline responses from ranking batch.")
-                time.sleep(5)
+                time.sleep(RETRY_BACKOFF_SEC)
                 continue
 
             # Process responses
@@ -411,40 +496,114 @@ def main():
 
             best_idx = max(1, min(best_idx, len(candidates)))
             best_path = candidates[best_idx - 1]
-            dst = os.path.join(FINAL_DIR, f"{base}.jpg")
+            dst = os.path.join(final_dir, f"{base}.jpg")
 
             try:
                 img = Image.open(best_path).convert("RGB")
-                img.save(dst, format="JPEG", quality=95)
+                output_index.save_image(img, dst, format="JPEG", quality=95)
                 print(f"[BEST] {base}: selected candidate #{best_idx} from {os.path.dirname(best_path)}")
 
                 cand_folder = os.path.basename(os.path.dirname(best_path))
                 cand_file = os.path.basename(best_path)
-                with open(BEST_LOG_PATH, "a", encoding="utf-8") as lf:
+                with open(best_log_path, "a", encoding="utf-8") as lf:
                     lf.write(f"{base}\t{best_idx}\t{cand_folder}\t{cand_file}\n")
+                exporter.page_ready(base)
             except Exception as e:
                 print(f"[WARN] Failed to save best for {base}: {e}")
                 # Last fallback: try first candidate
                 try:
                     img = Image.open(candidates[0]).convert("RGB")
-                    img.save(dst, format="JPEG", quality=95)
+                    output_index.save_image(img, dst, format="JPEG", quality=95)
                     print(f"[FALLBACK-FIRST] {base}: saved first candidate.")
 
                     cand_folder = os.path.basename(os.path.dirname(candidates[0]))
                     cand_file = os.path.basename(candidates[0])
-                    with open(BEST_LOG_PATH, "a", encoding="utf-8") as lf:
+                    with open(best_log_path, "a", encoding="utf-8") as lf:
                         lf.write(f"{base}\t1\t{cand_folder}\t{cand_file}\n")
+                    exporter.page_ready(base)
                 except Exception as e2:
                     print(f"[WARN] Fallback failed for {base}: {e2}")
 
+    for base, twin in twins.items():
+        src = os.path.join(final_dir, f"{twin}.jpg")
+        if not os.path.isfile(src):
+            print(f"[WARN] {base}: twin {twin} has no selected image; skipping duplicate.")
+            continue
+        try:
+            output_index.copy_image(src, os.path.join(final_dir, f"{base}.jpg"))
+            print(f"[DUPLICATE] {base}: same page as {twin}, copied its selection.")
+            with open(best_log_path, "a", encoding="utf-8") as lf:
+                lf.write(f"{base}\t1\t{os.path.basename(final_dir)}\t{twin}.jpg\n")
+            exporter.page_ready(base)
+        except Exception as e:
+            print(f"[WARN] Failed to copy twin selection for {base}: {e}")
+
+    exporter.finish()
+
+    print(f"\nDone. Best images collected into: {final_dir}")
+    print(f"Best index log written to: {best_log_path}")
+
+
+def input_pages() -> Tuple[List[str], Dict[str, str]]:
+    """(base names in reading order, base -> original page) of INPUT_DIR."""
+    if not os.path.isdir(INPUT_DIR) and not page_sources.is_archive(INPUT_DIR):
+        raise RuntimeError(f"Input directory not found: {INPUT_DIR}")
+    orig_files = list_images(INPUT_DIR)
+    if not orig_files:
+        raise RuntimeError(f"No images found in input directory: {INPUT_DIR}")
+
+    base_to_orig: Dict[str, str] = {}
+    for img in orig_files:
+        base = normalized_base_from_filename(img)
+        base_to_orig[base] = page_sources.page_path(INPUT_DIR, img)
+    all_bases = sorted(base_to_orig.keys(), key=natural_key)
+    print(f"Found {len(all_bases)} base page(s) in {INPUT_DIR}.")
+    return all_bases, base_to_orig
+
+
+def export_selected():
+    """Package the pages already in each tree's final folder as EXPORT_FORMATS, without ranking anything."""
+    if not EXPORT_FORMATS:
+        raise RuntimeError("EXPORT_FORMATS is empty; nothing to export.")
+    all_bases, _ = input_pages()
+    for tree in selection_trees():
+        final_dir = tree["final_dir"]
+        if not os.path.isdir(final_dir):
+            print(f"[WARN] {final_dir} does not exist yet; run the selection first.")
+            continue
+        exporter = export_pages.VolumeExporter(
+            [(base, os.path.join(final_dir, f"{base}.jpg")) for base in all_bases],
+            os.path.join(EXPORT_DIR, tree["export_name"]),
+            EXPORT_FORMATS,
+            EXPORT_PDF_DPI,
+        )
+        exporter.finish()
+
+
+def main():
+    # API key
+    api_keys = resolve_api_keys(API_KEY, API_KEYS)
+    if not api_keys and resolve_backend(GENAI_BACKEND) != "fake":
+        raise RuntimeError("API key not found. Set API_KEY or GEMINI_API_KEY/GOOGLE_API_KEY.")
+
+    # Input check
+    all_bases, base_to_orig = input_pages()
+
+    # Init client
+    client_text = make_client(api_keys, backend=GENAI_BACKEND, http_options={"api_version": "v1alpha"})
+
+    for tree in selection_trees():
+        if tree["root"] != str(BASE_DIR):
+            print(f"\n=== Selecting best outputs for {tree['lang']} ({tree['root']}) ===")
+        select_for_tree(tree, all_bases, base_to_orig, client_text)
+
+    if isinstance(client_text, ClientPool):
+        print(f"[INFO] Key pool: {client_text.summary()}")
     try:
         client_text.close()
     except Exception:
         pass
 
-    print(f"\nDone. Best images collected into: {FINAL_DIR}")
-    print(f"Best index log written to: {BEST_LOG_PATH}")
-
 
 if __name__ == "__main__":
     main()
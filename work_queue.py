@@ -0,0 +1,266 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+# =========================================
+# Shared page work queue (SQLite, stdlib only)
+# =========================================
+# Used by allloopv3.py when WORK_QUEUE is set: every worker pointed at the same queue file
+# (on a filesystem all machines mount) claims pages in shards under a lease, renews the lease
+# while it works and marks each page done when its loop finished. A page is leased to one
+# worker at a time, so no two workers pay for the same page; pages of a worker that died are
+# handed out again once their lease expires, and resume from whatever is already in outN/scripts.
+#
+# The database uses the rollback journal (not WAL), which also works on network filesystems
+# that honour POSIX locks; every transaction is short and retried while the file is locked.
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"   # claimed WORK_QUEUE_MAX_ATTEMPTS times without finishing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    seq INTEGER NOT NULL,
+    owner TEXT,
+    token TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (state, priority, seq);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(
+        self,
+        path: str,
+        worker_id: Optional[str] = None,
+        lease_sec: float = 1800.0,
+        max_attempts: int = 3,
+        busy_timeout_sec: float = 60.0,
+    ):
+        self.path = path
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_sec = lease_sec
+        self.max_attempts = max_attempts
+        self.busy_timeout_sec = busy_timeout_sec
+        self._tokens: Dict[str, str] = {}  # key -> lease token of this worker's current claims
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_sec, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        return conn
+
+    def _write(self, fn):
+        """Run fn(conn) inside one immediate (write-locked) transaction."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    result = fn(conn)
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+                return result
+            finally:
+                conn.close()
+
+    def add_tasks(self, keys: List[str], priorities: Optional[Dict[str, float]] = None) -> int:
+        """Queue pages that are not in the queue yet (known pages keep their state). Returns how many were added."""
+
+        def add(conn: sqlite3.Connection) -> int:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM tasks").fetchone()[0]
+            added = 0
+            now = time.time()
+            for key in keys:
+                seq += 1
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO tasks (key, state, priority, seq, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, PENDING, (priorities or {}).get(key, 0.0), seq, now),
+                )
+                added += cur.rowcount
+            return added
+
+        return self._write(add)
+
+    def claim(self, limit: int, only: Optional[Set[str]] = None) -> List[str]:
+        """
+        Lease up to `limit` pending pages (or pages whose lease expired), lowest priority value first.
+        `only` restricts the claim to pages this worker can process (others stay queued).
+        """
+
+        def take(conn: sqlite3.Connection) -> Tuple[List[str], str]:
+            now = time.time()
+            conn.execute(
+                "UPDATE tasks SET state = ?, owner = NULL, token = NULL, updated_at = ? "
+                "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts),
+            )
+            cur = conn.execute(
+                "SELECT key FROM tasks WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY priority, seq",
+                (PENDING, LEASED, now),
+            )
+            rows: List[str] = []
+            for (key,) in cur:
+                if only is None or key in only:
+                    rows.append(key)
+                    if len(rows) >= max(1, limit):
+                        break
+            cur.close()
+            token = uuid.uuid4().hex
+            for key in rows:
+                conn.execute(
+                    "UPDATE tasks SET state = ?, owner = ?, token = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE key = ?",
+                    (LEASED, self.worker_id, token, now + self.lease_sec, now, key),
+                )
+            return rows, token
+
+        keys, token = self._write(take)
+        for key in keys:
+            self._tokens[key] = token
+        return keys
+
+    def heartbeat(self, keys: List[str]) -> List[str]:
+        """Extend the lease of `keys`; returns the ones this worker no longer holds."""
+
+        def renew(conn: sqlite3.Connection) -> List[str]:
+            now = time.time()
+            lost = []
+            for key in keys:
+                cur = conn.execute(
+                    "UPDATE tasks SET lease_until = ?, updated_at = ? WHERE key = ? AND state = ? AND token = ?",
+                    (now + self.lease_sec, now, key, LEASED, self._tokens.get(key)),
+                )
+                if cur.rowcount == 0:
+                    lost.append(key)
+            return lost
+
+        return self._write(renew)
+
+    def complete(self, key: str, result: str) -> bool:
+        """Mark a leased page done. Idempotent; False if another worker holds (or finished) it meanwhile."""
+
+        def finish(conn: sqlite3.Connection) -> bool:
+            token = self._tokens.get(key)
+            cur = conn.execute(
+                "UPDATE tasks SET state = ?, result = ?, lease_until = NULL, updated_at = ? "
+                "WHERE key = ? AND token = ? AND state IN (?, ?)",
+                (DONE, result, time.time(), key, token, LEASED, DONE),
+            )
+            return cur.rowcount > 0
+
+        done = self._write(finish)
+        self._tokens.pop(key, None)
+        return done
+
+    def release(self, keys: List[str]):
+        """Hand still-leased pages back (clean stop); the claim does not count as an attempt."""
+
+        def give_back(conn: sqlite3.Connection):
+            for key in keys:
+                conn.execute(
+                    "UPDATE tasks SET state = ?, owner = NULL, token = NULL, lease_until = NULL, "
+                    "attempts = MAX(0, attempts - 1), updated_at = ? WHERE key = ? AND state = ? AND token = ?",
+                    (PENDING, time.time(), key, LEASED, self._tokens.get(key)),
+                )
+
+        self._write(give_back)
+        for key in keys:
+            self._tokens.pop(key, None)
+
+    def prioritize(self, priorities: Dict[str, float]):
+        """Update the priority of pages still waiting (e.g. after the configured order changed)."""
+
+        def reorder(conn: sqlite3.Connection):
+            now = time.time()
+            for key, priority in priorities.items():
+                conn.execute(
+                    "UPDATE tasks SET priority = ?, updated_at = ? WHERE key = ? AND state = ? AND priority != ?",
+                    (priority, now, key, PENDING, priority),
+                )
+
+        self._write(reorder)
+
+    def requeue(self, keys: List[str]) -> int:
+        """Make finished (or failed) pages pending again, e.g. after their source changed. Returns how many."""
+
+        def reopen(conn: sqlite3.Connection) -> int:
+            reopened = 0
+            now = time.time()
+            for key in keys:
+                cur = conn.execute(
+                    "UPDATE tasks SET state = ?, owner = NULL, token = NULL, lease_until = NULL, attempts = 0, "
+                    "result = NULL, updated_at = ? WHERE key = ? AND state IN (?, ?)",
+                    (PENDING, now, key, DONE, FAILED),
+                )
+                reopened += cur.rowcount
+            return reopened
+
+        return self._write(reopen)
+
+    def counts(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+        finally:
+            conn.close()
+
+
+class Heartbeat:
+    """Background thread that renews a claim every `interval_sec`; `lost` collects pages taken over."""
+
+    def __init__(self, queue: WorkQueue, keys: List[str], interval_sec: float):
+        self.queue = queue
+        self.keys = list(keys)
+        self.interval_sec = max(1.0, interval_sec)
+        self.lost: set = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="work-queue-heartbeat", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            active = [k for k in self.keys if k not in self.lost]
+            if not active:
+                continue
+            try:
+                lost = self.queue.heartbeat(active)
+            except Exception as e:
+                print(f"[WARN] Work queue heartbeat failed: {e}")
+                continue
+            for key in lost:
+                print(f"[QUEUE] Lease on {key} was lost; another worker owns it now.")
+            self.lost.update(lost)
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join(timeout=self.interval_sec)
+        return False